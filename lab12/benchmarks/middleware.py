@@ -0,0 +1,155 @@
+"""Requests per second through the middleware stack: BaseHTTPMiddleware vs pure ASGI.
+
+Run from lab12/:  PYTHONPATH=src python -m benchmarks.middleware [--requests 5000] [--concurrency 32]
+
+Builds the app with `create_app()` twice: with the current pure-ASGI
+`RateLimitMiddleware` and `IdempotencyMiddleware`, and with their previous
+`BaseHTTPMiddleware` versions (kept below). Requests are ASGI calls made directly
+on the app, with no server or sockets, so the numbers show the app's own cost per
+request. `--concurrency` requests are in flight at a time. Endpoints: `GET /health`,
+`GET /api/v2/tasks/` (`--tasks` tasks), and POST /api/v2/projects/ with a new
+Idempotency-Key each time.
+"""
+import argparse
+import asyncio
+import os
+import time
+from functools import partial
+from typing import Callable, Dict, List, Tuple
+
+os.environ.setdefault("RATE_LIMIT_REQUESTS", "1000000000")
+
+from fastapi import Request  # noqa: E402
+from starlette.middleware import Middleware  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+from starlette.responses import JSONResponse, Response  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.state import StoredResponse, state  # noqa: E402
+from app.core.storage import db  # noqa: E402
+from main import create_app  # noqa: E402
+
+
+class BaseHTTPRateLimitMiddleware(BaseHTTPMiddleware):
+    # RateLimitMiddleware before the pure-ASGI rewrite
+    async def dispatch(self, request: Request, call_next: Callable):
+        identifier = request.headers.get("X-API-Key", request.client.host)
+        allowed, remaining, retry_after = state.hit(identifier)
+        if not allowed:
+            return Response(status_code=429, headers={"X-Limit-Remaining": "0"}, content=b"Too Many Requests")
+        response = await call_next(request)
+        response.headers["X-Limit-Remaining"] = str(remaining)
+        return response
+
+
+class BaseHTTPIdempotencyMiddleware(BaseHTTPMiddleware):
+    # IdempotencyMiddleware before the pure-ASGI rewrite
+    async def dispatch(self, request: Request, call_next):
+        key = request.headers.get(settings.idempotency_header)
+        if request.method != "POST" or not key:
+            return await call_next(request)
+        namespaced = f"{request.url.path}:{key}"
+        stored = state.claim(namespaced)
+        if stored is not None:
+            if stored.pending:
+                return JSONResponse({"detail": "in progress"}, status_code=409)
+            response = Response(stored.body, status_code=stored.status)
+            response.raw_headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored.headers]
+            return response
+        try:
+            response = await call_next(request)
+        except Exception:
+            state.release(namespaced)
+            raise
+        if response.status_code not in (200, 201):
+            state.release(namespaced)
+            return response
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in response.raw_headers]
+        state.complete(namespaced, StoredResponse(response.status_code, headers, body))
+        buffered = Response(body, status_code=response.status_code)
+        buffered.raw_headers = response.raw_headers
+        return buffered
+
+
+def build(stack: str):
+    app = create_app()
+    if stack == "BaseHTTP":
+        app.user_middleware = [Middleware(BaseHTTPRateLimitMiddleware), Middleware(BaseHTTPIdempotencyMiddleware)]
+    return app
+
+
+async def call(app, method: str, path: str, headers: List[Tuple[bytes, bytes]], body: bytes = b"") -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench"), *headers], "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+    status = 0
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def rps(app, requests: int, concurrency: int, request: Callable[[int], tuple]) -> float:
+    # requests per second with `concurrency` requests in flight
+    await call(app, *request(-1))  # builds the middleware stack
+    numbers = iter(range(requests))
+
+    async def client() -> None:
+        for i in numbers:
+            status = await call(app, *request(i))
+            assert status in (200, 201), status
+
+    started = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--tasks", type=int, default=20, help="tasks returned by GET /api/v2/tasks/")
+    args = parser.parse_args()
+
+    project = db.create_project("Bench")
+    for i in range(args.tasks):
+        db.create_task_v2(project.id, f"Task {i}", priority=i % 5)
+    auth = [(b"x-api-key", settings.default_api_key.encode())]
+    json = [*auth, (b"content-type", b"application/json")]
+    endpoints: Dict[str, Callable[[str, int], tuple]] = {
+        "GET /health": lambda stack, i: ("GET", "/health", auth),
+        "GET /api/v2/tasks/": lambda stack, i: ("GET", "/api/v2/tasks/", auth),
+        "POST /api/v2/projects/": lambda stack, i: (
+            "POST", "/api/v2/projects/", [*json, (b"idempotency-key", f"{stack}-{i}".encode())], b'{"name": "P"}'
+        ),
+    }
+
+    print(f"{args.requests} requests per endpoint, {args.concurrency} in flight, state backend {settings.state_backend}")
+    results = {stack: {} for stack in ("BaseHTTP", "ASGI")}
+    for stack in results:
+        app = build(stack)
+        for endpoint, request in endpoints.items():
+            results[stack][endpoint] = asyncio.run(rps(app, args.requests, args.concurrency, partial(request, stack)))
+    for endpoint in endpoints:
+        before, after = results["BaseHTTP"][endpoint], results["ASGI"][endpoint]
+        print(f"  {endpoint:<24} BaseHTTPMiddleware {before:7.0f} req/s   pure ASGI {after:7.0f} req/s   x{after / before:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Per-request cost and memory of the rate limiter at many distinct keys.
+
+Run from lab12/:  PYTHONPATH=src python -m benchmarks.rate_limit [--keys 100000] [--limit 60]
+
+Compares the sliding-window counter (`app.core.rate_limiter`) with the timestamp
+lists the middleware used before (each request rebuilt the key's list). Time is
+simulated, so a run takes seconds whatever the window. Scenarios:
+- spread: `--requests` hits on random keys, a few per key;
+- busy: every key already has limit-1 hits in the window (old lists at full length);
+- churn: two windows later the same number of new keys arrives; the counter drops
+  the idle keys as it goes, the old dict keeps every key ever seen.
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from typing import Dict, List
+
+from app.core.rate_limiter import SlidingWindowLimiter
+
+
+class ListLimiter:
+    # the previous RateLimitMiddleware algorithm, without the HTTP parts
+    def __init__(self, limit: int, window: float) -> None:
+        self.limit = limit
+        self.window = window
+        self.bucket: Dict[str, List[float]] = {}
+
+    def hit(self, key: str, now: float) -> bool:
+        timestamps = self.bucket.get(key, [])
+        timestamps = [ts for ts in timestamps if ts > now - self.window]
+        if len(timestamps) >= self.limit:
+            return False
+        timestamps.append(now)
+        self.bucket[key] = timestamps
+        return True
+
+    def __len__(self) -> int:
+        return len(self.bucket)
+
+
+def timed(limiter, keys: List[str], start: float, step: float) -> float:
+    # ns per hit over `keys`, the clock advancing by `step` per hit
+    hit = limiter.hit
+    now = start
+    started = time.perf_counter()
+    for key in keys:
+        hit(key, now)
+        now += step
+    return (time.perf_counter() - started) / len(keys) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=60)
+    parser.add_argument("--window", type=float, default=60.0)
+    args = parser.parse_args()
+
+    random.seed(1)
+    keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(args.keys)]
+    spread = random.choices(keys, k=args.requests)
+    busy = [key for key in keys for _ in range(args.limit - 1)]
+    random.shuffle(busy)
+    measured = random.choices(keys, k=args.requests)
+    newcomers = [f"172.16.{i >> 8 & 255}.{i & 255}-{i}" for i in range(args.keys)]
+    step = args.window / 10 / args.requests  # all of a scenario stays inside one window
+
+    print(f"{args.keys} keys, limit {args.limit} per {args.window:g}s")
+    for name, cls in (("lists", ListLimiter), ("counter", SlidingWindowLimiter)):
+        limiter = cls(args.limit, args.window)
+        spread_ns = timed(limiter, spread, 0.0, step)
+
+        limiter = cls(args.limit, args.window)
+        gc.collect()
+        tracemalloc.start()
+        timed(limiter, busy, 0.0, args.window / 10 / len(busy))
+        per_key = tracemalloc.get_traced_memory()[0] / len(limiter)
+        tracemalloc.stop()
+        busy_ns = timed(limiter, measured, args.window / 10, step)
+
+        churn_ns = timed(limiter, newcomers, args.window * 2.5, step)
+        print(
+            f"  {name:<8} spread {spread_ns:6.0f} ns/hit   busy {busy_ns:6.0f} ns/hit, {per_key:5.0f} bytes/key   "
+            f"churn {churn_ns:6.0f} ns/hit, {len(limiter)} keys kept"
+        )
+
+
+if __name__ == "__main__":
+    main()
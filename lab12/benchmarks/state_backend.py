@@ -0,0 +1,114 @@
+"""Shared state backends: per-request cost, and what N worker processes see together.
+
+Run from lab12/:  PYTHONPATH=src python -m benchmarks.state_backend [--workers 4] [--keys 10000]
+
+Compares `MemoryState` (dicts of the process) with `SqliteState` (one SQLite file
+for all processes, in a temporary directory). Reported:
+- cost: µs per rate-limit hit on `--keys` clients, per first POST with an
+  Idempotency-Key (claim + complete) and per repeat (claim returning the response);
+- workers: `--workers` processes, as under `uvicorn --workers N`, each send
+  `--hits` requests of one client (limit `--limit` per minute) and retry the same
+  `--retries` POSTs. Counted: requests let through in total (should be the limit)
+  and POSTs executed (should be one per key), and hits/s of all processes together.
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from typing import Dict, Tuple
+
+from app.core.state import MemoryState, SqliteState, StateBackend, StoredResponse
+
+RESPONSE = StoredResponse(201, [("content-type", "application/json"), ("x-resource-id", "1")], b'{"id": 1, "name": "x"}' * 4)
+
+
+def backend(name: str, path: str, limit: int) -> StateBackend:
+    if name == "memory":
+        return MemoryState(limit, 60.0)
+    return SqliteState(path, limit, 60.0)
+
+
+def cost(name: str, path: str, args: argparse.Namespace) -> Dict[str, float]:
+    state = backend(name, path, args.limit)
+    keys = [f"10.0.{i >> 8 & 255}.{i & 255}" for i in range(args.keys)]
+    hits = random.choices(keys, k=args.requests)
+    posts = [f"/api/v2/tasks/:key-{i}" for i in range(args.requests // 10)]
+
+    started = time.perf_counter()
+    for key in hits:
+        state.hit(key)
+    hit_us = (time.perf_counter() - started) / len(hits) * 1e6
+
+    started = time.perf_counter()
+    for key in posts:
+        state.claim(key)
+        state.complete(key, RESPONSE)
+    first_us = (time.perf_counter() - started) / len(posts) * 1e6
+
+    started = time.perf_counter()
+    for key in posts:
+        state.claim(key)
+    repeat_us = (time.perf_counter() - started) / len(posts) * 1e6
+    return {"hit": hit_us, "first": first_us, "repeat": repeat_us}
+
+
+def worker(name: str, path: str, args: argparse.Namespace, start: float) -> Tuple[int, int, float]:
+    # one `uvicorn --workers` process: (requests allowed, POSTs executed, seconds spent on hits)
+    state = backend(name, path, args.limit)
+    state.hit("warm-up")
+    while time.time() < start:
+        time.sleep(0.001)
+    started = time.perf_counter()
+    allowed = sum(state.hit("one-client")[0] for _ in range(args.hits))
+    elapsed = time.perf_counter() - started
+    executed = 0
+    for i in range(args.retries):
+        if state.claim(f"/api/v2/tasks/:retry-{i}") is None:
+            executed += 1
+            state.complete(f"/api/v2/tasks/:retry-{i}", RESPONSE)
+    return allowed, executed, elapsed
+
+
+def workers(name: str, path: str, args: argparse.Namespace) -> Dict[str, float]:
+    start = time.time() + 1.0
+    with multiprocessing.get_context("spawn").Pool(args.workers) as pool:
+        results = pool.starmap(worker, [(name, path, args, start)] * args.workers)
+    return {
+        "allowed": sum(r[0] for r in results),
+        "executed": sum(r[1] for r in results),
+        "hits_per_s": args.hits * args.workers / max(r[2] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--limit", type=int, default=1000, help="requests per minute and client")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--hits", type=int, default=20_000, help="requests per worker")
+    parser.add_argument("--retries", type=int, default=500, help="POSTs every worker sends with the same keys")
+    args = parser.parse_args()
+
+    random.seed(1)
+    directory = tempfile.mkdtemp()
+    print(
+        f"{args.keys} clients; {args.workers} workers x {args.hits} requests of one client "
+        f"(limit {args.limit}/min) and the same {args.retries} POSTs"
+    )
+    for name in ("memory", "sqlite"):
+        path = os.path.join(directory, f"{name}-cost.sqlite3")
+        single = cost(name, path, args)
+        shared = workers(name, os.path.join(directory, f"{name}-workers.sqlite3"), args)
+        print(
+            f"  {name:<7} hit {single['hit']:5.1f} µs   first POST {single['first']:5.1f} µs   "
+            f"repeat {single['repeat']:5.1f} µs   |   {args.workers} workers: allowed {shared['allowed']:.0f} "
+            f"(limit {args.limit}), POSTs executed {shared['executed']:.0f} (of {args.retries}), "
+            f"{shared['hits_per_s']:8.0f} hits/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 from typing import Optional
-from fastapi import APIRouter, HTTPException, Query, Request, Response, Header
+from fastapi import APIRouter, HTTPException, Query, Response
 from app.core.storage import db
 from app.schemas.task import TaskCreateV1, TaskUpdateV1, TaskOutV1
 
@@ -8,18 +8,11 @@ router = APIRouter(prefix="/tasks", tags=["tasks v1"])
 
 
 @router.post("/", response_model=TaskOutV1, status_code=201)
-def create_task(payload: TaskCreateV1, request: Request, response: Response, idempotency_key: str | None = Header(default=None, alias="Idempotency-Key")):
+def create_task(payload: TaskCreateV1, response: Response):
     if payload.project_id not in db.projects:
         raise HTTPException(status_code=404, detail="Project not found")
-    if idempotency_key:
-        k = f"{request.url.path}:{idempotency_key}"
-        existing_id = db.idempotency.get(k)
-        if existing_id is not None and existing_id in db.tasks:
-            return db.tasks[existing_id]
     task = db.create_task(project_id=payload.project_id, title=payload.title, completed=payload.completed)
     response.headers["X-Resource-Id"] = str(task.id)
-    if idempotency_key:
-        db.idempotency[f"{request.url.path}:{idempotency_key}"] = task.id
     return task
 
 
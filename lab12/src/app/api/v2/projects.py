@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Request, Response, Header
+from fastapi import APIRouter, HTTPException, Response
 from app.core.storage import db
 from app.schemas.project import ProjectCreate, ProjectUpdate, ProjectOut
 
@@ -7,16 +7,9 @@ router = APIRouter(prefix="/projects", tags=["projects v2"])
 
 
 @router.post("/", response_model=ProjectOut, status_code=201)
-def create_project(payload: ProjectCreate, request: Request, response: Response, idempotency_key: str | None = Header(default=None, alias="Idempotency-Key")):
-    if idempotency_key:
-        k = f"{request.url.path}:{idempotency_key}"
-        existing_id = db.idempotency.get(k)
-        if existing_id is not None and existing_id in db.projects:
-            return db.projects[existing_id]
+def create_project(payload: ProjectCreate, response: Response):
     project = db.create_project(name=payload.name, description=payload.description or "")
     response.headers["X-Resource-Id"] = str(project.id)
-    if idempotency_key:
-        db.idempotency[f"{request.url.path}:{idempotency_key}"] = project.id
     return project
 
 
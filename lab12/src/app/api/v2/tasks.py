@@ -1,5 +1,5 @@
 from typing import Optional
-from fastapi import APIRouter, HTTPException, Query, Request, Response, Header
+from fastapi import APIRouter, HTTPException, Query, Response
 from app.core.storage import db
 from app.schemas.task import TaskCreateV2, TaskUpdateV2, TaskOutV2
 
@@ -8,16 +8,11 @@ router = APIRouter(prefix="/tasks", tags=["tasks v2"])
 
 
 @router.post("/", response_model=TaskOutV2, status_code=201)
-def create_task(payload: TaskCreateV2, request: Request, response: Response, idempotency_key: str | None = Header(default=None, alias="Idempotency-Key")):
+def create_task(payload: TaskCreateV2, response: Response):
     if payload.project_id not in db.projects:
         raise HTTPException(status_code=404, detail="Project not found")
     if payload.user_id is not None and payload.user_id not in db.users:
         raise HTTPException(status_code=404, detail="User not found")
-    if idempotency_key:
-        k = f"{request.url.path}:{idempotency_key}"
-        existing_id = db.idempotency.get(k)
-        if existing_id is not None and existing_id in db.tasks:
-            return db.tasks[existing_id]
     task = db.create_task_v2(
         project_id=payload.project_id,
         title=payload.title,
@@ -26,8 +21,6 @@ def create_task(payload: TaskCreateV2, request: Request, response: Response, ide
         user_id=payload.user_id,
     )
     response.headers["X-Resource-Id"] = str(task.id)
-    if idempotency_key:
-        db.idempotency[f"{request.url.path}:{idempotency_key}"] = task.id
     return task
 
 
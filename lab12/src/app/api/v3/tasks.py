@@ -1,13 +1,15 @@
+from dataclasses import asdict
 from typing import Optional
 from fastapi import APIRouter, HTTPException, Query
 from app.core.storage import db
-from app.schemas.task import TaskOutV3, TaskOutV3WithUser
+from app.schemas.task import TaskOutV3WithUser
 
 
 router = APIRouter(prefix="/tasks", tags=["tasks v3"])
 
 
-@router.get("/", response_model=list[TaskOutV3])
+# Rows have no `user` attribute, so it stays unset and is left out unless include=user set it
+@router.get("/", response_model=list[TaskOutV3WithUser], response_model_exclude_unset=True)
 def list_tasks(
     project_id: Optional[int] = Query(default=None),
     completed: Optional[bool] = Query(default=None),
@@ -39,7 +41,7 @@ def list_tasks(
             enriched: list[TaskOutV3WithUser] = []
             for t in tasks:
                 u = db.users.get(t.user_id) if t.user_id is not None else None
-                enriched.append(TaskOutV3WithUser(**t.__dict__, user=u))
+                enriched.append(TaskOutV3WithUser(**asdict(t), user=u))
             return enriched
     return tasks
 
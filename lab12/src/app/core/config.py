@@ -9,7 +9,16 @@ class Settings(BaseModel):
     default_api_key: str = os.environ.get("API_KEY", "dev-secret-key")
     rate_limit_requests: int = int(os.environ.get("RATE_LIMIT_REQUESTS", "60"))
     rate_limit_window_seconds: int = int(os.environ.get("RATE_LIMIT_WINDOW", "60"))
+    # clients tracked by the limiter at most; the least recently seen are forgotten first
+    rate_limit_max_keys: int = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "1000000"))
     idempotency_header: str = "Idempotency-Key"
+    # stored responses are replayed for this long; an unfinished first request holds its key at most this long
+    idempotency_ttl_seconds: int = int(os.environ.get("IDEMPOTENCY_TTL", "86400"))
+    idempotency_lock_seconds: int = int(os.environ.get("IDEMPOTENCY_LOCK_TIMEOUT", "30"))
+    # where the rate-limit counters and idempotent responses live: "memory" (this process)
+    # or "sqlite" (the STATE_PATH file, shared by all workers that use it)
+    state_backend: str = os.environ.get("STATE_BACKEND", "memory")
+    state_path: str = os.environ.get("STATE_PATH", "state.sqlite3")
     internal_token_header: str = "X-Internal-Token"
     internal_token_default: str = os.environ.get("INTERNAL_TOKEN", "dev-internal")
 
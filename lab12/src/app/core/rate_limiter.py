@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+
+def retry_after(limit: int, window: float, previous: int, current: int, offset: float) -> float:
+    # seconds until the estimate lets one more request in, `offset` seconds into the current window
+    if current + 1 <= limit:
+        # later in this window the previous window weighs little enough
+        return window * (1 - (limit - current - 1) / previous) - offset
+    # in the next window the current count becomes the previous one
+    wait = window * (1 - (limit - 1) / current) if current > 1 else 0.0
+    return window - offset + max(wait, 0.0)
+
+
+class SlidingWindowLimiter:
+    """Sliding-window-counter rate limiter: O(1) time and fixed memory per key.
+
+    A key keeps only the request counts of the current and the previous fixed window.
+    The number of requests in the last `window` seconds is estimated as
+    `previous * (part of the previous window still inside the sliding window) + current`,
+    which assumes the previous window's requests were spread evenly.
+
+    Keys are kept in least-recently-used order. Adding a key first drops keys idle for
+    a full window (their estimate is 0 anyway), and the oldest keys beyond `max_keys`.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 0) -> None:
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys  # 0 = no cap
+        self.evicted = 0
+        # key -> [window index, previous window count, current window count]
+        self._keys: OrderedDict[str, List[int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, int, float]:
+        # (allowed, requests left, seconds until a request would be allowed); counts allowed hits only
+        now = time.monotonic() if now is None else now
+        index = int(now // self.window)
+        offset = now - index * self.window
+        state = self._keys.get(key)
+        if state is None:
+            self._evict(index)
+            state = self._keys[key] = [index, 0, 0]
+        else:
+            self._keys.move_to_end(key)
+            if state[0] != index:
+                state[1] = state[2] if state[0] == index - 1 else 0
+                state[2] = 0
+                state[0] = index
+
+        estimate = state[1] * (1 - offset / self.window) + state[2]
+        if estimate + 1 > self.limit:
+            return False, 0, retry_after(self.limit, self.window, state[1], state[2], offset)
+        state[2] += 1
+        return True, int(self.limit - estimate - 1), 0.0
+
+    def _evict(self, index: int) -> None:
+        keys = self._keys
+        while keys:
+            key, state = next(iter(keys.items()))
+            if state[0] >= index - 1 and not (self.max_keys and len(keys) >= self.max_keys):
+                return
+            del keys[key]
+            self.evicted += 1
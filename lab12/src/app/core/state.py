@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+from abc import ABC, abstractmethod
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.rate_limiter import SlidingWindowLimiter, retry_after
+
+
+@dataclass(slots=True)
+class StoredResponse:
+    status: int  # 0 = the first request with this key is still running
+    headers: List[Tuple[str, str]] = field(default_factory=list)
+    body: bytes = b""
+    fingerprint: str = ""  # of the request that produced it, to refuse a key reused with another body
+
+    @property
+    def pending(self) -> bool:
+        return self.status == 0
+
+
+PENDING = StoredResponse(0)
+
+
+class StateBackend(ABC):
+    """State the middlewares share: rate-limit counters and idempotent responses.
+
+    `hit(key)` counts a request against the sliding-window limit, like
+    `SlidingWindowLimiter.hit`. An Idempotency-Key goes through `claim(key)`: None
+    means the caller owns the key and runs the request, then either `complete`s it
+    with the response to replay or `release`s it (failure, the key can be retried).
+    Otherwise `claim` returns the stored response, or `PENDING` while the owner runs.
+    Keys are opaque here: the middleware scopes them to the caller.
+    A claim not completed within `lock_timeout` seconds (crashed worker) can be taken
+    over; stored responses are forgotten after `ttl` seconds.
+    """
+
+    @abstractmethod
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, int, float]:
+        ...
+
+    @abstractmethod
+    def claim(self, key: str, now: Optional[float] = None) -> Optional[StoredResponse]:
+        ...
+
+    @abstractmethod
+    def complete(self, key: str, response: StoredResponse) -> None:
+        ...
+
+    @abstractmethod
+    def release(self, key: str) -> None:
+        ...
+
+
+class MemoryState(StateBackend):
+    """Dicts of this process: fastest, but every `uvicorn --workers` process has its own."""
+
+    def __init__(self, limit: int, window: float, max_keys: int = 0, ttl: float = 86400, lock_timeout: float = 30) -> None:
+        self.limiter = SlidingWindowLimiter(limit, window, max_keys=max_keys)
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        # key -> (claimed at, response or None while pending), oldest claim first
+        self.responses: OrderedDict[str, Tuple[float, Optional[StoredResponse]]] = OrderedDict()
+
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, int, float]:
+        return self.limiter.hit(key, now)
+
+    def claim(self, key: str, now: Optional[float] = None) -> Optional[StoredResponse]:
+        now = time.monotonic() if now is None else now
+        responses = self.responses
+        while responses and next(iter(responses.values()))[0] < now - self.ttl:
+            responses.popitem(last=False)
+        entry = responses.get(key)
+        if entry is not None and (entry[1] is not None or entry[0] >= now - self.lock_timeout):
+            return entry[1] or PENDING
+        responses[key] = (now, None)
+        responses.move_to_end(key)
+        return None
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        entry = self.responses.get(key)
+        if entry is not None and entry[1] is None:
+            self.responses[key] = (entry[0], response)
+
+    def release(self, key: str) -> None:
+        entry = self.responses.get(key)
+        if entry is not None and entry[1] is None:
+            del self.responses[key]
+
+
+class SqliteState(StateBackend):
+    """An SQLite file shared by all processes that open the same `path`.
+
+    Every operation is a single statement in autocommit mode, so it is atomic across
+    processes without an explicit transaction: the sliding-window update is one
+    upsert that computes the decision in SQL and returns it. The database runs in WAL
+    mode with `synchronous=NORMAL` (no fsync per commit), so a hit costs a few
+    microseconds more than the in-process dict and writers only wait for each other
+    for the length of one statement. Windows are indexed by wall-clock time, which all
+    processes share. Rows of keys idle for a full window and responses older than
+    `ttl` are deleted by the first hit of each window.
+    """
+
+    _schema = (
+        "CREATE TABLE IF NOT EXISTS rate ("
+        " key TEXT PRIMARY KEY, idx INTEGER, prev INTEGER, curr INTEGER, allowed INTEGER) WITHOUT ROWID",
+        "CREATE TABLE IF NOT EXISTS idempotency ("
+        " key TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB, fingerprint TEXT, created REAL)",
+    )
+    # ?1 key, ?2 window index, ?3 weight of the previous window, ?4 limit
+    _hit = """
+        INSERT INTO rate (key, idx, prev, curr, allowed) VALUES (?1, ?2, 0, ?4 >= 1, ?4 >= 1)
+        ON CONFLICT (key) DO UPDATE SET
+            idx = ?2,
+            prev = CASE idx WHEN ?2 THEN prev WHEN ?2 - 1 THEN curr ELSE 0 END,
+            curr = CASE idx WHEN ?2 THEN curr ELSE 0 END + (
+                CASE idx WHEN ?2 THEN prev WHEN ?2 - 1 THEN curr ELSE 0 END * ?3
+                + CASE idx WHEN ?2 THEN curr ELSE 0 END + 1 <= ?4),
+            allowed = (
+                CASE idx WHEN ?2 THEN prev WHEN ?2 - 1 THEN curr ELSE 0 END * ?3
+                + CASE idx WHEN ?2 THEN curr ELSE 0 END + 1 <= ?4)
+        RETURNING prev, curr, allowed
+    """
+    # ?1 key, ?2 now, ?3 claims older than this are abandoned, ?4 responses older than this are expired
+    _claim = """
+        INSERT INTO idempotency (key, status, created) VALUES (?1, 0, ?2)
+        ON CONFLICT (key) DO UPDATE SET status = 0, headers = NULL, body = NULL, fingerprint = NULL, created = ?2
+            WHERE (status = 0 AND created < ?3) OR created < ?4
+        RETURNING 1
+    """
+
+    def __init__(self, path: str, limit: int, window: float, ttl: float = 86400, lock_timeout: float = 30) -> None:
+        self.path = path
+        self.limit = limit
+        self.window = window
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self._local = threading.local()  # a connection per thread
+        self._purged = 0
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            for statement in self._schema:
+                connection.execute(statement)
+            self._local.connection = connection
+        return connection
+
+    def hit(self, key: str, now: Optional[float] = None) -> Tuple[bool, int, float]:
+        now = time.time() if now is None else now
+        index = int(now // self.window)
+        offset = now - index * self.window
+        if index != self._purged:
+            self._purge(index, now)
+        weight = 1 - offset / self.window
+        previous, current, allowed = self.connection.execute(self._hit, (key, index, weight, self.limit)).fetchone()
+        if not allowed:
+            return False, 0, retry_after(self.limit, self.window, previous, current, offset)
+        return True, int(self.limit - previous * weight - current), 0.0
+
+    def _purge(self, index: int, now: float) -> None:
+        self._purged = index
+        connection = self.connection
+        connection.execute("DELETE FROM rate WHERE idx < ?", (index - 1,))
+        connection.execute("DELETE FROM idempotency WHERE created < ?", (now - self.ttl,))
+
+    def claim(self, key: str, now: Optional[float] = None) -> Optional[StoredResponse]:
+        now = time.time() if now is None else now
+        connection = self.connection
+        while True:
+            if connection.execute(self._claim, (key, now, now - self.lock_timeout, now - self.ttl)).fetchone():
+                return None
+            row = connection.execute(
+                "SELECT status, headers, body, fingerprint FROM idempotency WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                continue  # released between the two statements: claim again
+            status, headers, body, fingerprint = row
+            if status == 0:
+                return PENDING
+            return StoredResponse(status, [tuple(h) for h in json.loads(headers)], body, fingerprint)
+
+    def complete(self, key: str, response: StoredResponse) -> None:
+        self.connection.execute(
+            "UPDATE idempotency SET status = ?, headers = ?, body = ?, fingerprint = ? WHERE key = ? AND status = 0",
+            (response.status, json.dumps(response.headers), response.body, response.fingerprint, key),
+        )
+
+    def release(self, key: str) -> None:
+        self.connection.execute("DELETE FROM idempotency WHERE key = ? AND status = 0", (key,))
+
+
+def create_state() -> StateBackend:
+    if settings.state_backend == "memory":
+        return MemoryState(
+            settings.rate_limit_requests,
+            settings.rate_limit_window_seconds,
+            max_keys=settings.rate_limit_max_keys,
+            ttl=settings.idempotency_ttl_seconds,
+            lock_timeout=settings.idempotency_lock_seconds,
+        )
+    if settings.state_backend == "sqlite":
+        return SqliteState(
+            settings.state_path,
+            settings.rate_limit_requests,
+            settings.rate_limit_window_seconds,
+            ttl=settings.idempotency_ttl_seconds,
+            lock_timeout=settings.idempotency_lock_seconds,
+        )
+    raise ValueError(f"Unknown STATE_BACKEND: {settings.state_backend!r} (expected memory or sqlite)")
+
+
+state = create_state()
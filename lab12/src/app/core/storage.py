@@ -6,6 +6,8 @@ from typing import Dict, Optional
 
 
 _id_lock = threading.Lock()
+# sync routes run in a thread pool: checking and claiming an email must be one step
+_email_lock = threading.Lock()
 
 
 def _next_id(counter: Dict[str, int], key: str) -> int:
@@ -14,14 +16,18 @@ def _next_id(counter: Dict[str, int], key: str) -> int:
         return counter[key]
 
 
-@dataclass
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+@dataclass(slots=True)
 class Project:
     id: int
     name: str
     description: str = ""
 
 
-@dataclass
+@dataclass(slots=True)
 class Task:
     id: int
     project_id: int
@@ -33,7 +39,7 @@ class Task:
     user_id: Optional[int] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class User:
     id: int
     name: str
@@ -46,7 +52,8 @@ class InMemoryDB:
     tasks: Dict[int, Task] = field(default_factory=dict)
     users: Dict[int, User] = field(default_factory=dict)
     id_counters: Dict[str, int] = field(default_factory=dict)
-    idempotency: Dict[str, int] = field(default_factory=dict)  # key -> created resource id
+    # unique index: normalized email -> user id
+    users_by_email: Dict[str, int] = field(default_factory=dict)
 
     def create_project(self, name: str, description: str = "") -> Project:
         new_id = _next_id(self.id_counters, "project")
@@ -80,12 +87,57 @@ class InMemoryDB:
         self.tasks[new_id] = task
         return task
 
+    def find_user_by_email(self, email: str) -> Optional[User]:
+        user_id = self.users_by_email.get(normalize_email(email))
+        return self.users.get(user_id) if user_id is not None else None
+
     def create_user(self, name: str, email: str) -> User:
-        new_id = _next_id(self.id_counters, "user")
-        user = User(id=new_id, name=name, email=email)
-        self.users[new_id] = user
+        key = normalize_email(email)
+        with _email_lock:
+            if key in self.users_by_email:
+                raise ValueError("Email already in use")
+            new_id = _next_id(self.id_counters, "user")
+            user = User(id=new_id, name=name, email=email)
+            self.users[new_id] = user
+            self.users_by_email[key] = new_id
         return user
 
+    def get_or_create_user(self, name: str, email: str) -> User:
+        # The user with this email, created if there is none, as one step under the email lock
+        with _email_lock:
+            user = self.find_user_by_email(email)
+            if user is not None:
+                return user
+            key = normalize_email(email)
+            new_id = _next_id(self.id_counters, "user")
+            user = User(id=new_id, name=name, email=email)
+            self.users[new_id] = user
+            self.users_by_email[key] = new_id
+        return user
+
+    def update_user(self, user_id: int, name: Optional[str] = None, email: Optional[str] = None) -> User:
+        user = self.users[user_id]
+        if email is not None:
+            old_key, new_key = normalize_email(user.email), normalize_email(email)
+            with _email_lock:
+                if new_key != old_key:
+                    if new_key in self.users_by_email:
+                        raise ValueError("Email already in use")
+                    del self.users_by_email[old_key]
+                    self.users_by_email[new_key] = user_id
+                user.email = email
+        if name is not None:
+            user.name = name
+        return user
+
+    def delete_user(self, user_id: int) -> None:
+        user = self.users.pop(user_id)
+        self.users_by_email.pop(normalize_email(user.email), None)
+        # detach user from tasks
+        for t in self.tasks.values():
+            if t.user_id == user_id:
+                t.user_id = None
+
 
 db = InMemoryDB()
 
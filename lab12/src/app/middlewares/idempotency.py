@@ -1,25 +1,92 @@
 from __future__ import annotations
 
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import JSONResponse
+import hashlib
+from typing import List
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from app.core.config import settings
-from app.core.storage import db
-
-
-class IdempotencyMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        response = await call_next(request)
-        # On successful creation, store mapping via response header if present
-        if request.method == "POST" and response.status_code in (200, 201):
-            key = request.headers.get(settings.idempotency_header)
-            created_id = response.headers.get("X-Resource-Id")
-            if key and created_id:
-                namespaced = f"{request.url.path}:{key}"
-                if namespaced not in db.idempotency:
-                    try:
-                        db.idempotency[namespaced] = int(created_id)
-                    except Exception:
-                        pass
-        return response
+from app.core.state import StoredResponse, state
+
+
+class IdempotencyMiddleware:
+    # Pure ASGI: only POSTs with an Idempotency-Key are looked at, and their response is
+    # streamed through as it is produced; a copy of the body is kept to be stored
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] != "POST":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        key = headers.get(settings.idempotency_header)
+        if not key:
+            await self.app(scope, receive, send)
+            return
+
+        # Request bodies are small: read it whole to fingerprint it, then hand it to the app
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body", False):
+                break
+        fingerprint = hashlib.sha256(body).hexdigest()
+        replayed = False
+
+        async def receive_body() -> Message:
+            nonlocal replayed
+            if not replayed:
+                replayed = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        # The first POST with a key claims it in the shared state; repeats, on any worker,
+        # get its stored response instead of running the handler again. Keys are scoped to
+        # the caller's API key, so a stored response is only replayed to whoever created it
+        # (the route's auth check runs after this middleware).
+        caller = hashlib.sha256(headers.get(settings.api_key_header, "").encode()).hexdigest()[:32]
+        namespaced = f"{caller}:{scope['path']}:{key}"
+        stored = state.claim(namespaced)
+        if stored is not None:
+            if stored.pending:
+                response = JSONResponse(
+                    {"detail": "A request with this Idempotency-Key is in progress"}, status_code=409
+                )
+            elif stored.fingerprint != fingerprint:
+                response = JSONResponse(
+                    {"detail": "This Idempotency-Key was used with a different request body"}, status_code=422
+                )
+            else:
+                response = Response(stored.body, status_code=stored.status)
+                response.raw_headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in stored.headers]
+                response.headers["Idempotent-Replayed"] = "true"
+            await response(scope, receive, send)
+            return
+
+        start: Message = {}
+        chunks: List[bytes] = []
+        completed = False
+
+        async def send_and_store(message: Message) -> None:
+            nonlocal start, completed
+            if message["type"] == "http.response.start":
+                start = message
+            elif message["type"] == "http.response.body" and start["status"] in (200, 201):
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body", False):
+                    # stored before the last chunk goes out, so a retry after the reply finds it
+                    stored_headers = [(name.decode("latin-1"), value.decode("latin-1")) for name, value in start.get("headers", ())]
+                    state.complete(namespaced, StoredResponse(start["status"], stored_headers, b"".join(chunks), fingerprint))
+                    completed = True
+            await send(message)
 
+        try:
+            await self.app(scope, receive_body, send_and_store)
+        finally:
+            if not completed:
+                state.release(namespaced)
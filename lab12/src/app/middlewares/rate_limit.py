@@ -1,44 +1,43 @@
 from __future__ import annotations
 
-import time
-from typing import Callable
+import math
 
-from fastapi import Request, Response
-from starlette.middleware.base import BaseHTTPMiddleware
-from app.core.config import settings
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.state import state
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    def __init__(self, app):
-        super().__init__(app)
-        self.bucket: dict[str, list[float]] = {}
+class RateLimitMiddleware:
+    # Pure ASGI: the response passes through untouched except for one header added to its start message
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
 
-    async def dispatch(self, request: Request, call_next: Callable):
-        identifier = request.headers.get("X-API-Key", request.client.host)
-        now = time.time()
-        window = settings.rate_limit_window_seconds
-        max_requests = settings.rate_limit_requests
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        timestamps = self.bucket.get(identifier, [])
-        # prune old timestamps
-        timestamps = [ts for ts in timestamps if ts > now - window]
+        identifier = Headers(scope=scope).get("X-API-Key", scope["client"][0])
+        allowed, remaining, retry_after = state.hit(identifier)
 
-        if len(timestamps) >= max_requests:
-            retry_after = int(window - (now - timestamps[0]))
-            return Response(
+        if not allowed:
+            response = Response(
                 status_code=429,
                 headers={
                     "X-Limit-Remaining": "0",
-                    "Retry-After": str(max(retry_after, 1)),
+                    "Retry-After": str(max(math.ceil(retry_after), 1)),
                 },
                 content=b"Too Many Requests",
             )
+            await response(scope, receive, send)
+            return
 
-        timestamps.append(now)
-        self.bucket[identifier] = timestamps
+        limit_header = (b"x-limit-remaining", str(remaining).encode())
 
-        response = await call_next(request)
-        remaining = max_requests - len(timestamps)
-        response.headers["X-Limit-Remaining"] = str(max(remaining, 0))
-        return response
+        async def send_with_limit(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", ()), limit_header]}
+            await send(message)
 
+        await self.app(scope, receive, send_with_limit)
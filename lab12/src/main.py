@@ -16,8 +16,9 @@ from app.api.internal.metrics import router as internal_metrics
 def create_app() -> FastAPI:
     app = FastAPI(title="Tasks API", version="2.0.0", docs_url="/docs", redoc_url="/redoc")
 
-    app.add_middleware(RateLimitMiddleware)
+    # the last added runs first: replayed POSTs still count against the rate limit
     app.add_middleware(IdempotencyMiddleware)
+    app.add_middleware(RateLimitMiddleware)
 
     app.include_router(projects_v1, prefix="/api/v1", dependencies=[Depends(api_key_auth)])
     app.include_router(tasks_v1, prefix="/api/v1", dependencies=[Depends(api_key_auth)])
@@ -0,0 +1,6 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+# the app's state is created at import: no test should trip the global rate limit by accident
+os.environ.setdefault("RATE_LIMIT_REQUESTS", "1000000")
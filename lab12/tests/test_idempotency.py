@@ -0,0 +1,41 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from main import create_app
+
+
+@pytest.fixture
+def client():
+    return TestClient(create_app())
+
+
+def post(client, body, key, api_key=settings.default_api_key):
+    headers = {settings.idempotency_header: key, settings.api_key_header: api_key}
+    return client.post("/api/v2/projects/", json=body, headers=headers)
+
+
+def test_repeat_is_replayed(client):
+    key = str(uuid.uuid4())
+    first = post(client, {"name": "A"}, key)
+    second = post(client, {"name": "A"}, key)
+    assert first.status_code == second.status_code == 201
+    assert second.json() == first.json()
+    assert second.headers["Idempotent-Replayed"] == "true"
+
+
+def test_other_body_with_the_same_key_is_refused(client):
+    key = str(uuid.uuid4())
+    assert post(client, {"name": "A"}, key).status_code == 201
+    assert post(client, {"name": "B"}, key).status_code == 422
+
+
+def test_keys_are_scoped_to_the_caller(client):
+    key = str(uuid.uuid4())
+    assert post(client, {"name": "A"}, key).status_code == 201
+    # another API key neither gets the stored response nor skips authentication
+    response = post(client, {"name": "A"}, key, api_key="wrong")
+    assert response.status_code == 401
+    assert "Idempotent-Replayed" not in response.headers
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from app.core.state import MemoryState
+from app.middlewares import idempotency, rate_limit
+from app.middlewares.idempotency import IdempotencyMiddleware
+from app.middlewares.rate_limit import RateLimitMiddleware
+
+
+def streaming_app(chunks, status=200):
+    async def app(scope, receive, send):
+        message = await receive()
+        assert message["type"] == "http.request"
+        app.requests.append(message["body"])
+        await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"text/plain")]})
+        for i, chunk in enumerate(chunks):
+            app.sent_before.append(list(app.seen))  # what the client had when this chunk was produced
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+
+    app.requests, app.sent_before, app.seen = [], [], []
+    return app
+
+
+def call(asgi, method="POST", body=b"{}", headers=(), app=None):
+    scope = {
+        "type": "http", "method": method, "path": "/items", "client": ("10.0.0.1", 1234),
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if app is not None and message["type"] == "http.response.body":
+            app.seen.append(message["body"])
+
+    asyncio.run(asgi(scope, receive, send))
+    return sent
+
+
+@pytest.fixture
+def shared_state(monkeypatch):
+    backend = MemoryState(limit=2, window=60, ttl=100, lock_timeout=10)
+    monkeypatch.setattr(rate_limit, "state", backend)
+    monkeypatch.setattr(idempotency, "state", backend)
+    return backend
+
+
+def test_rate_limit_streams_the_response_and_adds_its_header(shared_state):
+    app = streaming_app([b"a", b"b", b"c"])
+    sent = call(RateLimitMiddleware(app), method="GET", app=app)
+    assert (b"x-limit-remaining", b"1") in sent[0]["headers"]
+    assert [m["body"] for m in sent[1:]] == [b"a", b"b", b"c"]
+    # each chunk reached the client before the app produced the next one
+    assert app.sent_before == [[], [b"a"], [b"a", b"b"]]
+
+
+def test_rate_limit_answers_429_with_retry_after(shared_state):
+    app = streaming_app([b"ok"])
+    middleware = RateLimitMiddleware(app)
+    for _ in range(2):
+        call(middleware, method="GET")
+    start = call(middleware, method="GET")[0]
+    headers = dict(start["headers"])
+    assert start["status"] == 429
+    assert int(headers[b"retry-after"]) >= 1
+    assert len(app.requests) == 2
+
+
+def test_idempotent_post_streams_then_replays(shared_state):
+    app = streaming_app([b"x", b"y"], status=201)
+    middleware = IdempotencyMiddleware(app)
+    headers = [("Idempotency-Key", "k1"), ("X-API-Key", "secret")]
+    first = call(middleware, body=b'{"n": 1}', headers=headers, app=app)
+    assert app.sent_before == [[], [b"x"]]
+    assert [m.get("more_body", False) for m in first[1:]] == [True, False]
+
+    replay = call(middleware, body=b'{"n": 1}', headers=headers)
+    assert replay[0]["status"] == 201
+    assert (b"idempotent-replayed", b"true") in replay[0]["headers"]
+    assert b"".join(m.get("body", b"") for m in replay[1:]) == b"xy"
+    assert app.requests == [b'{"n": 1}']
+
+
+def test_failed_response_releases_the_key(shared_state):
+    app = streaming_app([b"boom"], status=500)
+    middleware = IdempotencyMiddleware(app)
+    headers = [("Idempotency-Key", "k2")]
+    call(middleware, headers=headers)
+    call(middleware, headers=headers)
+    assert len(app.requests) == 2
@@ -0,0 +1,57 @@
+import pytest
+
+from app.core.rate_limiter import SlidingWindowLimiter
+
+START = 1_000_020.0  # the start of a 60 s window
+
+
+def fill(limiter, key, now, count):
+    return [limiter.hit(key, now)[0] for _ in range(count)]
+
+
+def test_previous_window_weighs_by_its_overlap():
+    limiter = SlidingWindowLimiter(limit=10, window=60)
+    assert fill(limiter, "k", START + 30, 10) == [True] * 10
+    # 15 s into the next window 3/4 of the previous one still counts: 7.5 + 0
+    assert fill(limiter, "k", START + 75, 3) == [True, True, False]
+    # 45 s in: 10 * 0.25 + 2 = 4.5, room for 5 more
+    assert fill(limiter, "k", START + 105, 6) == [True] * 5 + [False]
+
+
+def test_counts_older_than_one_window_are_forgotten():
+    limiter = SlidingWindowLimiter(limit=2, window=60)
+    fill(limiter, "k", START, 2)
+    assert fill(limiter, "k", START + 120, 2) == [True, True]
+
+
+def test_remaining_and_retry_after():
+    limiter = SlidingWindowLimiter(limit=3, window=60)
+    assert [limiter.hit("k", START)[1] for _ in range(3)] == [2, 1, 0]
+    allowed, remaining, wait = limiter.hit("k", START + 10)
+    assert (allowed, remaining) == (False, 0)
+    assert not limiter.hit("k", START + 10 + wait - 0.01)[0]
+    assert limiter.hit("k", START + 10 + wait + 0.01)[0]
+
+
+@pytest.mark.parametrize("offset", [0, 10, 45])
+def test_retry_after_is_exact_once_the_window_has_moved_on(offset):
+    limiter = SlidingWindowLimiter(limit=4, window=60)
+    fill(limiter, "k", START, 4)
+    now = START + 60 + offset
+    fill(limiter, "k", now, 4)
+    allowed, _, wait = limiter.hit("k", now)
+    assert not allowed and wait > 0
+    assert not limiter.hit("k", now + wait - 0.01)[0]
+    assert limiter.hit("k", now + wait + 0.01)[0]
+
+
+def test_idle_and_excess_keys_are_evicted():
+    limiter = SlidingWindowLimiter(limit=5, window=60, max_keys=3)
+    for key in "abc":
+        limiter.hit(key, START)
+    limiter.hit("a", START + 1)  # a is now the most recently used
+    limiter.hit("d", START + 2)
+    assert len(limiter) == 3 and limiter.evicted == 1
+    assert fill(limiter, "b", START + 3, 5) == [True] * 5  # b was dropped: a fresh count
+    limiter.hit("e", START + 200)  # everything else has been idle for over a window
+    assert len(limiter) == 1 and limiter.evicted == 5
@@ -0,0 +1,44 @@
+import pytest
+
+from app.core.state import PENDING, MemoryState, SqliteState, StateBackend, StoredResponse
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryState(limit=3, window=60, ttl=100, lock_timeout=10)
+    return SqliteState(str(tmp_path / "state.sqlite3"), limit=3, window=60, ttl=100, lock_timeout=10)
+
+
+def test_incomplete_backend_fails_on_instantiation():
+    class HitsOnly(StateBackend):
+        def hit(self, key, now=None):
+            return True, 0, 0.0
+
+    with pytest.raises(TypeError):
+        HitsOnly()
+
+
+def test_hit_stops_at_the_limit(backend):
+    now = 1_000_020.0
+    assert [backend.hit("client", now)[0] for _ in range(4)] == [True, True, True, False]
+    assert backend.hit("other", now)[0]
+
+
+def test_claim_complete_replay(backend):
+    now = 1_000_000.0
+    assert backend.claim("k", now) is None
+    assert backend.claim("k", now + 1) is PENDING
+    backend.complete("k", StoredResponse(201, [("content-type", "application/json")], b"{}", "abc"))
+    stored = backend.claim("k", now + 2)
+    assert (stored.status, stored.body, stored.fingerprint) == (201, b"{}", "abc")
+
+
+def test_release_and_abandoned_claims(backend):
+    now = 1_000_000.0
+    assert backend.claim("k", now) is None
+    backend.release("k")
+    assert backend.claim("k", now + 1) is None
+    # the owner never completed: after lock_timeout another worker takes over
+    assert backend.claim("k", now + 5) is PENDING
+    assert backend.claim("k", now + 20) is None
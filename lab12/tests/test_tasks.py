@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.storage import Task, db
+from main import create_app
+
+HEADERS = {settings.api_key_header: settings.default_api_key}
+
+
+def test_rows_are_slotted():
+    assert not hasattr(Task(1, 1, "T"), "__dict__")
+
+
+def test_v3_include_user_embeds_the_assignee():
+    project = db.create_project("P")
+    user = db.create_user("U", "include-user@example.com")
+    assigned = db.create_task_v2(project.id, "assigned", priority=2, user_id=user.id)
+    free = db.create_task_v2(project.id, "free")
+
+    response = TestClient(create_app()).get(
+        "/api/v3/tasks/", params={"project_id": project.id, "include": "user"}, headers=HEADERS
+    )
+    assert response.status_code == 200
+    by_id = {task["id"]: task for task in response.json()}
+    assert by_id[assigned.id]["user"] == {"id": user.id, "name": "U", "email": "include-user@example.com"}
+    assert by_id[assigned.id]["priority"] == 2
+    assert by_id[free.id]["user"] is None
+
+
+def test_v3_without_include_has_no_user_field():
+    project = db.create_project("P")
+    db.create_task_v2(project.id, "T", user_id=None)
+    response = TestClient(create_app()).get("/api/v3/tasks/", params={"project_id": project.id}, headers=HEADERS)
+    assert response.json() == [
+        {"id": response.json()[0]["id"], "project_id": project.id, "title": "T", "completed": False, "priority": None, "user_id": None}
+    ]
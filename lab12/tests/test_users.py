@@ -0,0 +1,25 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.storage import InMemoryDB
+from main import create_app
+
+HEADERS = {settings.api_key_header: settings.default_api_key}
+
+
+def test_repeated_email_returns_the_existing_user():
+    client = TestClient(create_app())
+    first = client.post("/api/v2/users/", json={"name": "A", "email": "same@example.com"}, headers=HEADERS)
+    second = client.post("/api/v2/users/", json={"name": "B", "email": " SAME@example.com"}, headers=HEADERS)
+    assert first.status_code == second.status_code == 201
+    assert second.json()["id"] == first.json()["id"]
+
+
+def test_concurrent_get_or_create_makes_one_user():
+    db = InMemoryDB()
+    with ThreadPoolExecutor(8) as pool:
+        users = list(pool.map(lambda i: db.get_or_create_user(f"U{i}", "race@example.com"), range(200)))
+    assert len({user.id for user in users}) == 1
+    assert len(db.users) == 1
@@ -0,0 +1,90 @@
+"""Compare wire codecs on realistic RPC payloads.
+
+Run from lab4/:  python -m benchmarks.codecs [--tasks 1000] [--repeat 200]
+
+For every codec the server-side costs are measured separately:
+decode + envelope validation of a request, and encoding of a reply envelope.
+"""
+import argparse
+import json
+import time
+import uuid
+
+from src.core.codecs import available_codecs, response_envelope
+from src.schemas.protocol import RequestMessage, ResponseMessage
+
+
+def make_payloads(n_tasks: int):
+    create_request = {
+        "id": str(uuid.uuid4()),
+        "version": "v1",
+        "action": "create_task",
+        "data": {"project_id": 1, "title": "Write the quarterly report", "completed": False},
+        "auth": "dev-secret-key",
+    }
+    tasks = [
+        {"id": i, "project_id": i % 50 + 1, "title": f"Task number {i} with a realistic title", "completed": i % 3 == 0}
+        for i in range(1, n_tasks + 1)
+    ]
+    list_reply = ResponseMessage(correlation_id=str(uuid.uuid4()), status="ok", data=tasks)
+    get_reply = ResponseMessage(correlation_id=str(uuid.uuid4()), status="ok", data=tasks[0])
+    return create_request, {"get_task reply": get_reply, f"list_tasks reply ({n_tasks})": list_reply}
+
+
+def bench(fn, repeat: int) -> float:
+    fn()  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6  # microseconds per call
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    create_request, replies = make_payloads(args.tasks)
+    results = []
+
+    # Baseline: the pre-codec server path (json.loads + RequestMessage(**), model_dump_json)
+    raw = json.dumps(create_request).encode()
+    results.append({
+        "codec": "baseline", "case": "request decode+validate", "bytes": len(raw),
+        "us": bench(lambda: RequestMessage(**json.loads(raw.decode())), args.repeat * 10),
+    })
+    for case, reply in replies.items():
+        results.append({
+            "codec": "baseline", "case": case + " encode", "bytes": len(reply.model_dump_json().encode()),
+            "us": bench(lambda: reply.model_dump_json().encode(), args.repeat),
+        })
+
+    for name, codec in available_codecs().items():
+        body = codec.dumps(create_request)
+        results.append({
+            "codec": name, "case": "request decode+validate", "bytes": len(body),
+            "us": bench(lambda: RequestMessage.model_validate(codec.loads(body)), args.repeat * 10),
+        })
+        for case, reply in replies.items():
+            encoded = codec.dumps(response_envelope(reply))
+            results.append({
+                "codec": name, "case": case + " encode", "bytes": len(encoded),
+                "us": bench(lambda: codec.dumps(response_envelope(reply)), args.repeat),
+            })
+            results.append({
+                "codec": name, "case": case + " decode", "bytes": len(encoded),
+                "us": bench(lambda: codec.loads(encoded), args.repeat),
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'codec':<10} {'case':<36} {'bytes':>10} {'us/op':>12}")
+    for r in results:
+        print(f"{r['codec']:<10} {r['case']:<36} {r['bytes']:>10} {r['us']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Per-message pydantic cost: the old two-pass dispatch vs the compiled action table.
+
+Run from lab4/:  python -m benchmarks.dispatch [--repeat 20000] [--list-size 100]
+
+"two-pass" is the path the server used before: RequestMessage.model_validate on the
+envelope, `Schema(**data)` inside the handler, then `XOut.model_validate(row)` and
+`model_dump()` on the result. "compiled" is `parse_request()` (envelope and typed
+payload in one TypeAdapter pass) plus `CompiledAction.execute()` (rows read straight
+into dicts). Both start from the decoded dict and run the same handler logic.
+"""
+import argparse
+import time
+import uuid
+
+from src.core.storage import db
+from src.handlers.registry import get_action, parse_request
+from src.schemas.protocol import RequestMessage
+
+
+def two_pass(version: str, request_data: dict):
+    action = get_action(version, request_data["action"])
+    spec = action.spec
+    request = RequestMessage.model_validate(request_data)
+    payload = spec.payload(**request.data) if spec.payload else request.data
+    result = spec.handler(payload)
+    if spec.output is None:
+        return None
+    if spec.result == "many":
+        return [spec.output.model_validate(row).model_dump() for row in result]
+    return spec.output.model_validate(result).model_dump()
+
+
+def compiled(version: str, request_data: dict):
+    request, action, _ = parse_request(request_data)
+    return action.execute(request.data)
+
+
+def bench(fn, args, repeat: int) -> float:
+    fn(*args)  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(*args)
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20000)
+    parser.add_argument("--list-size", type=int, default=100)
+    args = parser.parse_args()
+
+    project = db.create_project("Benchmark")
+    for i in range(args.list_size):
+        task = db.create_task(project.id, f"Task number {i} with a realistic title")
+    user = db.create_user("Bench User", "bench@example.com")
+
+    def request(action: str, data: dict, version: str = "v1") -> dict:
+        return {"id": str(uuid.uuid4()), "version": version, "action": action, "data": data, "auth": "dev-secret-key"}
+
+    cases = {
+        "get_task": request("get_task", {"id": task.id}),
+        "get_user": request("get_user", {"id": user.id}),
+        "update_task": request("update_task", {"id": task.id, "title": "Renamed", "completed": True}),
+        "create_user (existing)": request("create_user", {"name": "Bench User", "email": "bench@example.com"}),
+        f"list_tasks ({args.list_size})": request("list_tasks", {"project_id": project.id}),
+    }
+    print(f"{'action':<24} {'two-pass us':>12} {'compiled us':>12} {'speedup':>8}")
+    for name, request_data in cases.items():
+        repeat = max(args.repeat // (args.list_size // 10), 100) if name.startswith("list") else args.repeat
+        old = bench(two_pass, ("v1", request_data), repeat)
+        new = bench(compiled, ("v1", request_data), repeat)
+        print(f"{name:<24} {old:>12.2f} {new:>12.2f} {old / new:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
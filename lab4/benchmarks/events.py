@@ -0,0 +1,155 @@
+"""Keeping a downstream copy of the tasks table: polling list_tasks vs change events.
+
+Run from lab4/:  python -m benchmarks.events [--writes 20000] [--tasks 5000] [--poll-ms 100]
+
+A writer sends `--writes` task writes (60% update_task, 30% create_task, 10%
+delete_task) with `--concurrency` calls in flight, on top of `--tasks` seeded tasks.
+Meanwhile a downstream copy of the tasks table is kept current:
+- poll: events off, the copy re-lists list_tasks every `--poll-ms` ms;
+- events: the copy applies the change events from `EXCHANGE` (events are turned on for this run).
+Reported: write throughput, what the copy received (messages, bytes), how long a
+write takes to show in the copy (a probe task is renamed at random moments and
+watched) and, for events, whether the copy ended up equal to the server's table.
+Uses the real server and client on the in-process AMQP stand-in.
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import random
+import time
+from typing import Any, Dict, List
+
+from benchmarks.inmemory_amqp import InMemoryBroker
+from benchmarks.rpc import summarize
+from src.client import RpcClient
+from src.core.codecs import get_codec
+from src.core.config import settings
+from src.core.events import events
+from src.core.storage import db
+from src.server import start_server, stop_server
+
+EXCHANGE = "api.events"
+
+
+async def run(mode: str, args: argparse.Namespace) -> Dict[str, Any]:
+    events.exchange_name = EXCHANGE if mode == "events" else ""
+    broker = InMemoryBroker()
+    connection = await broker.connect()
+    engine = await start_server(connection)
+    client = await RpcClient(connection, max_in_flight=args.concurrency + 1).start()
+
+    copy: Dict[int, Dict[str, Any]] = {}
+    received = {"messages": 0, "bytes": 0}
+
+    async def on_events(message) -> None:
+        received["messages"] += 1
+        received["bytes"] += len(message.body)
+        for event in get_codec(message.content_type).loads(message.body)["events"]:
+            if event["op"] == "create":
+                copy[event["id"]] = {"id": event["id"], **event["fields"]}
+            elif event["op"] == "update":
+                copy[event["id"]].update(event["fields"])
+            else:
+                copy.pop(event["id"], None)
+
+    if mode == "events":
+        # subscribed before any write, so the copy is built from the create events
+        channel = await connection.channel()
+        queue = await channel.declare_queue(exclusive=True)
+        await queue.bind(EXCHANGE, "task")
+        await queue.consume(on_events, no_ack=True)
+
+    project = (await client.call("create_project", {"name": "Events"})).data["id"]
+    probe = (await client.call("create_task", {"project_id": project, "title": "Probe"})).data["id"]
+    seeded = await asyncio.gather(*[
+        client.call("create_task", {"project_id": project, "title": f"Seed task {i}"}) for i in range(args.tasks)
+    ])
+    live = [r.data["id"] for r in seeded]
+    received.update(messages=0, bytes=0)
+
+    async def writer(n: int) -> None:
+        for i in range(n):
+            roll = random.random()
+            if roll < 0.3 or not live:
+                response = await client.call("create_task", {"project_id": project, "title": f"Task {i}"})
+                live.append(response.data["id"])
+            elif roll < 0.4:
+                await client.call("delete_task", {"id": live.pop(random.randrange(len(live)))})
+            else:
+                await client.call("update_task", {"id": random.choice(live), "completed": bool(i & 1)})
+
+    async def poller() -> None:
+        while True:
+            await asyncio.sleep(args.poll_ms / 1000)
+            response = await client.call_raw({
+                "id": f"poll-{time.perf_counter_ns()}", "version": "v1", "action": "list_tasks",
+                "data": {"project_id": project}, "auth": settings.default_api_key,
+            })
+            received["messages"] += 1
+            received["bytes"] += len(client.codec.dumps(response))
+            copy.clear()
+            copy.update((row["id"], row) for row in response["data"])
+
+    visibility: List[float] = []
+
+    async def prober() -> None:
+        # time from a write's reply until the copy shows it
+        for n in itertools.count():
+            await asyncio.sleep(args.poll_ms / 1000 * random.random())
+            title = f"Probe {n}"
+            await client.call("update_task", {"id": probe, "title": title})
+            written = time.perf_counter()
+            while copy.get(probe, {}).get("title") != title:
+                await asyncio.sleep(0.001)
+            visibility.append(time.perf_counter() - written)
+
+    background = [asyncio.create_task(prober())]
+    if mode == "poll":
+        background.append(asyncio.create_task(poller()))
+    started = time.perf_counter()
+    per_writer = args.writes // args.concurrency
+    await asyncio.gather(*[writer(per_writer) for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+    for task in background:
+        task.cancel()
+    await asyncio.sleep(settings.events_flush_ms / 1000 + 0.05)
+
+    consistent = {task_id: (row["title"], row["completed"]) for task_id, row in copy.items()} == {
+        task.id: (task.title, task.completed) for task in db.tasks_for_project(project)
+    }
+    await client.close()
+    await stop_server(engine)
+    return {
+        "writes_per_s": per_writer * args.concurrency / elapsed,
+        "received": received,
+        "visibility": summarize(visibility),
+        "consistent": consistent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=20000)
+    parser.add_argument("--tasks", type=int, default=5000, help="tasks seeded before the run")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--poll-ms", type=float, default=100.0)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    random.seed(1)
+    print(f"{args.writes} task writes on {args.tasks} seeded tasks, copy checked every {args.poll_ms:g} ms")
+    for mode in ("poll", "events"):
+        result = asyncio.run(run(mode, args))
+        received = result["received"]
+        print(
+            f"  {mode:<7} {result['writes_per_s']:6.0f} writes/s   copy received {received['messages']} messages, "
+            f"{received['bytes'] / 2**20:7.1f} MiB   write visible after p50 {result['visibility']['p50_ms']:6.1f} ms "
+            f"p99 {result['visibility']['p99_ms']:6.1f} ms"
+            + (f"   copy == table: {result['consistent']}" if mode == "events" else "")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""In-process stand-in for the part of aio_pika used by the server and RpcClient.
+
+It is not a broker emulator: there is no persistence, named exchanges are only
+fanout or topic (with bindings), and of the queue arguments only `x-message-ttl`
+with dead-lettering through the default exchange is honoured (for consumer-less
+delay queues). It implements just enough - queues, per-channel prefetch, consume
+with ack / no_ack / requeue, publish and `IncomingMessage.process()` - to run the
+real `process_message` hot path and the real client without RabbitMQ.
+
+    broker = InMemoryBroker()
+    connection = await broker.connect()
+    engine = await start_server(connection)
+"""
+from __future__ import annotations
+
+import asyncio
+import itertools
+import uuid
+from collections import deque
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+
+class IncomingMessage:
+    def __init__(self, message: Any, queue: "QueueState", channel: Optional["Channel"], no_ack: bool):
+        self.body: bytes = message.body
+        self.content_type = message.content_type
+        self.correlation_id = message.correlation_id
+        self.reply_to = message.reply_to
+        self.headers = dict(message.headers or {})
+        self.expiration = message.expiration
+        self.priority = message.priority
+        self.timestamp = message.timestamp
+        self.message_id = message.message_id
+        self.routing_key = queue.name  # only the default exchange exists
+        self.delivery_tag = next(_delivery_tags)
+        self.redelivered = False
+        self._queue = queue
+        self._channel = channel
+        self._source = message
+        self.processed = no_ack
+
+    def _settle(self) -> None:
+        self.processed = True
+        if self._channel is not None:
+            self._channel._unacked -= 1
+            self._channel._outstanding.discard(self)
+            self._channel._kick()
+
+    async def ack(self, multiple: bool = False) -> None:
+        if not self.processed:
+            self._settle()
+
+    async def reject(self, requeue: bool = False) -> None:
+        if not self.processed:
+            self._settle()
+            if requeue:
+                self._queue._put(self._source, redelivered=True)
+
+    async def nack(self, multiple: bool = False, requeue: bool = True) -> None:
+        await self.reject(requeue=requeue)
+
+    @asynccontextmanager
+    async def process(self, requeue: bool = False, reject_on_redelivered: bool = False, ignore_processed: bool = False):
+        try:
+            yield self
+        except BaseException:
+            if not self.processed:
+                await self.reject(requeue=requeue)
+            raise
+        else:
+            if not self.processed:
+                await self.ack()
+
+
+_delivery_tags = itertools.count(1)
+
+
+class QueueState:
+    # Broker side of a queue: messages and consumers, shared by every channel
+    def __init__(self, broker: "InMemoryBroker", name: str, arguments: Optional[Dict[str, Any]] = None):
+        self.broker = broker
+        self.name = name
+        self.arguments = arguments or {}
+        self._messages: Deque[tuple] = deque()
+        self._consumers: List[tuple] = []  # (channel, callback, no_ack)
+        self._tags: Dict[str, tuple] = {}
+        self._rr = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._messages)
+
+    def _put(self, message: Any, redelivered: bool = False) -> None:
+        self._messages.append((message, redelivered))
+        ttl = self.arguments.get("x-message-ttl")
+        if ttl is not None:
+            asyncio.get_running_loop().call_later(ttl / 1000, self._expire_head)
+        self._dispatch()
+
+    def _expire_head(self) -> None:
+        # Every message in the queue has the same TTL, so the oldest expires first
+        if self._messages:
+            message, _ = self._messages.popleft()
+            target = self.broker.queues.get(self.arguments.get("x-dead-letter-routing-key", self.name))
+            if target is not None and self.arguments.get("x-dead-letter-exchange") == "":
+                target._put(message)
+
+    def _dispatch(self) -> None:
+        while self._messages and self._consumers:
+            for _ in range(len(self._consumers)):
+                channel, callback, no_ack = self._consumers[self._rr % len(self._consumers)]
+                self._rr += 1
+                if no_ack or channel._has_capacity():
+                    break
+            else:
+                return  # every consumer is at its prefetch limit
+            message, redelivered = self._messages.popleft()
+            incoming = IncomingMessage(message, self, None if no_ack else channel, no_ack)
+            incoming.redelivered = redelivered
+            if not no_ack:
+                channel._unacked += 1
+                channel._outstanding.add(incoming)
+            asyncio.get_running_loop().create_task(callback(incoming))
+
+
+class Queue:
+    # Channel-bound handle returned by declare_queue(), like aio_pika.Queue
+    def __init__(self, state: QueueState, channel: "Channel"):
+        self._state = state
+        self.channel = channel
+        self.name = state.name
+        self.declaration_result = SimpleNamespace(message_count=state.depth, consumer_count=len(state._consumers))
+
+    async def consume(self, callback: Callable[[IncomingMessage], Awaitable[Any]], no_ack: bool = False, **kwargs: Any) -> str:
+        consumer = (self.channel, callback, no_ack)
+        self._state._consumers.append(consumer)
+        self.channel._queues.add(self._state)
+        self._state._dispatch()
+        tag = f"ctag-{uuid.uuid4().hex[:8]}"
+        self._state._tags[tag] = consumer
+        return tag
+
+    async def cancel(self, consumer_tag: str, **kwargs: Any) -> None:
+        consumer = self._state._tags.pop(consumer_tag, None)
+        if consumer in self._state._consumers:
+            self._state._consumers.remove(consumer)
+
+    async def get(self, no_ack: bool = False, fail: bool = True, timeout: Any = None) -> Optional[IncomingMessage]:
+        state = self._state
+        if not state._messages:
+            if fail:
+                raise LookupError(f"Queue {self.name} is empty")
+            return None
+        message, redelivered = state._messages.popleft()
+        channel = None if no_ack else self.channel
+        incoming = IncomingMessage(message, state, channel, no_ack)
+        incoming.redelivered = redelivered
+        if channel is not None:
+            channel._unacked += 1
+            channel._outstanding.add(incoming)
+        return incoming
+
+    async def purge(self) -> None:
+        self._state._messages.clear()
+
+    async def bind(self, exchange: Any, routing_key: str = "", **kwargs: Any) -> None:
+        name = exchange if isinstance(exchange, str) else exchange.name
+        self.channel.broker.exchanges[name].bindings.append((routing_key.split("."), self._state))
+
+
+def _topic_match(pattern: List[str], words: List[str]) -> bool:
+    # "*" matches one word, "#" zero or more
+    if not pattern:
+        return not words
+    if pattern[0] == "#":
+        return any(_topic_match(pattern[1:], words[i:]) for i in range(len(words) + 1))
+    return bool(words) and pattern[0] in ("*", words[0]) and _topic_match(pattern[1:], words[1:])
+
+
+class Exchange:
+    def __init__(self, broker: "InMemoryBroker", name: str = "", type: str = "direct"):
+        self.broker = broker
+        self.name = name
+        self.type = type
+        self.bindings: List[tuple] = []  # (binding key split into words, QueueState)
+
+    async def publish(self, message: Any, routing_key: str, **kwargs: Any) -> None:
+        if self.name:
+            for pattern, queue in self.bindings:
+                if self.type == "fanout" or _topic_match(pattern, routing_key.split(".")):
+                    queue._put(message)
+        else:
+            queue = self.broker.queues.get(routing_key)
+            if queue is not None:  # like AMQP, unroutable messages are dropped
+                queue._put(message)
+        self.broker.published += 1
+
+
+class Channel:
+    def __init__(self, connection: "Connection"):
+        self.connection = connection
+        self.broker = connection.broker
+        self.default_exchange = Exchange(self.broker)
+        self.prefetch_count = 0
+        self.is_closed = False
+        self._unacked = 0
+        self._outstanding: set = set()
+        self._queues: set = set()
+
+    def _has_capacity(self) -> bool:
+        return not self.prefetch_count or self._unacked < self.prefetch_count
+
+    def _kick(self) -> None:
+        for queue in self._queues:
+            queue._dispatch()
+
+    async def set_qos(self, prefetch_count: int = 0, **kwargs: Any) -> None:
+        self.prefetch_count = prefetch_count
+
+    async def declare_queue(
+        self,
+        name: Optional[str] = None,
+        durable: bool = False,
+        exclusive: bool = False,
+        arguments: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Queue:
+        name = name or f"amq.gen-{uuid.uuid4().hex}"
+        state = self.broker.queues.get(name)
+        if state is None:
+            state = self.broker.queues[name] = QueueState(self.broker, name, arguments)
+        return Queue(state, self)
+
+    async def declare_exchange(self, name: str, type: Any = "direct", durable: bool = False, **kwargs: Any) -> Exchange:
+        exchange = self.broker.exchanges.get(name)
+        if exchange is None:
+            exchange = self.broker.exchanges[name] = Exchange(self.broker, name, getattr(type, "value", type))
+        return exchange
+
+    async def close(self) -> None:
+        # Like a broker, requeue whatever was delivered on this channel and not settled
+        self.is_closed = True
+        for state in self._queues:
+            state._consumers = [consumer for consumer in state._consumers if consumer[0] is not self]
+        for message in list(self._outstanding):
+            await message.reject(requeue=True)
+
+    async def __aenter__(self) -> "Channel":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+
+class Connection:
+    def __init__(self, broker: "InMemoryBroker"):
+        self.broker = broker
+        self.is_closed = False
+
+    async def channel(self, publisher_confirms: bool = True, **kwargs: Any) -> Channel:
+        return Channel(self)
+
+    async def close(self) -> None:
+        self.is_closed = True
+
+    async def __aenter__(self) -> "Connection":
+        return self
+
+    async def __aexit__(self, *exc: Any) -> None:
+        await self.close()
+
+
+class InMemoryBroker:
+    def __init__(self) -> None:
+        self.queues: Dict[str, QueueState] = {}
+        self.exchanges: Dict[str, Exchange] = {}
+        self.published = 0
+
+    async def connect(self, url: Any = None, **kwargs: Any) -> Connection:
+        return Connection(self)
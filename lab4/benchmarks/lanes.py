@@ -0,0 +1,97 @@
+"""Interactive latency behind a bulk backlog: one shared queue vs priority lanes, and deadline shedding.
+
+Run from lab4/:  python -m benchmarks.lanes [--bulk 20000] [--probe-interval 10] [--weight 8]
+
+A bulk client publishes `--bulk` create_task requests at once; while the server
+works through them, an interactive client sends a get_task every
+`--probe-interval` ms and measures its latency. Modes:
+- shared: both go to the request queue, so every probe waits behind the backlog;
+- lanes: probes go to the "interactive" lane (`request_lanes={"interactive": weight}`);
+- deadline: shared queue, but bulk calls time out after `--bulk-timeout` s; the
+  server drops the requests whose deadline passed ("shed") instead of executing them.
+Uses the real server and client on the in-process AMQP stand-in.
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List
+
+from benchmarks.inmemory_amqp import InMemoryBroker
+from benchmarks.rpc import summarize
+from src.client import RpcClient
+from src.core.config import settings
+from src.core.metrics import metrics
+from src.server import start_server, stop_server
+
+
+async def run(mode: str, args: argparse.Namespace) -> Dict[str, object]:
+    settings.request_lanes = {"interactive": args.weight} if mode == "lanes" else {}
+    broker = InMemoryBroker()
+    connection = await broker.connect()
+    engine = await start_server(connection)
+    bulk = await RpcClient(connection, max_in_flight=args.bulk).start()
+    interactive = await RpcClient(connection).start()
+
+    project = (await interactive.call("create_project", {"name": "Lanes"})).data["id"]
+    task = (await interactive.call("create_task", {"project_id": project, "title": "Probe target"})).data["id"]
+    bulk_timeout = args.bulk_timeout if mode == "deadline" else 600.0
+    lane = "interactive" if mode == "lanes" else None
+    metrics.reset()
+
+    timed_out = 0
+
+    async def bulk_call(i: int) -> None:
+        nonlocal timed_out
+        try:
+            await bulk.call("create_task", {"project_id": project, "title": f"Bulk task {i}"}, timeout=bulk_timeout)
+        except asyncio.TimeoutError:
+            timed_out += 1
+
+    started = time.perf_counter()
+    backlog = asyncio.gather(*[bulk_call(i) for i in range(args.bulk)])
+    probes: List[float] = []
+    while not backlog.done():
+        probe_started = time.perf_counter()
+        await interactive.call("get_task", {"id": task}, lane=lane)
+        probes.append(time.perf_counter() - probe_started)
+        await asyncio.sleep(args.probe_interval / 1000)
+    await backlog
+    # the backlog is answered or abandoned; let the server drain what is left
+    while engine.in_flight or engine.queued or broker.queues[settings.queue_requests].depth:
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    shed = sum(value for (_, action, outcome), value in metrics.requests.items() if outcome == "shed")
+    executed = sum(value for (_, action, outcome), value in metrics.requests.items() if action == "create_task" and outcome == "ok")
+    await bulk.close()
+    await interactive.close()
+    await stop_server(engine)
+    return {"probe": summarize(probes), "elapsed": elapsed, "timed_out": timed_out, "shed": shed, "executed": executed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bulk", type=int, default=20000, help="create_task requests published at once")
+    parser.add_argument("--probe-interval", type=float, default=10.0, help="ms between interactive get_task calls")
+    parser.add_argument("--weight", type=int, default=8, help="weight of the interactive lane")
+    parser.add_argument("--bulk-timeout", type=float, default=2.0, help="seconds, deadline mode")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    random.seed(1)
+    print(f"{args.bulk} bulk create_task, get_task probe every {args.probe_interval:g} ms")
+    for mode in ("shared", "lanes", "deadline"):
+        result = asyncio.run(run(mode, args))
+        probe = result["probe"]
+        print(
+            f"  {mode:<9} probe n={probe['count']:<4} p50 {probe['p50_ms']:8.2f} ms  p99 {probe['p99_ms']:8.2f} ms   "
+            f"bulk: executed {result['executed']}, shed {result['shed']}, timed out {result['timed_out']}, "
+            f"drained in {result['elapsed']:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Cost of logging a received message on the event loop thread.
+
+Run from lab4/:  python -m benchmarks.logging_overhead [--messages 20000] [--tasks 500]
+
+Compares the old hot-path line (`logger.info(f"Received message: {request_data}")`
+through a synchronous StreamHandler) with `log_payload()` behind the queue handler of
+src/core/logs.py, with and without sampling. Output goes to /dev/null, so the numbers
+are formatting and I/O-call costs, not terminal speed.
+
+"caller us" is what the event loop pays per message; "total us" also includes the
+listener thread draining the queue (the work moved off the loop).
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import time
+import uuid
+from logging.handlers import QueueListener
+
+from src.core.config import settings
+from src.core.logs import LOG_FORMAT, DroppingQueueHandler, log_payload
+
+
+def make_bodies(n_tasks: int):
+    small = {
+        "id": str(uuid.uuid4()),
+        "version": "v1",
+        "action": "create_task",
+        "data": {"project_id": 1, "title": "Write the quarterly report", "completed": False},
+        "auth": "dev-secret-key",
+    }
+    large = {
+        **small,
+        "action": "batch",
+        "items": [
+            {"id": str(uuid.uuid4()), "action": "create_task", "data": {"project_id": 1, "title": f"Imported task {i}"}}
+            for i in range(n_tasks)
+        ],
+    }
+    return {"create_task": small, f"batch ({n_tasks} items)": large}
+
+
+def make_logger(handler: logging.Handler, level: int = logging.INFO) -> logging.Logger:
+    logger = logging.getLogger("benchmarks.logging_overhead")
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(level)
+    return logger
+
+
+def run_case(name: str, mode: str, sample_rate: float, body: bytes, decoded: dict, messages: int, devnull) -> dict:
+    output = logging.StreamHandler(devnull)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = None
+    if mode == "sync":
+        logger = make_logger(output)
+    elif mode == "disabled":
+        logger = make_logger(output, logging.WARNING)
+    else:
+        handler = DroppingQueueHandler(queue.Queue(maxsize=messages + 1))  # no drops while measuring
+        listener = QueueListener(handler.queue, output)
+        listener.start()
+        logger = make_logger(handler)
+    settings.log_payload_sample_rate = sample_rate
+
+    started = time.perf_counter()
+    if name == "f-string":
+        for _ in range(messages):
+            logger.info(f"Received message: {decoded}")
+    else:
+        for _ in range(messages):
+            log_payload(logger, "Received message", body)
+    caller = time.perf_counter() - started
+    if listener is not None:
+        listener.stop()  # waits for the queue to drain
+    total = time.perf_counter() - started
+    return {"caller_us": caller / messages * 1e6, "total_us": total / messages * 1e6}
+
+
+CASES = [
+    # label, formatting, handler mode, payload sample rate
+    ("old: f-string, sync handler", "f-string", "sync", 1.0),
+    ("log_payload, sync handler", "lazy", "sync", 1.0),
+    ("log_payload, queue handler", "lazy", "async", 1.0),
+    ("log_payload, queue, 1% sampled", "lazy", "async", 0.01),
+    ("log level WARNING", "lazy", "disabled", 1.0),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+    with open(os.devnull, "w") as devnull:
+        for payload_name, decoded in make_bodies(args.tasks).items():
+            body = json.dumps(decoded).encode()
+            print(f"{payload_name}: {len(body)} bytes, truncated to {settings.log_payload_max_chars} chars")
+            for label, name, mode, rate in CASES:
+                result = run_case(name, mode, rate, body, decoded, args.messages, devnull)
+                results[f"{payload_name} / {label}"] = result
+                print(f"  {label:<34} caller {result['caller_us']:8.2f} us   total {result['total_us']:8.2f} us")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
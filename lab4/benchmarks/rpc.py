@@ -0,0 +1,167 @@
+"""Throughput / latency benchmark for the RPC server hot path.
+
+Runs the real server (`start_server` -> `process_message` -> registry handlers ->
+publisher) and the real `RpcClient` against the in-process AMQP stand-in, so no
+RabbitMQ is needed. Broker cost is close to zero here: the numbers are the server
+and client overhead alone.
+
+Run from lab4/:
+    python -m benchmarks.rpc --requests 20000 --concurrency 64 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import time
+from typing import Any, Dict, List
+
+from benchmarks.inmemory_amqp import InMemoryBroker
+from src.client import RpcClient
+from src.core.codecs import get_codec
+from src.core.config import settings
+from src.core.metrics import metrics
+from src.server import start_server, stop_server
+
+# action -> share of the mixed workload
+DEFAULT_MIX = {"create_task": 0.3, "get_task": 0.4, "list_tasks": 0.2, "get_project": 0.1}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50) * 1000,
+        "p90_ms": percentile(values, 90) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+        "max_ms": (values[-1] if values else 0.0) * 1000,
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    broker = InMemoryBroker()
+    connection = await broker.connect()
+    engine = await start_server(connection)
+    client = await RpcClient(
+        connection,
+        codec=get_codec(args.content_type),
+        max_in_flight=args.concurrency,
+    ).start()
+
+    # Seed: a few projects with tasks so reads hit real data
+    projects = []
+    for i in range(args.projects):
+        response = await client.call("create_project", {"name": f"Project {i}"})
+        projects.append(response.data["id"])
+    seed = await asyncio.gather(*[
+        client.call("create_task", {"project_id": random.choice(projects), "title": f"Seed task {i}"})
+        for i in range(args.seed_tasks)
+    ])
+    task_ids = [r.data["id"] for r in seed]
+
+    mix = json.loads(args.mix) if args.mix else DEFAULT_MIX
+    actions = random.choices(list(mix), weights=list(mix.values()), k=args.requests)
+    latencies: Dict[str, List[float]] = {action: [] for action in mix}
+    errors = 0
+
+    def payload(action: str) -> Dict[str, Any]:
+        if action == "create_task":
+            return {"project_id": random.choice(projects), "title": "Benchmark task"}
+        if action == "get_task":
+            return {"id": random.choice(task_ids)}
+        if action == "list_tasks":
+            return {"project_id": random.choice(projects)}
+        if action == "get_project":
+            return {"id": random.choice(projects)}
+        if action == "create_project":
+            return {"name": "Benchmark project"}
+        return {}
+
+    pending = iter(actions)
+
+    async def worker() -> None:
+        # Closed-loop load: each worker keeps exactly one call in flight
+        nonlocal errors
+        for action in pending:
+            call_started = time.perf_counter()
+            response = await client.call(action, payload(action))
+            latencies[action].append(time.perf_counter() - call_started)
+            if response.status != "ok":
+                errors += 1
+
+    metrics.reset()  # server-side phase timings for the measured part only
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+
+    await client.close()
+    await stop_server(engine)
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "benchmark": "rpc",
+        "python": platform.python_version(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "content_type": args.content_type,
+            "projects": args.projects,
+            "seed_tasks": args.seed_tasks,
+            "handler_executor": settings.handler_executor,
+            "consumer_concurrency": settings.consumer_concurrency,
+            "consumer_prefetch_count": settings.consumer_prefetch_count,
+            "mix": mix,
+        },
+        "elapsed_s": elapsed,
+        "messages_per_s": args.requests / elapsed,
+        "errors": errors,
+        "latency": summarize(all_latencies),
+        "latency_by_action": {action: summarize(values) for action, values in latencies.items()},
+        # mean server time per phase, from src.core.metrics
+        "server_phase_ms": {
+            action: {
+                phase: metrics.phases[(version, action, phase)].sum / metrics.phases[(version, action, phase)].count * 1000
+                for (version, a, phase) in metrics.phases if a == action
+            }
+            for action in mix
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--projects", type=int, default=20)
+    parser.add_argument("--seed-tasks", type=int, default=2000)
+    parser.add_argument("--content-type", default=settings.default_content_type)
+    parser.add_argument("--mix", help='JSON object action -> weight, e.g. \'{"get_task": 1}\'')
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    random.seed(1)
+    result = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    print(f"{result['messages_per_s']:.0f} msg/s over {args.requests} requests, "
+          f"p50 {result['latency']['p50_ms']:.2f} ms, p99 {result['latency']['p99_ms']:.2f} ms, "
+          f"errors {result['errors']}")
+    for action, stats in result["latency_by_action"].items():
+        phases = "  ".join(f"{phase} {ms:.3f}" for phase, ms in result["server_phase_ms"][action].items())
+        print(f"  {action:<14} n={stats['count']:<6} p50 {stats['p50_ms']:.2f} ms  p99 {stats['p99_ms']:.2f} ms  server ms: {phases}")
+
+
+if __name__ == "__main__":
+    main()
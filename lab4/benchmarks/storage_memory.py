@@ -0,0 +1,84 @@
+"""Memory per task in InMemoryDB for each storage layout.
+
+Run from lab4/:  python -m benchmarks.storage_memory [--tasks 1000000] [--projects 1000]
+
+Fills a fresh db through `create_task_v2` (unique titles, a priority and a user on
+every other task) and reports the bytes allocated per task, measured with
+tracemalloc: the record or columns, the title, the table entry and the index
+entries. Layouts:
+- dict: a plain @dataclass with the same fields, as storage.py used before;
+- slots: the slotted Task records (`STORAGE_LAYOUT=objects`);
+- columnar: TaskColumns (`STORAGE_LAYOUT=columnar`).
+"get" is the cost of `db.tasks[id]` plus reading every field, for random ids.
+"""
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Optional
+
+from src.core import storage
+from src.core.config import settings
+from src.core.storage import InMemoryDB
+
+
+@dataclass
+class DictTask:
+    id: int
+    project_id: int
+    title: str
+    completed: bool = False
+    priority: Optional[int] = None
+    user_id: Optional[int] = None
+
+
+def fill(tasks: int, projects: int) -> tuple:
+    db = InMemoryDB()
+    for i in range(projects):
+        db.create_project(f"Project {i}")
+    user = db.create_user("Bench User", "bench@example.com")
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    for i in range(tasks):
+        db.create_task_v2(
+            i % projects + 1,
+            f"Task number {i} with a realistic title",
+            priority=i % 5,
+            user_id=user.id if i & 1 else None,
+        )
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ids = random.sample(range(1, tasks + 1), min(tasks, 100_000))
+    started = time.perf_counter()
+    for task_id in ids:
+        storage._task_row(db.tasks[task_id])
+    get_us = (time.perf_counter() - started) / len(ids) * 1e6
+    return allocated / tasks, get_us, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tasks", type=int, default=1_000_000)
+    parser.add_argument("--projects", type=int, default=1000)
+    args = parser.parse_args()
+
+    slotted = storage.Task
+    print(f"{args.tasks} tasks in {args.projects} projects")
+    for name, cls, layout in (("dict", DictTask, "objects"), ("slots", slotted, "objects"), ("columnar", slotted, "columnar")):
+        storage.Task = cls
+        settings.storage_layout = layout
+        try:
+            per_task, get_us, elapsed = fill(args.tasks, args.projects)
+        finally:
+            storage.Task = slotted
+        print(f"  {name:<9} {per_task:6.0f} bytes/task   get {get_us:5.2f} us   filled in {elapsed:.1f}s under tracemalloc")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Write-ahead log cost: appends per durability mode, and restart time at millions of records.
+
+Run from lab4/:  python -m benchmarks.wal_replay [--records 2000000] [--appends 20000] [--dir /tmp/wal-bench]
+
+1. append: `--appends` task updates through a WAL-backed db in every `wal_sync`
+   mode. In group mode each write also awaits `wal.sync()`, as a reply would, with
+   `--clients` writers in flight; "always" runs a tenth of the appends (one fsync each).
+2. replay: `--records` logged mutations (1% projects, 60% tasks, 39% updates) are
+   restored into a fresh db from the log alone, then from a snapshot after a checkpoint.
+
+The directory should be on the disk the server would use: fsync cost is the disk's.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+from src.core.config import settings
+from src.core.storage import InMemoryDB
+from src.core.wal import SYNC_MODES, WriteAheadLog
+
+
+def fresh(directory: str) -> None:
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def open_wal(directory: str, mode: str) -> tuple:
+    settings.wal_sync = mode
+    db = InMemoryDB()
+    wal = WriteAheadLog()
+    wal.open(directory, db)
+    return db, wal
+
+
+def bench_append(directory: str, mode: str, appends: int, clients: int) -> dict:
+    fresh(directory)
+    db, wal = open_wal(directory, mode)
+    project = db.create_project("Benchmark")
+    task = db.create_task(project.id, "Task with a realistic title")
+
+    async def writer(n: int) -> None:
+        for i in range(n):
+            db.update_task(task.id, title=f"Title {i}", completed=bool(i & 1))
+            await wal.sync()
+
+    started = time.perf_counter()
+    if mode == "group":
+        async def run() -> None:
+            await asyncio.gather(*[writer(appends // clients) for _ in range(clients)])
+        asyncio.run(run())
+    else:
+        for i in range(appends):
+            db.update_task(task.id, title=f"Title {i}", completed=bool(i & 1))
+    elapsed = time.perf_counter() - started
+    stats = wal.stats()
+    wal.close()
+    return {"us_per_write": elapsed / appends * 1e6, "writes_per_s": appends / elapsed, "fsyncs": stats["fsyncs"]}
+
+
+def fill(directory: str, records: int) -> None:
+    fresh(directory)
+    db, wal = open_wal(directory, "os")
+    projects = max(1, records // 100)
+    tasks = records * 60 // 100
+    for i in range(projects):
+        db.create_project(f"Project {i}", "Imported project")
+    for i in range(tasks):
+        db.create_task_v2(i % projects + 1, f"Task number {i} with a realistic title", priority=i % 5)
+    for i in range(records - projects - tasks):
+        db.update_task(i % tasks + 1, completed=True)
+    wal.close()
+
+
+def bench_restore(directory: str) -> tuple:
+    settings.wal_sync = "os"
+    db = InMemoryDB()
+    wal = WriteAheadLog()
+    started = time.perf_counter()
+    wal.open(directory, db)
+    elapsed = time.perf_counter() - started
+    return db, wal, elapsed
+
+
+def dir_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=2_000_000)
+    parser.add_argument("--appends", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=32, help="concurrent writers in group mode")
+    parser.add_argument("--dir", help="working directory (default: a temporary one, removed afterwards)")
+    args = parser.parse_args()
+    directory = args.dir or tempfile.mkdtemp(prefix="wal-bench-")
+
+    try:
+        print(f"append ({args.appends} writes, {directory})")
+        for mode in SYNC_MODES:
+            appends = args.appends // 10 if mode == "always" else args.appends
+            result = bench_append(directory, mode, appends, args.clients)
+            print(f"  {mode:<9} {result['us_per_write']:8.1f} us/write  {result['writes_per_s']:9.0f} writes/s  fsyncs {result['fsyncs']}")
+
+        started = time.perf_counter()
+        fill(directory, args.records)
+        print(f"replay ({args.records} records, {dir_size(directory) / 2**20:.0f} MiB of log, written in {time.perf_counter() - started:.1f}s)")
+        db, wal, elapsed = bench_restore(directory)
+        print(f"  log only       {elapsed:6.2f}s  {args.records / elapsed:9.0f} records/s  ({len(db.tasks)} tasks)")
+
+        started = time.perf_counter()
+        wal.checkpoint()
+        wal.close()
+        print(f"  checkpoint     {time.perf_counter() - started:6.2f}s  snapshot {dir_size(directory) / 2**20:.0f} MiB")
+        db, wal, elapsed = bench_restore(directory)
+        print(f"  from snapshot  {elapsed:6.2f}s  ({len(db.tasks)} tasks)")
+        wal.close()
+    finally:
+        if not args.dir:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,124 +1,264 @@
 import asyncio
+import time
 import uuid
-import json
 import logging
-from aio_pika import connect, Message, IncomingMessage
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from aio_pika import connect, Message
+from aio_pika.abc import AbstractChannel, AbstractConnection, AbstractIncomingMessage, AbstractQueue
 from src.core.config import settings
-from src.schemas.protocol import RequestMessage, ResponseMessage
+from src.core.codecs import Codec, get_codec
+from src.core.logs import setup_logging
+from src.schemas.protocol import ResponseMessage, DEADLINE_HEADER, STREAM_SEQ_HEADER, STREAM_END_HEADER
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+setup_logging()
 logger = logging.getLogger(__name__)
 
-async def main():
-    connection = await connect(settings.rabbitmq_url)
 
-    async with connection:
-        channel = await connection.channel()
-        
+class StreamError(Exception):
+    # A streamed call ended with an error reply (possibly after some chunks were delivered)
+    pass
+
+
+class RpcClient:
+    """Multiplexing RPC client: one reply queue, many concurrent calls.
+
+    Every call gets its own correlation id and future; replies are matched back by
+    `correlation_id`, so thousands of requests can be in flight on one channel.
+    `max_in_flight` caps outstanding calls (callers wait for a free slot), and each
+    call has its own timeout. A cancelled or timed-out call forgets its future, and
+    a late reply for it is dropped.
+
+    Every request carries its deadline (`x-deadline`, now + timeout), so a server
+    that gets to it after the caller gave up drops it instead of executing it.
+    `lane` sends a call to the priority lane `<routing_key>.<lane>` (see
+    `settings.request_lanes`), e.g. interactive reads past a backlog of bulk writes.
+
+    `stream()` asks for a chunked reply to a list action and yields items as the
+    chunks arrive; chunks can be published on different server channels, so
+    they are put back in order by their sequence number.
+    """
+
+    def __init__(
+        self,
+        connection: AbstractConnection,
+        codec: Optional[Codec] = None,
+        max_in_flight: Optional[int] = None,
+        timeout: Optional[float] = None,
+        api_key: Optional[str] = None,
+        routing_key: Optional[str] = None,
+    ):
+        self.connection = connection
+        self.codec = codec or get_codec(settings.default_content_type)
+        self.timeout = timeout if timeout is not None else settings.client_timeout
+        self.api_key = api_key if api_key is not None else settings.default_api_key
+        self.routing_key = routing_key or settings.queue_requests
+        self.channel: Optional[AbstractChannel] = None
+        self.callback_queue: Optional[AbstractQueue] = None
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._streams: Dict[str, asyncio.Queue] = {}
+        self._slots = asyncio.Semaphore(max_in_flight or settings.client_max_in_flight)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._futures) + len(self._streams)
+
+    async def start(self) -> "RpcClient":
+        self.channel = await self.connection.channel(publisher_confirms=False)
         # Declare callback queue
-        callback_queue = await channel.declare_queue(exclusive=True)
+        self.callback_queue = await self.channel.declare_queue(exclusive=True)
+        await self.callback_queue.consume(self._on_response, no_ack=True)
+        return self
 
-        loop = asyncio.get_running_loop()
-        future = loop.create_future()
+    async def close(self) -> None:
+        for future in self._futures.values():
+            if not future.done():
+                future.cancel()
+        self._futures.clear()
+        for chunks in self._streams.values():
+            chunks.put_nowait(None)  # wakes the consumer of an open stream, see stream()
+        if self.channel is not None and not self.channel.is_closed:
+            await self.channel.close()
 
-        async def on_response(message: IncomingMessage):
-            async with message.process():
-                logger.info(f"Received response: {message.body.decode()}")
-                future.set_result(message.body.decode())
+    async def __aenter__(self) -> "RpcClient":
+        return await self.start()
 
-        await callback_queue.consume(on_response)
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
 
-        # Create request
-        request_id = str(uuid.uuid4())
-        
-        # Example 1: Create User
-        request_data = {
-            "id": request_id,
-            "version": "v1",
-            "action": "create_user",
-            "data": {
-                "name": "Test User",
-                "email": "test@example.com"
-            },
-            "auth": settings.default_api_key
-        }
-        
-        logger.info(f"Sending request: {request_data}")
-        
-        await channel.default_exchange.publish(
-            Message(
-                body=json.dumps(request_data).encode(),
-                reply_to=callback_queue.name,
-                correlation_id=request_id,
-            ),
-            routing_key=settings.queue_requests,
+    def _message(self, request: Dict[str, Any], timeout: float) -> Message:
+        return Message(
+            body=self.codec.dumps(request),
+            content_type=self.codec.content_type,
+            reply_to=self.callback_queue.name,
+            correlation_id=request["id"],
+            headers={DEADLINE_HEADER: int((time.time() + timeout) * 1000)},
         )
 
-        response_body = await future
-        logger.info(f"Response: {response_body}")
-        
-         # Create request
-        request_id = str(uuid.uuid4())
-        
-        # Example 1: Create User
-        request_data = {
-            "id": request_id,
-            "version": "v1",
-            "action": "create_user",
-            "data": {
-                "name": "Test User",
-                "email": "test@example.com"
-            },
-            "auth": settings.default_api_key
+    def _routing_key(self, lane: Optional[str]) -> str:
+        return f"{self.routing_key}.{lane}" if lane else self.routing_key
+
+    async def _on_response(self, message: AbstractIncomingMessage) -> None:
+        stream = self._streams.get(message.correlation_id)
+        if stream is not None:
+            stream.put_nowait(message)
+            return
+        future = self._futures.pop(message.correlation_id, None)
+        if future is None or future.done():
+            logger.debug(f"Dropping reply for unknown or finished call {message.correlation_id}")
+            return
+        try:
+            future.set_result(get_codec(message.content_type).loads(message.body))
+        except Exception as e:
+            future.set_exception(e)
+
+    async def call_raw(
+        self,
+        request: Dict[str, Any],
+        timeout: Optional[float] = None,
+        routing_key: Optional[str] = None,
+        lane: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        # Sends a prepared request envelope and returns the decoded reply
+        request_id = request["id"]
+        timeout = timeout if timeout is not None else self.timeout
+        async with self._slots:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[request_id] = future
+            try:
+                await self.channel.default_exchange.publish(
+                    self._message(request, timeout),
+                    routing_key=routing_key or self._routing_key(lane),
+                )
+                return await asyncio.wait_for(future, timeout)
+            finally:
+                self._futures.pop(request_id, None)
+
+    async def call(
+        self,
+        action: str,
+        data: Optional[Dict[str, Any]] = None,
+        version: str = "v1",
+        timeout: Optional[float] = None,
+        request_id: Optional[str] = None,
+        lane: Optional[str] = None,
+    ) -> ResponseMessage:
+        request = {
+            "id": request_id or str(uuid.uuid4()),
+            "version": version,
+            "action": action,
+            "data": data or {},
+            "auth": self.api_key,
         }
-        
-        logger.info(f"Sending request: {request_data}")
-        
-        await channel.default_exchange.publish(
-            Message(
-                body=json.dumps(request_data).encode(),
-                reply_to=callback_queue.name,
-                correlation_id=request_id,
-            ),
-            routing_key=settings.queue_requests,
-        )
+        return ResponseMessage.model_validate(await self.call_raw(request, timeout, lane=lane))
 
-        response_body = await future
-        logger.info(f"Response: {response_body}")
+    async def batch(
+        self,
+        items: List[Dict[str, Any]],
+        version: str = "v1",
+        atomic: bool = False,
+        timeout: Optional[float] = None,
+        request_id: Optional[str] = None,
+        lane: Optional[str] = None,
+    ) -> ResponseMessage:
+        # items: [{"action": ..., "data": {...}, "id": optional per-item idempotency key}]
+        request = {
+            "id": request_id or str(uuid.uuid4()),
+            "version": version,
+            "items": [{**item, "id": item.get("id") or str(uuid.uuid4())} for item in items],
+            "atomic": atomic,
+            "auth": self.api_key,
+        }
+        return ResponseMessage.model_validate(await self.call_raw(request, timeout, lane=lane))
 
-        # Parse response
-        response = ResponseMessage.model_validate_json(response_body)
-        if response.status == "ok":
-            logger.info(f"User created: {response.data}")
-        else:
-            logger.error(f"Error: {response.error}")
 
-        # Example 2: List Users
-        future = loop.create_future() # Reset future
-        request_id = str(uuid.uuid4())
-        request_data = {
+    async def stream(
+        self,
+        action: str,
+        data: Optional[Dict[str, Any]] = None,
+        version: str = "v1",
+        timeout: Optional[float] = None,
+        request_id: Optional[str] = None,
+        lane: Optional[str] = None,
+    ) -> AsyncIterator[Any]:
+        # Yields the items of a list action; `timeout` applies to the wait for each chunk.
+        # Actions without a streaming variant answer with one ordinary reply, yielded the same way.
+        # A chunk seen before (the server re-sends a stream it retries) is dropped by its seq.
+        request_id = request_id or str(uuid.uuid4())
+        request = {
             "id": request_id,
-            "version": "v1",
-            "action": "list_users",
-            "data": {},
-            "auth": settings.default_api_key
+            "version": version,
+            "action": action,
+            "data": data or {},
+            "auth": self.api_key,
+            "stream": True,
         }
-        
-        logger.info(f"Sending request: {request_data}")
-        
-        await channel.default_exchange.publish(
-            Message(
-                body=json.dumps(request_data).encode(),
-                reply_to=callback_queue.name,
-                correlation_id=request_id,
-            ),
-            routing_key=settings.queue_requests,
-        )
-        
-        response_body = await future
-        logger.info(f"Response: {response_body}")
+        timeout = timeout if timeout is not None else self.timeout
+        async with self._slots:
+            chunks: asyncio.Queue = asyncio.Queue()
+            self._streams[request_id] = chunks
+            try:
+                await self.channel.default_exchange.publish(
+                    self._message(request, timeout),
+                    routing_key=self._routing_key(lane),
+                )
+                expected = 0
+                early: Dict[int, Any] = {}  # chunks that overtook a lower sequence number
+                while True:
+                    message = await asyncio.wait_for(chunks.get(), timeout)
+                    if message is None:
+                        raise StreamError("The client was closed")
+                    headers = message.headers or {}
+                    if STREAM_SEQ_HEADER in headers:
+                        seq, end = int(headers[STREAM_SEQ_HEADER]), bool(headers.get(STREAM_END_HEADER))
+                    else:
+                        seq, end = expected, True  # plain reply (no streaming variant, cached replay)
+                    if seq < expected or seq in early:
+                        continue  # duplicate
+                    early[seq] = (message, end)
+                    while expected in early:
+                        message, end = early.pop(expected)
+                        expected += 1
+                        reply = get_codec(message.content_type).loads(message.body)
+                        if reply.get("status") != "ok":
+                            raise StreamError(reply.get("error"))
+                        items = reply.get("data")
+                        for item in items if isinstance(items, list) else [items]:
+                            yield item
+                        if end:
+                            return
+            finally:
+                self._streams.pop(request_id, None)
+
+
+async def main():
+    connection = await connect(settings.rabbitmq_url)
+
+    async with connection:
+        async with RpcClient(connection) as client:
+            # Example 1: Create User (the same request id twice returns the cached response)
+            request_id = str(uuid.uuid4())
+            user_data = {"name": "Test User", "email": "test@example.com"}
+            response = await client.call("create_user", user_data, request_id=request_id)
+            logger.info(f"Response: {response}")
+            response = await client.call("create_user", user_data, request_id=request_id)
+            if response.status == "ok":
+                logger.info(f"User created: {response.data}")
+            else:
+                logger.error(f"Error: {response.error}")
+
+            # Example 2: Pipelined calls - many requests in flight at once
+            project = await client.call("create_project", {"name": "Demo"})
+            responses = await asyncio.gather(*[
+                client.call("create_task", {"project_id": project.data["id"], "title": f"Task {i}"})
+                for i in range(100)
+            ])
+            logger.info(f"Created {sum(r.status == 'ok' for r in responses)} tasks concurrently")
+
+            # Example 3: List Users
+            response = await client.call("list_users")
+            logger.info(f"Response: {response}")
 
 if __name__ == "__main__":
     asyncio.run(main())
-
@@ -0,0 +1,330 @@
+"""Partitioned deployment: one router in front of N shard workers.
+
+Every worker is a normal server process that owns a disjoint shard of the data and
+consumes its own queue `<queue_shard_prefix>.<index>`. Ids are allocated so that the
+owning shard can be derived from the id itself ((id - 1) % N), hence no lookup table.
+
+The router consumes `queue_requests` and:
+- forwards single-entity requests unchanged to the owning shard (the worker replies
+  straight to the client's `reply_to`), tagging writes with an `x-partition-key`
+  so that the worker applies writes to one entity in order. All forwards to a shard
+  go over one channel, so its queue receives them in the order they arrived;
+- fans `list_*` requests without a shard key out to every shard and merges the
+  lists (or v2 keyset pages) by id; a streamed request is collected from the shards
+  and re-streamed;
+- splits non-atomic batches by shard and merges the per-item results.
+
+Limitations: references between entities must stay inside one shard (a task lives
+on its project's shard), email uniqueness is only checked on the shard that owns
+the email, and atomic batches may not span shards.
+
+Run everything on one box:       python -m src.cluster --shards 4
+or the pieces separately:        python -m src.cluster --shards 4 --role router
+                                 python -m src.cluster --shards 4 --role worker --index 0
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import zlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from aio_pika import Message
+from aio_pika.abc import AbstractIncomingMessage
+
+from src import server
+from src.client import RpcClient
+from src.core.codecs import Codec, get_codec
+from src.core.config import settings
+from src.core.engine import PARTITION_KEY_HEADER, ConsumerEngine
+from src.core.metrics import exporter, metrics
+from src.core.publisher import publisher
+from src.core.storage import db, normalize_email
+from src.schemas.page import PageQuery
+from src.schemas.protocol import ResponseMessage
+from src.schemas.task import TaskListQueryV2
+
+logger = logging.getLogger(__name__)
+
+# entity actions routed by data["id"]
+KEYED_BY_ID = {
+    "get_project": "project", "update_project": "project", "delete_project": "project",
+    "get_task": "task", "update_task": "task", "delete_task": "task",
+    "get_user": "user", "update_user": "user", "delete_user": "user",
+}
+READ_ACTIONS = {"get_project", "get_task", "get_user", "list_projects", "list_tasks", "list_users"}
+FAN_OUT_ACTIONS = {"list_projects", "list_tasks", "list_users"}
+
+
+def shard_queue(index: int) -> str:
+    return f"{settings.queue_shard_prefix}.{index}"
+
+
+def owner_of(entity_id: Any, shard_count: int) -> int:
+    return (int(entity_id) - 1) % shard_count
+
+
+def stable_shard(value: str, shard_count: int) -> int:
+    # crc32 rather than hash(): must agree between processes and restarts
+    return zlib.crc32(value.encode()) % shard_count
+
+
+def route(action: str, data: Dict[str, Any], request_id: str, shard_count: int) -> Optional[Tuple[int, Optional[str]]]:
+    """(shard, partition key) for a single request, or None if it must fan out to every shard."""
+    try:
+        if action in KEYED_BY_ID and data.get("id") is not None:
+            entity_id = int(data["id"])
+            key = None if action in READ_ACTIONS else f"{KEYED_BY_ID[action]}:{entity_id}"
+            return owner_of(entity_id, shard_count), key
+        if action in ("create_task", "list_tasks") and data.get("project_id") is not None:
+            project_id = int(data["project_id"])
+            key = None if action in READ_ACTIONS else f"project:{project_id}"
+            return owner_of(project_id, shard_count), key
+        if action == "create_user" and data.get("email"):
+            email = normalize_email(str(data["email"]))
+            return stable_shard(email, shard_count), f"email:{email}"
+    except (TypeError, ValueError):
+        pass  # malformed id: any shard will answer with the validation error
+    if action in FAN_OUT_ACTIONS:
+        return None if shard_count > 1 else (0, None)
+    # create_project, unknown actions, missing keys: spread deterministically by request id
+    return stable_shard(request_id, shard_count), None
+
+
+class Router:
+    def __init__(self, connection, shard_count: int):
+        self.connection = connection
+        self.shard_count = shard_count
+        self.client: Optional[RpcClient] = None
+        self.engine: Optional[ConsumerEngine] = None
+        self._background: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        channel = await self.connection.channel()
+        queue = await channel.declare_queue(settings.queue_requests, durable=True)
+        for index in range(self.shard_count):
+            await channel.declare_queue(shard_queue(index), durable=True)
+        await channel.declare_queue(settings.queue_responses, durable=True)
+        await channel.declare_queue(settings.queue_dlq, durable=True)
+
+        await publisher.start(self.connection)
+        self.client = await RpcClient(self.connection).start()
+        # Concurrency 1: forwarding stays in delivery order. Fan-outs run in the background.
+        self.engine = ConsumerEngine("router", self.on_message, concurrency=1)
+        await self.engine.start(channel, queue)
+        metrics.register("rpc_engine", {"queue": settings.queue_requests}, self.engine.stats)
+        await exporter.start()
+        logger.info(f"Router dispatching {settings.queue_requests} to {self.shard_count} shards")
+
+    async def stop(self) -> None:
+        for task in list(self._background):
+            task.cancel()
+        if self.engine is not None:
+            await self.engine.stop()
+            metrics.unregister(self.engine.stats)
+        await exporter.stop()
+        if self.client is not None:
+            await self.client.close()
+        await publisher.close()
+
+    def _spawn(self, message: AbstractIncomingMessage, request_id: str, codec: Codec, coro) -> None:
+        task = asyncio.create_task(self._answer_errors(message, request_id, codec, coro))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    @staticmethod
+    async def _answer_errors(message: AbstractIncomingMessage, request_id: str, codec: Codec, coro) -> None:
+        # The request is already acked when a background fan-out runs: a failure is
+        # answered with an error reply so the client is not left waiting for its timeout
+        try:
+            await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Fan-out of {request_id} failed: {e}")
+            response = ResponseMessage(correlation_id=request_id, status="error", error=str(e))
+            try:
+                await server.send_response(message, response, codec)
+            except Exception as send_error:
+                logger.error(f"Could not answer {request_id}, dead-lettering it: {send_error}")
+                await server.send_to_dlq(message, f"Fan-out failed: {e}")
+
+    async def on_message(self, message: AbstractIncomingMessage) -> None:
+        async with message.process(ignore_processed=True):
+            try:
+                codec = get_codec(message.content_type)
+                request = codec.loads(message.body)
+                if not isinstance(request, dict) or not isinstance(request.get("id"), str):
+                    raise ValueError("request must be an object with a string id")
+            except ValueError as e:
+                await server.send_to_dlq(message, f"Invalid format: {str(e)}")
+                return
+
+            if "items" in request:
+                await self._route_batch(message, request, codec)
+                return
+
+            data = request.get("data") if isinstance(request.get("data"), dict) else {}
+            target = route(str(request.get("action")), data, request["id"], self.shard_count)
+            if target is None:
+                self._spawn(message, request["id"], codec, self._fan_out(message, request, codec))
+            else:
+                await self._forward(message, *target)
+
+    async def _forward(self, message: AbstractIncomingMessage, shard: int, key: Optional[str]) -> None:
+        headers = dict(message.headers or {})
+        if key is not None:
+            headers[PARTITION_KEY_HEADER] = key
+        await publisher.publish(
+            Message(
+                body=message.body,
+                content_type=message.content_type,
+                correlation_id=message.correlation_id,
+                reply_to=message.reply_to,
+                headers=headers,
+            ),
+            routing_key=shard_queue(shard),
+            pin=True,  # one channel per shard: writes reach the shard in the order they arrived
+        )
+
+    async def _fan_out(self, message: AbstractIncomingMessage, request: Dict[str, Any], codec: Codec) -> None:
+        replies = await asyncio.gather(*[
+            self.client.call_raw({**request, "id": f"{request['id']}:{index}", "stream": False}, routing_key=shard_queue(index))
+            for index in range(self.shard_count)
+        ], return_exceptions=True)
+
+        failed = next((r for r in replies if isinstance(r, Exception) or r.get("status") != "ok"), None)
+        if failed is not None:
+            error = str(failed) if isinstance(failed, Exception) else failed.get("error")
+            response = ResponseMessage(correlation_id=request["id"], status="error", error=error)
+        elif isinstance(replies[0]["data"], dict):
+            response = ResponseMessage(correlation_id=request["id"], status="ok", data=self._merge_pages(request, replies))
+        else:
+            # Every shard returns its rows in id order; merge keeps the global order
+            merged = heapq.merge(*[r["data"] or [] for r in replies], key=lambda row: row["id"])
+            if request.get("stream"):
+                await server.send_stream(message, request["id"], self._chunked(merged), codec)
+                return
+            response = ResponseMessage(correlation_id=request["id"], status="ok", data=list(merged))
+        await server.send_response(message, response, codec)
+
+    @staticmethod
+    def _merge_pages(request: Dict[str, Any], replies: List[Dict[str, Any]]) -> Dict[str, Any]:
+        # v2 keyset pages: each shard returned its first `limit` matches after after_id,
+        # so the global page is the first `limit` of their union
+        query = TaskListQueryV2 if request.get("action") == "list_tasks" else PageQuery
+        limit = query.model_validate(request.get("data") or {}).limit
+        merged = list(heapq.merge(*[r["data"]["items"] for r in replies], key=lambda row: row["id"]))
+        items = merged[:limit]
+        more = len(merged) > limit or any(r["data"]["next_after_id"] is not None for r in replies)
+        return {"items": items, "next_after_id": items[-1]["id"] if more and items else None}
+
+    @staticmethod
+    async def _chunked(rows):
+        rows = iter(rows)
+        while chunk := list(itertools.islice(rows, settings.stream_chunk_size)):
+            yield chunk
+
+    async def _route_batch(self, message: AbstractIncomingMessage, request: Dict[str, Any], codec: Codec) -> None:
+        items = request.get("items")
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            # malformed batch: let a worker reject it
+            await self._forward(message, stable_shard(request["id"], self.shard_count), None)
+            return
+
+        shards: List[int] = []
+        for item in items:
+            data = item.get("data") if isinstance(item.get("data"), dict) else {}
+            target = route(str(item.get("action")), data, str(item.get("id")), self.shard_count)
+            shards.append(target[0] if target is not None else -1)
+
+        if len(set(shards)) == 1 and shards[0] >= 0:
+            await self._forward(message, shards[0], None)
+            return
+        if request.get("atomic") or -1 in shards:
+            response = ResponseMessage(
+                correlation_id=request["id"],
+                status="error",
+                error="Batch spans several shards: atomic batches and list actions must target a single shard"
+            )
+            await server.send_response(message, response, codec)
+            return
+        self._spawn(message, request["id"], codec, self._split_batch(message, request, shards, codec))
+
+    async def _split_batch(self, message: AbstractIncomingMessage, request: Dict[str, Any], shards: List[int], codec: Codec) -> None:
+        groups: Dict[int, List[Dict[str, Any]]] = {}
+        for item, shard in zip(request["items"], shards):
+            groups.setdefault(shard, []).append(item)
+        order = list(groups)
+        replies = await asyncio.gather(*[
+            self.client.call_raw({**request, "id": f"{request['id']}:{shard}", "items": groups[shard]}, routing_key=shard_queue(shard))
+            for shard in order
+        ], return_exceptions=True)
+
+        failed = next((r for r in replies if isinstance(r, Exception) or not isinstance(r.get("data"), list)), None)
+        if failed is not None:
+            error = str(failed) if isinstance(failed, Exception) else failed.get("error")
+            response = ResponseMessage(correlation_id=request["id"], status="error", error=error)
+        else:
+            # Put the per-shard results back into the original item order
+            results = {shard: iter(reply["data"]) for shard, reply in zip(order, replies)}
+            response = ResponseMessage(
+                correlation_id=request["id"],
+                status="ok",
+                data=[next(results[shard]) for shard in shards]
+            )
+        await server.send_response(message, response, codec)
+
+
+async def run_router(shard_count: int) -> None:
+    connection = await server.connect_with_retry()
+    if connection is None:
+        return
+    async with connection:
+        router = Router(connection, shard_count)
+        await router.start()
+        try:
+            await asyncio.Future()
+        finally:
+            await router.stop()
+
+
+def configure_worker(index: int, shard_count: int) -> None:
+    # Each worker allocates ids offset+1, offset+1+N, ... so the router can find the owner from an id
+    settings.shard_count = shard_count
+    settings.request_lanes = {}  # the router forwards everything to the shard queue itself
+    if settings.metrics_port:
+        settings.metrics_port += index + 1  # the router keeps the base port
+    if settings.wal_dir:
+        settings.wal_dir = os.path.join(settings.wal_dir, f"shard-{index}")
+    db.id_stride = shard_count
+    db.id_offset = index
+
+
+def run_worker(index: int, shard_count: int) -> None:
+    configure_worker(index, shard_count)
+    asyncio.run(server.main(shard_queue(index)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the RPC server partitioned across processes")
+    parser.add_argument("--shards", type=int, default=settings.shard_count)
+    parser.add_argument("--role", choices=["all", "router", "worker"], default="all")
+    parser.add_argument("--index", type=int, help="shard index for --role worker")
+    args = parser.parse_args()
+
+    if args.role == "worker":
+        run_worker(args.index, args.shards)
+        return
+    if args.role == "all":
+        context = multiprocessing.get_context("spawn")
+        for index in range(args.shards):
+            context.Process(target=run_worker, args=(index, args.shards), daemon=True, name=f"shard-{index}").start()
+    asyncio.run(run_router(args.shards))
+
+
+if __name__ == "__main__":
+    main()
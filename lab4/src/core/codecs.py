@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional: application/msgpack is simply not offered
+    msgpack = None
+
+from src.core.config import settings
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+
+
+class UnsupportedContentType(ValueError):
+    pass
+
+
+class Codec(ABC):
+    content_type: str = ""
+    name: str = ""
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> bytes:
+        ...
+
+    @abstractmethod
+    def loads(self, body: bytes) -> Any:
+        ...
+
+    @abstractmethod
+    def ok_reply(self, correlation_id: str, data: bytes) -> bytes:
+        # The bytes of dumps(response_envelope(...)) for a successful reply whose `data`
+        # is already encoded with this codec (cached results)
+        ...
+
+
+class JsonCodec(Codec):
+    content_type = JSON
+    name = "json"
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+    def loads(self, body: bytes) -> Any:
+        return json.loads(body)
+
+    def ok_reply(self, correlation_id: str, data: bytes) -> bytes:
+        return b'{"correlation_id":' + self.dumps(correlation_id) + b',"status":"ok","data":' + data + b',"error":null}'
+
+
+class OrjsonCodec(JsonCodec):
+    # Same wire format as JsonCodec, several times faster on large list replies
+    content_type = JSON
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, body: bytes) -> Any:
+        return orjson.loads(body)
+
+
+class MsgpackCodec(Codec):
+    content_type = MSGPACK
+    name = "msgpack"
+
+    def dumps(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def loads(self, body: bytes) -> Any:
+        return msgpack.unpackb(body, raw=False)
+
+    def ok_reply(self, correlation_id: str, data: bytes) -> bytes:
+        # fixmap of 4 entries, then key/value pairs in response_envelope() order; 0xc0 is nil
+        return (
+            b"\x84" + self.dumps("correlation_id") + self.dumps(correlation_id)
+            + self.dumps("status") + self.dumps("ok") + self.dumps("data") + data
+            + self.dumps("error") + b"\xc0"
+        )
+
+
+def response_envelope(response: Any) -> Dict[str, Any]:
+    # ResponseMessage fields as a plain dict. `data` already holds serialized results,
+    # so this skips the deep copy model_dump() would make before encoding.
+    return {
+        "correlation_id": response.correlation_id,
+        "status": response.status,
+        "data": response.data,
+        "error": response.error,
+    }
+
+
+def available_codecs() -> Dict[str, Codec]:
+    # name -> codec, for everything usable in this environment
+    codecs: Dict[str, Codec] = {"json": JsonCodec()}
+    if orjson is not None:
+        codecs["orjson"] = OrjsonCodec()
+    if msgpack is not None:
+        codecs["msgpack"] = MsgpackCodec()
+    return codecs
+
+
+_available = available_codecs()
+
+# content type -> codec used on the wire; JSON goes through orjson when it is installed
+_by_content_type: Dict[str, Codec] = {
+    JSON: _available.get("orjson", _available["json"]),
+}
+if "msgpack" in _available:
+    _by_content_type[MSGPACK] = _available["msgpack"]
+
+
+def get_codec(content_type: Optional[str] = None) -> Codec:
+    # Messages without a content type are treated as the configured default (JSON)
+    key = (content_type or settings.default_content_type).split(";", 1)[0].strip().lower()
+    codec = _by_content_type.get(key)
+    if codec is None:
+        raise UnsupportedContentType(f"Unsupported content type: {content_type}")
+    return codec
+
+
+def supported_content_types() -> list[str]:
+    return list(_by_content_type)
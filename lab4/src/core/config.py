@@ -13,9 +13,69 @@ class Settings(BaseSettings):
     queue_requests: str = "api.requests"
     queue_responses: str = "api.responses"
     queue_dlq: str = "api.dlq"
+    # Retries (src/core/retry.py): a failed request waits in <queue>.retry.<ms>, then is redelivered
+    retry_delays_ms: list[int] = [1000, 4000, 16000, 64000]  # delay before attempt n; the last tier repeats
+    retry_max_attempts: int = 4  # retries before the message goes to queue_dlq, 0 disables retrying
+    # Change events (src/core/events.py): committed mutations in batches on a topic exchange,
+    # off by default; e.g. "api.events" turns them on at the cost of an extra publish per flush
+    events_exchange: str = ""
+    events_flush_ms: float = 5.0  # publish this long after the first unpublished event
+    events_batch_size: int = 500  # events per message at most
+    # Wire codec for messages without content_type: "application/json" or "application/msgpack"
+    default_content_type: str = "application/json"
+
+    # Partitioned deployment (src/cluster.py): router on queue_requests, workers on "<prefix>.<index>"
+    shard_count: int = 1
+    queue_shard_prefix: str = "api.requests.shard"
+
+    # Publisher
+    publisher_pool_size: int = 4
+    publisher_confirms: bool = False
+
+    # Consumer engine
+    consumer_prefetch_count: int = 64
+    consumer_concurrency: int = 32
+    consumer_stats_interval: int = 0  # seconds, 0 disables periodic stats logging
+    # Priority lanes: queues "<request queue>.<lane>" consumed next to the request queue itself;
+    # requests waiting for a slot are admitted in proportion to the lane weight (the request queue has 1)
+    request_lanes: dict[str, int] = {}  # e.g. {"interactive": 8}
+    handler_executor: str = "thread"  # "inline" | "thread"
+    handler_workers: int = 4
+    stream_chunk_size: int = 500  # items per chunk of a streamed reply
+    # "objects": slotted records in dicts; "columnar": the tasks table as typed arrays (less memory, slower reads)
+    storage_layout: str = "objects"
     
+    # Logging (src/core/logs.py)
+    log_level: str = "INFO"
+    log_async: bool = True  # format and write records on a background thread
+    log_queue_size: int = 10_000  # records beyond this are dropped rather than blocking the loop
+    log_payload_sample_rate: float = 1.0  # share of message bodies logged, 0 disables
+    log_payload_max_chars: int = 512
+
+    # Metrics (src/core/metrics.py): Prometheus text on http://<host>:<port>/metrics, 0 disables
+    metrics_host: str = "0.0.0.0"
+    metrics_port: int = 0
+    metrics_dump_interval: int = 0  # seconds between per-action summaries in the log, 0 disables
+
+    # Write-ahead log (src/core/wal.py); an empty wal_dir keeps the data in memory only
+    wal_dir: str = ""
+    wal_sync: str = "group"  # "always" | "group" | "periodic" | "os"
+    wal_group_commit_ms: float = 2.0  # flusher period: write (and in group mode fsync) the queued records
+    wal_fsync_interval: float = 1.0  # seconds between fsyncs in periodic mode
+    wal_checkpoint_records: int = 1_000_000  # snapshot and drop old segments after this many records, 0 disables
+
+    # RPC client
+    client_timeout: float = 30.0
+    client_max_in_flight: int = 1000
+
+    # Result cache for read-only actions (src/core/result_cache.py), 0 entries disables
+    result_cache_max_entries: int = 10_000
+    result_cache_max_bytes: int = 64 * 1024 * 1024
+
     # Idempotency
     idempotency_expire_seconds: int = 3600
+    idempotency_max_entries: int = 100_000
+    idempotency_max_bytes: int = 256 * 1024 * 1024
 
 settings = Settings()
 
@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextvars import ContextVar
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage, AbstractQueue
+
+from src.core.config import settings
+from src.core.storage import db
+
+logger = logging.getLogger(__name__)
+
+MessageCallback = Callable[[AbstractIncomingMessage], Awaitable[Any]]
+
+# Messages carrying the same value in this header are processed one at a time, in delivery order
+PARTITION_KEY_HEADER = "x-partition-key"
+
+# Lane (queue name) of the delivery being processed, for the executor's admission order
+current_lane: ContextVar[str] = ContextVar("current_lane", default="")
+
+
+class WeightedSlots:
+    """A semaphore whose waiters are grouped by lane.
+
+    While slots are free it behaves like `asyncio.Semaphore`. When a slot is released
+    and several lanes have waiters, lanes take turns in proportion to their weight
+    (smooth weighted round robin), FIFO within a lane: with weights 8 and 1, eight
+    waiting interactive requests get a slot for every bulk one, yet bulk still moves.
+    """
+
+    def __init__(self, limit: int, weights: Optional[Dict[str, int]] = None) -> None:
+        self.free = limit
+        self.weights: Dict[str, int] = dict(weights or {})
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {}
+        self._credit: Dict[str, int] = {}
+
+    async def acquire(self, lane: str) -> None:
+        if self.free > 0 and not any(self._waiters.values()):
+            self.free -= 1
+            return
+        waiters = self._waiters.get(lane)
+        if waiters is None:
+            waiters = self._waiters[lane] = deque()
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # the slot was handed over just before the cancellation
+            elif future in waiters:
+                waiters.remove(future)
+            raise
+
+    def release(self) -> None:
+        while (lane := self._next_lane()) is not None:
+            future = self._waiters[lane].popleft()
+            if not future.done():  # skip waiters cancelled but not yet resumed
+                future.set_result(None)
+                return
+        self.free += 1
+
+    def _next_lane(self) -> Optional[str]:
+        best = None
+        total = 0
+        for lane, waiters in self._waiters.items():
+            if not waiters:
+                continue
+            weight = self.weights.get(lane, 1)
+            self._credit[lane] = self._credit.get(lane, 0) + weight
+            total += weight
+            if best is None or self._credit[lane] > self._credit[best]:
+                best = lane
+        if best is not None:
+            self._credit[best] -= total
+        return best
+
+
+class HandlerExecutor:
+    """Runs the synchronous registry handlers off the event loop.
+
+    Modes (`settings.handler_executor`):
+    - "inline": call the handler on the loop (old behaviour, lowest overhead for tiny handlers);
+    - "thread": run it in a thread pool so a slow handler does not stall consuming,
+      publishing and acking of other messages.
+
+    Concurrency model: handlers share the in-process `db` and take its read-write lock.
+    Read-only calls (`read_only=True`: get/list actions and stream chunks) hold it
+    shared, so up to `handler_workers` of them run at once and a long list does not
+    hold up short reads; writes (including batches and checkpoints) hold it
+    exclusively, so a handler's check-then-write stays atomic. The GIL still runs one
+    thread's Python at a time: reads interleave rather than use several cores, and
+    the pool costs a thread hop per call. Its point is keeping slow handlers off the
+    loop; more cores need more processes (src/cluster.py). At most `handler_workers`
+    calls are submitted at a time, the rest wait in lane order (`WeightedSlots`), so a
+    request from a priority lane does not queue behind every bulk request already admitted.
+    """
+
+    def __init__(self) -> None:
+        self.mode = settings.handler_executor
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self.slots = WeightedSlots(settings.handler_workers)
+
+    @staticmethod
+    def _locked_call(read_only: bool, handler: Callable[..., Any], *args: Any) -> Any:
+        with db.lock.reading() if read_only else db.lock.writing():
+            return handler(*args)
+
+    async def run(self, handler: Callable[..., Any], *args: Any, read_only: bool = False) -> Any:
+        if self.mode == "inline":
+            return handler(*args)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=settings.handler_workers, thread_name_prefix="handler"
+            )
+        loop = asyncio.get_running_loop()
+        await self.slots.acquire(current_lane.get())
+        try:
+            return await loop.run_in_executor(self._pool, self._locked_call, read_only, handler, *args)
+        finally:
+            self.slots.release()
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+class ConsumerEngine:
+    """Consumes one or more queues with a prefetch window and a bounded number of concurrent callbacks.
+
+    `queued` counts deliveries waiting for a free slot, `in_flight` the callbacks
+    currently running; together with `prefetch_count` they show whether the engine
+    is limited by the broker window, by concurrency or by the handlers themselves.
+
+    Deliveries with an `x-partition-key` header are chained per key, so writes to
+    one entity keep their order while other keys still run concurrently.
+
+    `start()` may be called for several queues (priority lanes), each on its own
+    channel so that a backlog in one lane does not use up the prefetch window of
+    another. The lanes share the concurrency slots by `weights` (queue name ->
+    weight, default 1).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        on_message: MessageCallback,
+        prefetch_count: int | None = None,
+        concurrency: int | None = None,
+        weights: Dict[str, int] | None = None,
+    ) -> None:
+        self.name = name
+        self.on_message = on_message
+        self.prefetch_count = prefetch_count or settings.consumer_prefetch_count
+        self.concurrency = concurrency or settings.consumer_concurrency
+        self.queued = 0
+        self.in_flight = 0
+        self.processed = 0
+        self._slots = WeightedSlots(self.concurrency, weights)
+        handler_executor.slots.weights.update(weights or {})
+        self._key_locks: Dict[str, asyncio.Lock] = {}
+        self._key_refs: Dict[str, int] = {}
+        self._stats_task: Optional[asyncio.Task] = None
+
+    async def start(self, channel: AbstractChannel, queue: AbstractQueue) -> None:
+        await channel.set_qos(prefetch_count=self.prefetch_count)
+        await queue.consume(partial(self._dispatch, lane=queue.name))
+        if settings.consumer_stats_interval > 0 and self._stats_task is None:
+            self._stats_task = asyncio.create_task(self._log_stats())
+        logger.info(
+            f"Engine {self.name} consuming {queue.name} "
+            f"(prefetch={self.prefetch_count}, concurrency={self.concurrency}, "
+            f"weight={self._slots.weights.get(queue.name, 1)}, executor={handler_executor.mode})"
+        )
+
+    async def _dispatch(self, message: AbstractIncomingMessage, lane: str = "") -> None:
+        key = (message.headers or {}).get(PARTITION_KEY_HEADER)
+        if key is None:
+            await self._run(message, lane)
+            return
+        # The lock is taken before the first await, so waiters queue up in delivery order
+        lock = self._key_locks.get(key)
+        if lock is None:
+            lock = self._key_locks[key] = asyncio.Lock()
+        self._key_refs[key] = self._key_refs.get(key, 0) + 1
+        try:
+            async with lock:
+                await self._run(message, lane)
+        finally:
+            self._key_refs[key] -= 1
+            if not self._key_refs[key]:
+                del self._key_refs[key]
+                del self._key_locks[key]
+
+    async def _run(self, message: AbstractIncomingMessage, lane: str = "") -> None:
+        self.queued += 1
+        try:
+            await self._slots.acquire(lane)
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        current_lane.set(lane)
+        try:
+            await self.on_message(message)
+        finally:
+            self.in_flight -= 1
+            self.processed += 1
+            self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "prefetch_count": self.prefetch_count,
+            "concurrency": self.concurrency,
+        }
+
+    async def _log_stats(self) -> None:
+        while True:
+            await asyncio.sleep(settings.consumer_stats_interval)
+            logger.info(f"Engine {self.name} stats: {self.stats()}")
+
+    async def stop(self) -> None:
+        if self._stats_task is not None:
+            self._stats_task.cancel()
+            self._stats_task = None
+
+
+handler_executor = HandlerExecutor()
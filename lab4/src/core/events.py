@@ -0,0 +1,183 @@
+"""Change events: committed InMemoryDB mutations, published in batches to a topic exchange.
+
+Instead of polling `list_*`, a consumer that keeps its own copy of projects, tasks
+or users (a cache, a search index) binds a queue to `settings.events_exchange` with
+the routing key `project`, `task` or `user` (or `#`) and applies the changes.
+Events are off by default (`events_exchange = ""`): when on, every write costs an
+extra publish per flush and a row version counter per changed row.
+
+Every row a committed mutation changes becomes one event, whichever action or batch
+made it (rolled-back atomic batches make none):
+
+    {"version": 17, "op": "update", "id": 42, "row_version": 3, "fields": {"completed": true}}
+
+- `version` numbers the changes of one entity type in this server process (1, 2, ...),
+  so a lost message shows up as a gap;
+- `row_version` numbers the changes of one row in this process (1 for the first event
+  of the row): a consumer that sees a lower or equal one than it holds skips the event;
+- `fields`: the values a row was created with for "create", the fields that were set
+  for "update", none for "delete". Cascades are events too: deleting a project gives
+  a "delete" event per task of the project, deleting a user an "update" event with
+  `{"user_id": null}` per task it was assigned.
+
+Mutations are queued in commit order by the db listener (in the handler executor,
+under the db lock) and turned into events and published from the event loop
+`events_flush_ms` after the first unpublished one: one
+message per entity type and flush, at most `events_batch_size` events each, routing
+key = entity type, body (codec of `settings.default_content_type`)
+
+    {"source": "api.requests", "epoch": "<id of this run>", "entity": "task", "events": [...]}
+
+Delivery is best effort: events still buffered at a crash, or whose publish failed,
+are lost. A gap or a new `epoch` (restart: versions start over) means the consumer
+should re-list and continue from there.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from aio_pika import ExchangeType, Message
+
+from src.core.codecs import get_codec
+from src.core.config import settings
+from src.core.storage import InMemoryDB, Mutation, mutation_arguments
+
+logger = logging.getLogger(__name__)
+
+ENTITIES = ("project", "task", "user")
+
+
+def describe(mutation: Mutation) -> List[Tuple[str, str, Optional[int], Dict[str, Any]]]:
+    # (entity, op, id, fields) of every row a mutation changed: "update_task" -> [("task", "update", ...)]
+    op, _, rest = mutation.op.partition("_")
+    entity = rest.split("_")[0]  # create_task_v2 -> task
+    arguments = mutation_arguments(mutation)
+    if op == "create":
+        return [(entity, op, mutation.id, arguments)]
+    entity_id = arguments.pop(f"{entity}_id")
+    if op == "delete":
+        # tasks of a deleted project are deleted, tasks of a deleted user unassigned
+        cascade_op, cascade_fields = ("delete", {}) if entity == "project" else ("update", {"user_id": None})
+        return [(entity, op, entity_id, {})] + [("task", cascade_op, tid, cascade_fields) for tid in mutation.cascade]
+    return [(entity, op, entity_id, {name: value for name, value in arguments.items() if value is not None})]
+
+
+class ChangeEvents:
+    def __init__(self) -> None:
+        self.exchange_name = settings.events_exchange
+        self.source = ""
+        self.codec = get_codec(settings.default_content_type)
+        self.epoch = uuid.uuid4().hex[:12]
+        self.versions: Dict[str, int] = dict.fromkeys(ENTITIES, 0)
+        # entity -> row id -> row_version of its last event; deleted rows are dropped
+        self.row_versions: Dict[str, Dict[int, int]] = {entity: {} for entity in ENTITIES}
+        self.produced = 0
+        self.published = 0
+        self.messages = 0
+        self.failed = 0
+        self.db: Optional[InMemoryDB] = None
+        self._exchange = None
+        self._channel = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._buffer: List[Mutation] = []
+        self._lock = threading.Lock()  # the buffer is filled from executor threads
+        self._publishing: Optional[asyncio.Lock] = None  # one flush at a time keeps the order
+        self._flush_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.exchange_name)
+
+    async def start(self, connection, db: InMemoryDB, source: str) -> None:
+        if not self.enabled:
+            return
+        self._channel = await connection.channel()
+        self._exchange = await self._channel.declare_exchange(self.exchange_name, ExchangeType.TOPIC, durable=True)
+        self.db = db
+        self.source = source
+        self._loop = asyncio.get_running_loop()
+        self._publishing = asyncio.Lock()
+        db.listeners.append(self._on_mutations)
+        logger.info(f"Publishing change events of {source} to {self.exchange_name} (epoch {self.epoch})")
+
+    def _on_mutations(self, mutations: List[Mutation]) -> None:
+        # Runs where the mutation ran, an executor thread holding the db lock: only queue them
+        with self._lock:
+            first = not self._buffer
+            self._buffer.extend(mutations)
+        if first:
+            self._loop.call_soon_threadsafe(self._schedule)
+
+    def _schedule(self) -> None:
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(settings.events_flush_ms / 1000)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        async with self._publishing:
+            with self._lock:
+                mutations, self._buffer = self._buffer, []
+            by_entity: Dict[str, List[Dict[str, Any]]] = {}
+            for mutation in mutations:
+                for entity, op, entity_id, fields in describe(mutation):
+                    self.versions[entity] += 1
+                    rows = self.row_versions[entity]
+                    row_version = rows.get(entity_id, 0) + 1
+                    if op == "delete":
+                        rows.pop(entity_id, None)
+                    else:
+                        rows[entity_id] = row_version
+                    event = {
+                        "version": self.versions[entity], "op": op, "id": entity_id,
+                        "row_version": row_version, "fields": fields,
+                    }
+                    by_entity.setdefault(entity, []).append(event)
+                    self.produced += 1
+            size = settings.events_batch_size
+            for entity, items in by_entity.items():
+                for i in range(0, len(items), size):
+                    await self._publish(entity, items[i:i + size])
+
+    async def _publish(self, entity: str, events: List[Dict[str, Any]]) -> None:
+        body = self.codec.dumps({"source": self.source, "epoch": self.epoch, "entity": entity, "events": events})
+        try:
+            await self._exchange.publish(Message(body, content_type=self.codec.content_type), routing_key=entity)
+        except Exception as e:
+            # Consumers see the gap in versions and re-list
+            self.failed += len(events)
+            logger.error(f"Could not publish {len(events)} {entity} events: {e}")
+            return
+        self.messages += 1
+        self.published += len(events)
+
+    async def stop(self) -> None:
+        if self.db is None:
+            return
+        self.db.listeners.remove(self._on_mutations)
+        self.db = None
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+        if not self._channel.is_closed:
+            await self._channel.close()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "produced": self.produced,
+            "published": self.published,
+            "messages": self.messages,
+            "failed": self.failed,
+            "buffered": len(self._buffer),  # mutations not turned into events yet
+        }
+
+
+events = ChangeEvents()
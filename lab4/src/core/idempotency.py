@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    content_type: str
+
+
+# (key, body, content_type, ttl seconds), called after every put
+PutListener = Callable[[str, bytes, str, float], None]
+
+
+class IdempotencyStore:
+    """Request id -> final response bytes, bounded by TTL, entry count and total size.
+
+    Entries are kept in LRU order: a hit moves the key to the end, eviction pops from
+    the front. Expired entries are dropped on access and swept from the front on
+    every insert, so the store never holds much more than `max_entries`.
+    The cached value is the exact reply body (with its content type), so a duplicate
+    is answered without rebuilding or re-serializing the response.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, max_bytes: int = 0) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes  # 0 = no size cap
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict[str, Tuple[float, CachedResponse]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.listeners: List[PutListener] = []
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if entry[0] <= time.monotonic():
+                self._drop(key, expired=True)
+                return False
+            return True
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] <= time.monotonic():
+                self._drop(key, expired=True)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, body: bytes, content_type: str, ttl: Optional[float] = None) -> None:
+        # ttl overrides ttl_seconds, e.g. for entries restored with their remaining lifetime
+        ttl = self.ttl_seconds if ttl is None else ttl
+        with self._lock:
+            now = time.monotonic()
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (now + ttl, CachedResponse(body, content_type))
+            self.size_bytes += len(body)
+            self._sweep(now)
+        for listener in self.listeners:
+            listener(key, body, content_type, ttl)
+
+    def entries(self) -> List[Tuple[str, bytes, str, float]]:
+        # Live entries in LRU order as (key, body, content_type, remaining ttl)
+        with self._lock:
+            now = time.monotonic()
+            return [
+                (key, cached.body, cached.content_type, expires_at - now)
+                for key, (expires_at, cached) in self._entries.items()
+                if expires_at > now
+            ]
+
+    def _drop(self, key: str, expired: bool = False) -> None:
+        _, cached = self._entries.pop(key)
+        self.size_bytes -= len(cached.body)
+        if expired:
+            self.expirations += 1
+
+    def _sweep(self, now: float) -> None:
+        entries = self._entries
+        while entries:
+            key, (expires_at, _) = next(iter(entries.items()))
+            if expires_at <= now:
+                self._drop(key, expired=True)
+            elif len(entries) > self.max_entries or (self.max_bytes and self.size_bytes > self.max_bytes):
+                self._drop(key)
+                self.evictions += 1
+            else:
+                break
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
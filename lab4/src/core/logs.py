@@ -0,0 +1,109 @@
+"""Logging setup for the server hot path.
+
+`setup_logging()` replaces `logging.basicConfig`: with `LOG_ASYNC` the root logger
+gets a QueueHandler, and a QueueListener thread formats and writes the records, so
+the event loop only pays for creating a record. The queue is bounded; when the writer
+falls behind records are dropped and counted instead of blocking the loop.
+
+Message bodies are logged through `log_payload()`: sampled (`LOG_PAYLOAD_SAMPLE_RATE`)
+and truncated (`LOG_PAYLOAD_MAX_CHARS`), and decoded only when the record is
+formatted, on the listener thread.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, TextIO
+
+from src.core.config import settings
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class Payload:
+    # Lazily rendered message body: the raw bytes are kept as is and only decoded
+    # and truncated if a handler actually formats the record
+    __slots__ = ("body", "limit")
+
+    def __init__(self, body: bytes, limit: int) -> None:
+        self.body = body
+        self.limit = limit
+
+    def __str__(self) -> str:
+        if len(self.body) <= self.limit:
+            return self.body.decode("utf-8", "replace")
+        return f"{self.body[:self.limit].decode('utf-8', 'replace')}... ({len(self.body)} bytes)"
+
+
+class DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The base class formats the message here, on the caller's thread; formatting is
+        # left to the listener instead. Only exception info is rendered now, while it exists.
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: Optional[DroppingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(level: Optional[str] = None, stream: Optional[TextIO] = None) -> None:
+    global _handler, _listener
+    if _listener is not None or logging.getLogger().handlers:
+        return  # already configured (by an earlier import or by the application)
+
+    root = logging.getLogger()
+    root.setLevel(level or settings.log_level)
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    if not settings.log_async:
+        root.addHandler(output)
+        return
+
+    _handler = DroppingQueueHandler(queue.Queue(maxsize=settings.log_queue_size))
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    root.addHandler(_handler)
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    # Writes out whatever is still queued and stops the listener thread
+    global _handler, _listener
+    if _listener is not None:
+        _listener.stop()
+        logging.getLogger().removeHandler(_handler)
+        _listener = None
+        _handler = None
+
+
+def log_stats() -> Dict[str, int]:
+    if _handler is None:
+        return {"queued": 0, "dropped": 0}
+    return {"queued": _handler.queue.qsize(), "dropped": _handler.dropped}
+
+
+def log_payload(logger: logging.Logger, message: str, body: bytes) -> None:
+    # INFO line with a sampled, truncated copy of a message body
+    rate = settings.log_payload_sample_rate
+    if rate <= 0 or not logger.isEnabledFor(logging.INFO):
+        return
+    if rate < 1 and random.random() >= rate:
+        return
+    logger.info("%s: %s", message, Payload(body, settings.log_payload_max_chars))
@@ -0,0 +1,215 @@
+"""Process-local metrics in the Prometheus text format, without extra dependencies.
+
+- `rpc_requests_total{version, action, outcome}`: outcome is ok, error, duplicate, retry, dlq or shed
+  (expired before dispatch);
+- `rpc_phase_seconds{version, action, phase}`: histogram per phase (decode, validate, handler, publish);
+- `rpc_in_flight{version, action}`: requests currently being handled;
+- gauges registered with `register()` (engine, idempotency, retry, WAL and change event stats).
+
+All updates happen on the event loop, so no locking is needed. The text is served on
+`GET /metrics` at `settings.metrics_port` and/or dumped to the log every
+`settings.metrics_dump_interval` seconds.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# seconds; tuned for an in-process handler plus one AMQP publish
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+Labels = Tuple[str, str]  # (version, action)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th observation (what a dashboard would show)
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels: str) -> str:
+    return ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items())
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.requests: Dict[Tuple[str, str, str], int] = {}
+        self.phases: Dict[Tuple[str, str, str], Histogram] = {}
+        self.in_flight: Dict[Labels, int] = {}
+        self._gauges: List[Tuple[str, Dict[str, str], Callable[[], Dict[str, float]]]] = []
+
+    def count(self, labels: Labels, outcome: str) -> None:
+        key = (*labels, outcome)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    def observe(self, labels: Labels, phase: str, seconds: float) -> None:
+        key = (*labels, phase)
+        histogram = self.phases.get(key)
+        if histogram is None:
+            histogram = self.phases[key] = Histogram()
+        histogram.observe(seconds)
+
+    @contextmanager
+    def timed(self, labels: Labels, phase: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(labels, phase, time.perf_counter() - started)
+
+    @contextmanager
+    def track(self, labels: Labels) -> Iterator[None]:
+        self.in_flight[labels] = self.in_flight.get(labels, 0) + 1
+        try:
+            yield
+        finally:
+            self.in_flight[labels] -= 1
+
+    def register(self, prefix: str, labels: Dict[str, str], stats: Callable[[], Dict[str, float]]) -> None:
+        # Exposes every numeric field of stats() as a gauge `<prefix>_<field>{labels}`
+        self._gauges.append((prefix, labels, stats))
+
+    def unregister(self, stats: Callable[[], Dict[str, float]]) -> None:
+        self._gauges = [gauge for gauge in self._gauges if gauge[2] != stats]
+
+    def reset(self) -> None:
+        self.requests.clear()
+        self.phases.clear()
+        self.in_flight.clear()
+
+    def render(self) -> str:
+        lines = [
+            "# HELP rpc_requests_total Requests by outcome (ok, error, duplicate, retry, dlq, shed).",
+            "# TYPE rpc_requests_total counter",
+        ]
+        for (version, action, outcome), value in sorted(self.requests.items()):
+            lines.append(f"rpc_requests_total{{{_labels(version=version, action=action, outcome=outcome)}}} {value}")
+
+        lines += [
+            "# HELP rpc_phase_seconds Time spent per processing phase.",
+            "# TYPE rpc_phase_seconds histogram",
+        ]
+        for (version, action, phase), histogram in sorted(self.phases.items()):
+            base = _labels(version=version, action=action, phase=phase)
+            cumulative = 0
+            for bound, n in zip((*histogram.buckets, "+Inf"), histogram.counts):
+                cumulative += n
+                lines.append(f'rpc_phase_seconds_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f"rpc_phase_seconds_sum{{{base}}} {histogram.sum:.6f}")
+            lines.append(f"rpc_phase_seconds_count{{{base}}} {histogram.count}")
+
+        lines += [
+            "# HELP rpc_in_flight Requests currently being handled.",
+            "# TYPE rpc_in_flight gauge",
+        ]
+        for (version, action), value in sorted(self.in_flight.items()):
+            lines.append(f"rpc_in_flight{{{_labels(version=version, action=action)}}} {value}")
+
+        # several sources may share a prefix (one engine per queue), TYPE goes once per name
+        gauges: Dict[str, List[str]] = {}
+        for prefix, labels, stats in self._gauges:
+            for field, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    name = f"{prefix}_{field}"
+                    sample = f"{name}{{{_labels(**labels)}}} {value}" if labels else f"{name} {value}"
+                    gauges.setdefault(name, []).append(sample)
+        for name, samples in gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines += samples
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> List[str]:
+        # One line per action, busiest first: request count, outcomes and handler p50/p99
+        totals: Dict[Labels, Dict[str, int]] = {}
+        for (version, action, outcome), value in self.requests.items():
+            totals.setdefault((version, action), {})[outcome] = value
+        lines = []
+        for labels, outcomes in sorted(totals.items(), key=lambda item: -sum(item[1].values())):
+            handler = self.phases.get((*labels, "handler"))
+            timing = f" handler p50<={handler.quantile(0.5) * 1000:g}ms p99<={handler.quantile(0.99) * 1000:g}ms" if handler else ""
+            lines.append(f"{labels[0]}/{labels[1]} n={sum(outcomes.values())} {outcomes}{timing}")
+        return lines
+
+
+metrics = Metrics()
+
+
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    # Just enough HTTP/1.0 for a Prometheus scrape or curl
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass  # skip headers
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?", 1)[0] == "/metrics":
+            status, body = "200 OK", metrics.render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+async def _dump_periodically(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        for line in metrics.summary():
+            logger.info(f"Metrics: {line}")
+
+
+class MetricsExporter:
+    def __init__(self) -> None:
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._dump_task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if settings.metrics_port and self._server is None:
+            self._server = await asyncio.start_server(_handle_http, settings.metrics_host, settings.metrics_port)
+            logger.info(f"Metrics on http://{settings.metrics_host}:{settings.metrics_port}/metrics")
+        if settings.metrics_dump_interval > 0 and self._dump_task is None:
+            self._dump_task = asyncio.create_task(_dump_periodically(settings.metrics_dump_interval))
+
+    async def stop(self) -> None:
+        if self._dump_task is not None:
+            self._dump_task.cancel()
+            self._dump_task = None
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+exporter = MetricsExporter()
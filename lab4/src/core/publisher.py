@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import zlib
+from typing import List, Optional
+
+from aio_pika import Message
+from aio_pika.abc import AbstractChannel, AbstractConnection
+from aio_pika.exceptions import AMQPError, ChannelInvalidStateError
+
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Publisher:
+    """Long-lived publisher sharing a pool of channels on the server connection.
+
+    Channels are opened once in `start()` and handed out round-robin, so a reply
+    costs one basic.publish instead of a TCP + AMQP handshake. Where order matters,
+    `pin=True` sends everything for a routing key over one channel. A closed channel
+    (broker restart, channel error) is reopened lazily on next use.
+
+    With `publisher_confirms` enabled `publish()` returns only once the broker has
+    confirmed the message and raises if it was nacked (`DeliveryError`) or the channel
+    broke, so a request is acked only after its reply is safe and a failed reply goes
+    through the retry path. Handlers publishing concurrently share the pool's channels
+    and the broker confirms their messages together (basic.ack with `multiple`), so
+    waiting for the confirm adds latency to a reply but does not serialize them.
+    """
+
+    def __init__(self) -> None:
+        self.connection: Optional[AbstractConnection] = None
+        self.confirms = settings.publisher_confirms
+        self._channels: List[Optional[AbstractChannel]] = []
+        self._rr = itertools.cycle([0])
+        self._reopen_lock = asyncio.Lock()
+
+    async def start(self, connection: AbstractConnection, pool_size: int | None = None) -> None:
+        self.connection = connection
+        size = max(1, pool_size or settings.publisher_pool_size)
+        self._channels = [await self._open_channel() for _ in range(size)]
+        self._rr = itertools.cycle(range(size))
+        logger.info(f"Publisher started with {size} channels (confirms={self.confirms})")
+
+    async def _open_channel(self) -> AbstractChannel:
+        return await self.connection.channel(publisher_confirms=self.confirms)
+
+    async def _channel(self, idx: Optional[int] = None) -> AbstractChannel:
+        if self.connection is None:
+            raise RuntimeError("Publisher is not started")
+        if idx is None:
+            idx = next(self._rr)
+        channel = self._channels[idx]
+        if channel is None or channel.is_closed:
+            async with self._reopen_lock:
+                channel = self._channels[idx]
+                if channel is None or channel.is_closed:
+                    logger.warning(f"Publisher channel {idx} is closed, reopening")
+                    channel = await self._open_channel()
+                    self._channels[idx] = channel
+        return channel
+
+    async def publish(self, message: Message, routing_key: str, pin: bool = False) -> None:
+        # With confirms, resolves on the broker ack; a nack raises after the one retry.
+        # pin: every message to this routing key goes over the same channel, because the
+        # broker keeps the order of messages only within a channel.
+        idx = zlib.crc32(routing_key.encode()) % len(self._channels) if pin and self._channels else None
+        try:
+            channel = await self._channel(idx)
+            await channel.default_exchange.publish(message, routing_key=routing_key)
+        except (ChannelInvalidStateError, AMQPError) as e:
+            # One retry, on a fresh channel or the reopened pinned one; a robust connection restores itself underneath.
+            logger.warning(f"Publish to {routing_key} failed ({e}), retrying on a new channel")
+            channel = await self._channel(idx)
+            await channel.default_exchange.publish(message, routing_key=routing_key)
+
+    async def close(self) -> None:
+        for channel in self._channels:
+            if channel is not None and not channel.is_closed:
+                await channel.close()
+        self._channels = []
+        self.connection = None
+
+
+publisher = Publisher()
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from src.core.config import settings
+
+
+class ResultCache:
+    """Encoded results of read-only actions, checked against collection versions.
+
+    An entry holds the `data` part of a reply, encoded with the request's codec, and
+    the versions of the collections the action reads (`InMemoryDB.versions`) at the
+    time it ran. A lookup with different versions is stale: some write happened since,
+    so the entry is dropped and the action runs again. Nothing has to be invalidated
+    explicitly, and a write costs one counter increment per collection.
+
+    Bounded like the idempotency store: LRU order, `max_entries` and `max_bytes`.
+    Used from the event loop thread only, so there is no lock.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int = 0) -> None:
+        self.max_entries = max_entries  # 0 disables the cache
+        self.max_bytes = max_bytes  # 0 = no size cap
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, Tuple[Tuple[int, ...], bytes]] = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, versions: Tuple[int, ...]) -> Optional[bytes]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] == versions:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._drop(key)
+            self.stale += 1
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, versions: Tuple[int, ...], data: bytes) -> None:
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = (versions, data)
+        self.size_bytes += len(data)
+        while len(self._entries) > self.max_entries or (self.max_bytes and self.size_bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _drop(self, key: Hashable) -> None:
+        _, data = self._entries.pop(key)
+        self.size_bytes -= len(data)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.size_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+result_cache = ResultCache(settings.result_cache_max_entries, settings.result_cache_max_bytes)
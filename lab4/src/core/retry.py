@@ -0,0 +1,119 @@
+"""Delayed redelivery of failed requests before they are dead-lettered.
+
+A request whose processing fails unexpectedly (a broken publish, a failed WAL write;
+validation and handler errors are answered, not retried) is republished to a delay
+queue `<queue>.retry.<delay_ms>`. Delay queues have no consumers: the broker expires
+each message after the queue's `x-message-ttl` and dead-letters it through the
+default exchange back to `<queue>`. With one queue per tier every message in a queue
+has the same TTL, so a short delay never waits behind a long one.
+
+The number of retries so far travels in `x-retry-count`; retry n waits
+`retry_delays_ms[n]` (the last tier repeats). After `retry_max_attempts` retries the
+message goes to `settings.queue_dlq` with `x-dlq-reason`. A repeated delivery is
+answered from the idempotency cache if the first attempt got as far as caching.
+"""
+from __future__ import annotations
+
+import logging
+from typing import Dict, Optional
+
+from aio_pika import Message
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage
+
+from src.core.config import settings
+from src.core.publisher import publisher
+
+logger = logging.getLogger(__name__)
+
+RETRY_COUNT_HEADER = "x-retry-count"
+RETRY_ERROR_HEADER = "x-retry-error"  # error of the last failed attempt
+DLQ_REASON_HEADER = "x-dlq-reason"
+
+
+def retry_queue(queue_name: str, delay_ms: int) -> str:
+    return f"{queue_name}.retry.{delay_ms}"
+
+
+def retry_count(message: AbstractIncomingMessage) -> int:
+    try:
+        return int((message.headers or {}).get(RETRY_COUNT_HEADER, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _copy(message: AbstractIncomingMessage, headers: Dict[str, object]) -> Message:
+    return Message(
+        body=message.body,
+        content_type=message.content_type,
+        correlation_id=message.correlation_id,
+        reply_to=message.reply_to,
+        message_id=message.message_id,
+        priority=message.priority,
+        headers=headers,
+    )
+
+
+class RetryPolicy:
+    def __init__(self) -> None:
+        self.queue_name: Optional[str] = None
+        self.queues: set[str] = set()  # every queue with delay queues; the first is queue_name
+        self.scheduled = 0
+        self.dead_lettered = 0
+        self.exhausted = 0  # dead-lettered after the last retry
+
+    @property
+    def delays(self) -> list[int]:
+        return settings.retry_delays_ms
+
+    async def declare(self, channel: AbstractChannel, queue_name: str) -> None:
+        # One delay queue per tier, dead-lettering back into queue_name
+        if self.queue_name is None:
+            self.queue_name = queue_name
+        self.queues.add(queue_name)
+        if settings.retry_max_attempts <= 0:
+            return
+        for delay in self.delays:
+            await channel.declare_queue(
+                retry_queue(queue_name, delay),
+                durable=True,
+                arguments={
+                    "x-message-ttl": delay,
+                    "x-dead-letter-exchange": "",
+                    "x-dead-letter-routing-key": queue_name,
+                },
+            )
+
+    async def handle_failure(self, message: AbstractIncomingMessage, error: str) -> str:
+        """Schedules another attempt or dead-letters the message; returns "retry" or "dlq"."""
+        attempts = retry_count(message)
+        if self.queue_name is None or not self.delays or attempts >= settings.retry_max_attempts:
+            if attempts:
+                self.exhausted += 1
+                error = f"{error} (after {attempts} retries)"
+            await self.dead_letter(message, error)
+            return "dlq"
+
+        delay = self.delays[min(attempts, len(self.delays) - 1)]
+        # back to the lane it came from (the routing key of a default-exchange delivery is the queue)
+        queue_name = message.routing_key if message.routing_key in self.queues else self.queue_name
+        headers = dict(message.headers or {})
+        headers[RETRY_COUNT_HEADER] = attempts + 1
+        headers[RETRY_ERROR_HEADER] = error
+        await publisher.publish(_copy(message, headers), routing_key=retry_queue(queue_name, delay))
+        self.scheduled += 1
+        logger.warning(f"Retry {attempts + 1}/{settings.retry_max_attempts} in {delay} ms: {error}")
+        return "retry"
+
+    async def dead_letter(self, message: AbstractIncomingMessage, reason: str) -> None:
+        headers = dict(message.headers or {})
+        headers[DLQ_REASON_HEADER] = reason
+        headers.pop(RETRY_ERROR_HEADER, None)
+        await publisher.publish(_copy(message, headers), routing_key=settings.queue_dlq)
+        self.dead_lettered += 1
+        logger.info("Sent message to DLQ: %s", reason)
+
+    def stats(self) -> Dict[str, int]:
+        return {"scheduled": self.scheduled, "dead_lettered": self.dead_lettered, "exhausted": self.exhausted}
+
+
+retries = RetryPolicy()
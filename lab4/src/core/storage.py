@@ -1,8 +1,17 @@
 from __future__ import annotations
 
+import functools
+import inspect
 import threading
-from dataclasses import dataclass, field
-from typing import Dict, Optional, Any
+from array import array
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, field, fields
+from operator import attrgetter
+from typing import Any, Callable, Dict, Iterator, List, MutableMapping, NamedTuple, Optional, Tuple
+
+from src.core.config import settings
+from src.core.idempotency import IdempotencyStore
 
 
 _id_lock = threading.Lock()
@@ -14,14 +23,77 @@ def _next_id(counter: Dict[str, int], key: str) -> int:
         return counter[key]
 
 
-@dataclass
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+class Mutation(NamedTuple):
+    # One successful call of a state-changing InMemoryDB method, enough to repeat it
+    op: str
+    args: tuple
+    kwargs: Dict[str, Any]
+    # id of the row it returned (created or updated), for change events; not logged
+    id: Optional[int] = None
+    # ids of the tasks a delete_project / delete_user cascaded to, for change events; not logged
+    cascade: Tuple[int, ...] = ()
+
+
+MutationListener = Callable[[List[Mutation]], None]
+
+# op name -> undecorated method, used to re-apply logged mutations
+_mutations: Dict[str, Callable[..., Any]] = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _parameters(op: str) -> Tuple[Tuple[str, ...], Dict[str, Any]]:
+    # parameter names of a mutation method (without self) and their defaults
+    parameters = list(inspect.signature(_mutations[op]).parameters.values())[1:]
+    return tuple(p.name for p in parameters), {p.name: p.default for p in parameters if p.default is not p.empty}
+
+
+def mutation_arguments(mutation: Mutation) -> Dict[str, Any]:
+    # The call's arguments by parameter name, defaults included
+    names, defaults = _parameters(mutation.op)
+    arguments = dict.fromkeys(names)
+    arguments.update(defaults)
+    arguments.update(zip(names, mutation.args))
+    arguments.update(mutation.kwargs)
+    return arguments
+
+
+def _mutation(*collections: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    # Marks a state-changing method: every successful call bumps the versions of the
+    # collections it changes (result cache) and is reported to db.listeners (write-ahead log)
+    def decorate(method: Callable[..., Any]) -> Callable[..., Any]:
+        op = method.__name__
+        _mutations[op] = method
+
+        @functools.wraps(method)
+        def wrapper(self: "InMemoryDB", *args: Any, **kwargs: Any) -> Any:
+            result = method(self, *args, **kwargs)
+            versions = self.versions
+            for name in collections:
+                versions[name] += 1
+            if self.listeners:
+                if isinstance(result, list):  # a cascading delete returns the task ids it changed
+                    self._report(Mutation(op, args, kwargs, None, tuple(result)))
+                else:
+                    self._report(Mutation(op, args, kwargs, getattr(result, "id", None)))
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+@dataclass(slots=True)
 class Project:
     id: int
     name: str
     description: str = ""
 
 
-@dataclass
+@dataclass(slots=True)
 class Task:
     id: int
     project_id: int
@@ -33,33 +105,434 @@ class Task:
     user_id: Optional[int] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class User:
     id: int
     name: str
     email: str
 
 
+_NULL = -2**63  # None in an int64 column
+
+
+def _column(name: str, nullable: bool = False) -> property:
+    def get(view: "TaskView") -> Any:
+        value = getattr(view._table, name)[view._pos]
+        return None if nullable and value == _NULL else value
+
+    def set(view: "TaskView", value: Any) -> None:
+        getattr(view._table, name)[view._pos] = _NULL if value is None else value
+
+    return property(get, set)
+
+
+class TaskView:
+    # One row of a TaskColumns table with the attributes of Task, readable and writable
+    __slots__ = ("_table", "_pos")
+
+    def __init__(self, table: "TaskColumns", pos: int) -> None:
+        self._table = table
+        self._pos = pos
+
+    id = property(lambda view: view._table.ids[view._pos])
+    project_id = _column("project_ids")
+    title = _column("titles")
+    completed = property(
+        lambda view: bool(view._table.completed[view._pos]),
+        lambda view, value: view._table.completed.__setitem__(view._pos, value),
+    )
+    priority = _column("priorities", nullable=True)
+    user_id = _column("user_ids", nullable=True)
+
+    def __repr__(self) -> str:
+        return repr(Task(*_task_row(self)))
+
+
+class TaskColumns(MutableMapping[int, Task]):
+    """The tasks table stored column-wise (`settings.storage_layout = "columnar"`).
+
+    Numeric fields live in int64 arrays and titles in a list, so a row costs about
+    40 bytes plus its title instead of a record object, its id int and a dict entry.
+    Rows are read as TaskView objects, which behave like Task, so InMemoryDB and the
+    handlers use the table like the dict it replaces. Ids must be added in ascending
+    order (they come from a counter), which keeps `ids` sorted for bisect lookups.
+    A deleted row keeps its slot with a NULL project_id; its title is released.
+    """
+
+    def __init__(self) -> None:
+        self.ids = array("q")
+        self.project_ids = array("q")
+        self.titles: List[Optional[str]] = []
+        self.completed = array("b")
+        self.priorities = array("q")
+        self.user_ids = array("q")
+        self._live = 0
+
+    def _find(self, task_id: int) -> int:
+        ids = self.ids
+        # Ids come from one counter with a fixed stride, so the row is usually at a computed
+        # position; after gaps (a table loaded from a snapshot) bisect finds it
+        pos = -1
+        if len(ids) > 1 and isinstance(task_id, int):
+            guess, rest = divmod(task_id - ids[0], ids[1] - ids[0])
+            if not rest and 0 <= guess < len(ids) and ids[guess] == task_id:
+                pos = guess
+        if pos < 0:
+            pos = bisect_left(ids, task_id)
+            if pos == len(ids) or ids[pos] != task_id:
+                raise KeyError(task_id)
+        if self.project_ids[pos] == _NULL:
+            raise KeyError(task_id)
+        return pos
+
+    def __getitem__(self, task_id: int) -> TaskView:
+        return TaskView(self, self._find(task_id))
+
+    def __contains__(self, task_id: object) -> bool:
+        try:
+            self._find(task_id)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __setitem__(self, task_id: int, task: Task) -> None:
+        if self.ids and task_id <= self.ids[-1]:
+            # overwrite of an existing slot; a deleted row is revived (rollback of a batch)
+            pos = bisect_left(self.ids, task_id)
+            if pos == len(self.ids) or self.ids[pos] != task_id:
+                raise ValueError(f"Task ids must be added in ascending order, got {task_id}")
+            if self.project_ids[pos] == _NULL:
+                self._live += 1
+            view = TaskView(self, pos)
+            for name in ("project_id", "title", "completed", "priority", "user_id"):
+                setattr(view, name, getattr(task, name))
+            return
+        self.ids.append(task_id)
+        self.project_ids.append(task.project_id)
+        self.titles.append(task.title)
+        self.completed.append(task.completed)
+        self.priorities.append(_NULL if task.priority is None else task.priority)
+        self.user_ids.append(_NULL if task.user_id is None else task.user_id)
+        self._live += 1
+
+    def __delitem__(self, task_id: int) -> None:
+        pos = self._find(task_id)
+        self.project_ids[pos] = _NULL
+        self.titles[pos] = None
+        self._live -= 1
+
+    def pop(self, task_id: int, *default: Any) -> Any:
+        # Returns a detached Task: a view would read the tombstone
+        try:
+            task = Task(*_task_row(self[task_id]))
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[task_id]
+        return task
+
+    def __len__(self) -> int:
+        return self._live
+
+    def __iter__(self) -> Iterator[int]:
+        for task_id, project_id in zip(self.ids, self.project_ids):
+            if project_id != _NULL:
+                yield task_id
+
+    def values(self) -> Iterator[TaskView]:
+        for pos, project_id in enumerate(self.project_ids):
+            if project_id != _NULL:
+                yield TaskView(self, pos)
+
+
+def _task_table() -> MutableMapping[int, Task]:
+    return TaskColumns() if settings.storage_layout == "columnar" else {}
+
+
+class ReadWriteLock:
+    """Many readers or one writer. A waiting writer keeps new readers out, so a stream of
+    reads cannot starve writes.
+
+    Handlers that only read take `reading()`; anything that mutates, including a
+    handler's check-then-write sequence, takes `writing()`.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def reading(self) -> Iterator[None]:
+        with self._cond:
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def writing(self) -> Iterator[None]:
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
 @dataclass
 class InMemoryDB:
     projects: Dict[int, Project] = field(default_factory=dict)
-    tasks: Dict[int, Task] = field(default_factory=dict)
+    tasks: MutableMapping[int, Task] = field(default_factory=_task_table)
     users: Dict[int, User] = field(default_factory=dict)
     id_counters: Dict[str, int] = field(default_factory=dict)
-    idempotency: Dict[str, Dict[str, Any]] = field(default_factory=dict)  # key -> cached response dict
+    # unique index: normalized email -> user id
+    users_by_email: Dict[str, int] = field(default_factory=dict)
+    # foreign-key indexes: project id / user id -> sorted task ids (bisect gives keyset seeks)
+    tasks_by_project: Dict[int, List[int]] = field(default_factory=dict)
+    tasks_by_user: Dict[int, List[int]] = field(default_factory=dict)
+    # filter indexes for v2 list_tasks, same shape: completed flag / priority -> sorted task ids
+    # (tasks without a priority are not in tasks_by_priority, no range matches them)
+    tasks_by_completed: Dict[bool, List[int]] = field(default_factory=dict)
+    tasks_by_priority: Dict[int, List[int]] = field(default_factory=dict)
+    # request id -> serialized response body
+    idempotency: IdempotencyStore = field(default_factory=lambda: IdempotencyStore(
+        ttl_seconds=settings.idempotency_expire_seconds,
+        max_entries=settings.idempotency_max_entries,
+        max_bytes=settings.idempotency_max_bytes,
+    ))
+
+    # Partitioned mode: this process allocates ids offset+1, offset+1+stride, ... so ids
+    # are unique across shards and the owning shard is (id - 1) % stride
+    id_stride: int = 1
+    id_offset: int = 0
+
+    # collection -> change counter; a result computed at the same versions is still current
+    versions: Dict[str, int] = field(default_factory=lambda: dict.fromkeys(("projects", "tasks", "users"), 0))
+    # called with lists of mutations; a list is applied all-or-nothing
+    listeners: List[MutationListener] = field(default_factory=list, repr=False)
+    # taken by the handler executor around every handler call (see ReadWriteLock)
+    lock: ReadWriteLock = field(default_factory=ReadWriteLock, repr=False, compare=False)
+    _pending: Optional[List[Mutation]] = field(default=None, repr=False)
+    # undo log of an open all-or-nothing section: (table, row id) -> the row before its first
+    # change in the section (None: it did not exist), and the id counters at begin()
+    _undo: Optional[Dict[Tuple[str, int], Any]] = field(default=None, repr=False)
+    _undo_counters: Dict[str, int] = field(default_factory=dict, repr=False)
+
+    # All-or-nothing sections (atomic batches): mutations are reported on commit() only,
+    # so listeners never see a change that is rolled back. Mutations record the rows they
+    # touch in the undo log, so a section costs as much as the rows it changes.
+    def begin(self) -> None:
+        self._pending = []
+        self._undo = {}
+        self._undo_counters = dict(self.id_counters)
+
+    def commit(self) -> None:
+        pending, self._pending = self._pending, None
+        self._undo = None
+        if pending:
+            self._notify(pending)
+
+    def rollback(self) -> None:
+        self._pending = None
+        undo, self._undo = self._undo, None
+        for (table, row_id), row in undo.items():
+            self._restore_row(table, row_id, row)
+        self.id_counters.clear()
+        self.id_counters.update(self._undo_counters)
+        self._bump_all()
+
+    def _touch(self, table: str, row_id: int) -> None:
+        # Called by mutations before they change a row: keeps its first before-image
+        undo = self._undo
+        if undo is None or (table, row_id) in undo:
+            return
+        row = getattr(self, table).get(row_id)
+        undo[(table, row_id)] = None if row is None else _copy_row[table](row)
+
+    def _restore_row(self, table: str, row_id: int, row: Any) -> None:
+        # Puts a before-image back; the index entries of tasks and users follow from their rows
+        rows = getattr(self, table)
+        current = rows.get(row_id)
+        if table == "tasks":
+            self._reindex(self.tasks_by_project, row_id, current and current.project_id, row and row.project_id)
+            self._reindex(self.tasks_by_user, row_id, current and current.user_id, row and row.user_id)
+            self._reindex(self.tasks_by_completed, row_id, current and current.completed, row and row.completed)
+            self._reindex(self.tasks_by_priority, row_id, current and current.priority, row and row.priority)
+        elif table == "users":
+            old_key = current and normalize_email(current.email)
+            if old_key is not None and self.users_by_email.get(old_key) == row_id:
+                del self.users_by_email[old_key]
+            if row is not None:
+                self.users_by_email[normalize_email(row.email)] = row_id
+        if row is None:
+            if current is not None:
+                del rows[row_id]
+        else:
+            rows[row_id] = row
+
+    def _reindex(self, index: Dict[int, List[int]], task_id: int, old: Optional[int], new: Optional[int]) -> None:
+        if old != new:
+            self._unindex(index, old, task_id)
+            if new is not None:
+                insort(index.setdefault(new, []), task_id)
+
+    def _report(self, mutation: Mutation) -> None:
+        if self._pending is not None:
+            self._pending.append(mutation)
+        else:
+            self._notify([mutation])
+
+    def _notify(self, mutations: List[Mutation]) -> None:
+        for listener in self.listeners:
+            listener(mutations)
+
+    def apply(self, mutations: List[Mutation]) -> None:
+        # Repeats logged mutations (WAL replay) without reporting them again
+        for op, args, kwargs, *_ in mutations:
+            _mutations[op](self, *args, **kwargs)
+        self._bump_all()
+
+    def _bump_all(self) -> None:
+        for name in self.versions:
+            self.versions[name] += 1
+
+    def versions_of(self, collections: Tuple[str, ...]) -> Tuple[int, ...]:
+        return tuple(self.versions[name] for name in collections)
+
+    def dump_state(self) -> Dict[str, Any]:
+        # Compact copy for on-disk snapshots: rows as tuples, indexes are rebuilt by load_state()
+        return {
+            "id_counters": dict(self.id_counters),
+            "projects": list(map(_project_row, self.projects.values())),
+            "tasks": list(map(_task_row, self.tasks.values())),
+            "users": list(map(_user_row, self.users.values())),
+        }
+
+    def load_state(self, state: Dict[str, Any]) -> None:
+        self.id_counters = dict(state["id_counters"])
+        self.projects = {row[0]: Project(*row) for row in state["projects"]}
+        self.tasks = _task_table()
+        # a dict table dumps rows restored by a rollback out of id order; TaskColumns needs them sorted
+        for row in sorted(state["tasks"]):
+            self.tasks[row[0]] = Task(*row)
+        self.users = {row[0]: User(*row) for row in state["users"]}
+        self.users_by_email = {normalize_email(user.email): user.id for user in self.users.values()}
+        self.tasks_by_project = {}
+        self.tasks_by_user = {}
+        self.tasks_by_completed = {}
+        self.tasks_by_priority = {}
+        for task in self.tasks.values():
+            self._index_task(task)
+        self._bump_all()
+
+    def _allocate_id(self, key: str) -> int:
+        return (_next_id(self.id_counters, key) - 1) * self.id_stride + self.id_offset + 1
+
+    def _index_task(self, task: Task) -> None:
+        # new ids are the largest so far, so insort appends
+        insort(self.tasks_by_project.setdefault(task.project_id, []), task.id)
+        if task.user_id is not None:
+            insort(self.tasks_by_user.setdefault(task.user_id, []), task.id)
+        insort(self.tasks_by_completed.setdefault(task.completed, []), task.id)
+        if task.priority is not None:
+            insort(self.tasks_by_priority.setdefault(task.priority, []), task.id)
+
+    def _unindex_task(self, task: Task, project: bool = True) -> None:
+        # Drops a task from every index; `project=False` when the caller pops the whole project bucket
+        if project:
+            self._unindex(self.tasks_by_project, task.project_id, task.id)
+        self._unindex(self.tasks_by_user, task.user_id, task.id)
+        self._unindex(self.tasks_by_completed, task.completed, task.id)
+        self._unindex(self.tasks_by_priority, task.priority, task.id)
+
+    def _unindex(self, index: Dict[int, List[int]], key: Optional[int], task_id: int) -> None:
+        ids = index.get(key)
+        if ids is not None:
+            pos = bisect_left(ids, task_id)
+            if pos < len(ids) and ids[pos] == task_id:
+                del ids[pos]
+            if not ids:
+                del index[key]
+
+    def _scan(self, rows: Dict[int, Any], counter: str, after_id: int) -> Iterator[Any]:
+        # Rows with id > after_id in id order. Ids come from a counter (see _allocate_id), so the
+        # scan probes the allocated ids from after_id upward instead of walking the whole table.
+        first = max(1, (after_id - self.id_offset - 1) // self.id_stride + 2)
+        for n in range(first, self.id_counters.get(counter, 0) + 1):
+            row = rows.get((n - 1) * self.id_stride + self.id_offset + 1)
+            if row is not None:
+                yield row
 
+    def _seek(self, buckets: List[List[int]], after_id: int) -> Iterator[Task]:
+        # Ids > after_id of the union of index buckets, in order. Re-seeks after every row, so
+        # a bucket changed between two reads (streams) is still walked correctly
+        while True:
+            next_id = None
+            for ids in buckets:
+                pos = bisect_right(ids, after_id)
+                if pos < len(ids) and (next_id is None or ids[pos] < next_id):
+                    next_id = ids[pos]
+            if next_id is None:
+                return
+            after_id = next_id
+            yield self.tasks[after_id]
+
+    @_mutation("projects")
     def create_project(self, name: str, description: str = "") -> Project:
-        new_id = _next_id(self.id_counters, "project")
+        new_id = self._allocate_id("project")
+        self._touch("projects", new_id)
         project = Project(id=new_id, name=name, description=description)
         self.projects[new_id] = project
         return project
 
+    @_mutation("projects")
+    def update_project(self, project_id: int, name: Optional[str] = None, description: Optional[str] = None) -> Project:
+        self._touch("projects", project_id)
+        project = self.projects[project_id]
+        if name is not None:
+            project.name = name
+        if description is not None:
+            project.description = description
+        return project
+
+    @_mutation("projects", "tasks")
+    def delete_project(self, project_id: int) -> List[int]:
+        # Returns the ids of the tasks deleted with the project
+        self._touch("projects", project_id)
+        # cascade delete tasks through the project index
+        for tid in self.tasks_by_project.get(project_id, ()):
+            self._touch("tasks", tid)
+        deleted = self.tasks_by_project.pop(project_id, [])
+        for tid in deleted:
+            self._unindex_task(self.tasks.pop(tid), project=False)
+        del self.projects[project_id]
+        return deleted
+
+    @_mutation("tasks")
     def create_task(self, project_id: int, title: str, completed: bool = False, priority: Optional[int] = None) -> Task:
-        new_id = _next_id(self.id_counters, "task")
+        new_id = self._allocate_id("task")
+        self._touch("tasks", new_id)
         task = Task(id=new_id, project_id=project_id, title=title, completed=completed, priority=priority)
         self.tasks[new_id] = task
+        self._index_task(task)
         return task
 
+    @_mutation("tasks")
     def create_task_v2(
         self,
         project_id: int,
@@ -68,7 +541,8 @@ class InMemoryDB:
         priority: Optional[int] = None,
         user_id: Optional[int] = None,
     ) -> Task:
-        new_id = _next_id(self.id_counters, "task")
+        new_id = self._allocate_id("task")
+        self._touch("tasks", new_id)
         task = Task(
             id=new_id,
             project_id=project_id,
@@ -78,14 +552,140 @@ class InMemoryDB:
             user_id=user_id,
         )
         self.tasks[new_id] = task
+        self._index_task(task)
+        return task
+
+    @_mutation("tasks")
+    def update_task(
+        self,
+        task_id: int,
+        title: Optional[str] = None,
+        completed: Optional[bool] = None,
+        priority: Optional[int] = None,
+        user_id: Optional[int] = None,
+    ) -> Task:
+        self._touch("tasks", task_id)
+        task = self.tasks[task_id]
+        if title is not None:
+            task.title = title
+        if completed is not None and completed != task.completed:
+            self._reindex(self.tasks_by_completed, task_id, task.completed, completed)
+            task.completed = completed
+        if priority is not None and priority != task.priority:
+            self._reindex(self.tasks_by_priority, task_id, task.priority, priority)
+            task.priority = priority
+        if user_id is not None and user_id != task.user_id:
+            self._unindex(self.tasks_by_user, task.user_id, task_id)
+            task.user_id = user_id
+            insort(self.tasks_by_user.setdefault(user_id, []), task_id)
         return task
 
+    @_mutation("tasks")
+    def delete_task(self, task_id: int) -> None:
+        self._touch("tasks", task_id)
+        self._unindex_task(self.tasks.pop(task_id))
+
+    def tasks_for_project(self, project_id: int) -> List[Task]:
+        return [self.tasks[tid] for tid in self.tasks_by_project.get(project_id, ())]
+
+    def tasks_for_user(self, user_id: int) -> List[Task]:
+        return [self.tasks[tid] for tid in self.tasks_by_user.get(user_id, ())]
+
+    # Keyset iteration: rows with id > after_id in ascending id order, read lazily so that
+    # a page costs about `limit` lookups whatever the table size
+    def iter_projects(self, after_id: int = 0) -> Iterator[Project]:
+        return self._scan(self.projects, "project", after_id)
+
+    def iter_users(self, after_id: int = 0) -> Iterator[User]:
+        return self._scan(self.users, "user", after_id)
+
+    def iter_tasks(
+        self,
+        after_id: int = 0,
+        project_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        completed: Optional[bool] = None,
+        priority_min: Optional[int] = None,
+        priority_max: Optional[int] = None,
+    ) -> Iterator[Task]:
+        # With filters, walk the index with the fewest candidates (the project, user or
+        # completed bucket, or the priority buckets in range); the caller still checks the
+        # other conditions, so a page costs its rows plus the candidates they rule out
+        candidates: List[List[List[int]]] = []
+        if project_id is not None:
+            candidates.append([self.tasks_by_project.get(project_id, [])])
+        if user_id is not None:
+            candidates.append([self.tasks_by_user.get(user_id, [])])
+        if completed is not None:
+            candidates.append([self.tasks_by_completed.get(completed, [])])
+        if priority_min is not None or priority_max is not None:
+            candidates.append([
+                ids for priority, ids in self.tasks_by_priority.items()
+                if (priority_min is None or priority >= priority_min) and (priority_max is None or priority <= priority_max)
+            ])
+        if candidates:
+            return self._seek(min(candidates, key=lambda buckets: sum(map(len, buckets))), after_id)
+        return self._scan(self.tasks, "task", after_id)
+
+    def find_user_by_email(self, email: str) -> Optional[User]:
+        user_id = self.users_by_email.get(normalize_email(email))
+        return self.users.get(user_id) if user_id is not None else None
+
+    @_mutation("users")
     def create_user(self, name: str, email: str) -> User:
-        new_id = _next_id(self.id_counters, "user")
+        key = normalize_email(email)
+        if key in self.users_by_email:
+            raise ValueError("Email already in use")
+        new_id = self._allocate_id("user")
+        self._touch("users", new_id)
         user = User(id=new_id, name=name, email=email)
         self.users[new_id] = user
+        self.users_by_email[key] = new_id
+        return user
+
+    @_mutation("users")
+    def update_user(self, user_id: int, name: Optional[str] = None, email: Optional[str] = None) -> User:
+        self._touch("users", user_id)
+        user = self.users[user_id]
+        if email is not None:
+            old_key, new_key = normalize_email(user.email), normalize_email(email)
+            if new_key != old_key:
+                if new_key in self.users_by_email:
+                    raise ValueError("Email already in use")
+                del self.users_by_email[old_key]
+                self.users_by_email[new_key] = user_id
+            user.email = email
+        if name is not None:
+            user.name = name
         return user
 
+    @_mutation("users", "tasks")
+    def delete_user(self, user_id: int) -> List[int]:
+        # Returns the ids of the tasks it was unassigned from
+        self._touch("users", user_id)
+        for tid in self.tasks_by_user.get(user_id, ()):
+            self._touch("tasks", tid)
+        user = self.users.pop(user_id)
+        self.users_by_email.pop(normalize_email(user.email), None)
+        # Detach user from tasks through the user index
+        detached = self.tasks_by_user.pop(user_id, [])
+        for tid in detached:
+            self.tasks[tid].user_id = None
+        return detached
+
+def _row_getter(cls: type) -> Callable[[Any], tuple]:
+    return attrgetter(*(f.name for f in fields(cls)))
+
+
+_project_row = _row_getter(Project)
+_task_row = _row_getter(Task)
+_user_row = _row_getter(User)
+# detached copies of rows (a TaskView too) for the undo log
+_copy_row: Dict[str, Callable[[Any], Any]] = {
+    "projects": lambda row: Project(*_project_row(row)),
+    "tasks": lambda row: Task(*_task_row(row)),
+    "users": lambda row: User(*_user_row(row)),
+}
 
 db = InMemoryDB()
 
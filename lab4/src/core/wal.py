@@ -0,0 +1,405 @@
+"""Write-ahead log and snapshots for the in-memory store.
+
+Every successful mutation of `db` (see `_mutation` in storage.py) and every
+idempotency entry is appended to the log as one frame: `<length, crc32>` followed by
+a pickled record. A mutation list from an atomic batch is a single frame, so it is
+replayed completely or not at all.
+
+Files in `settings.wal_dir`:
+- `wal-<n>.log`: log segments, appended in order;
+- `snapshot-<n>.pkl`: full state as of the start of segment n (rows as tuples).
+
+On startup `open()` loads the newest snapshot, replays the segments from that number
+on and cuts a torn tail (a frame with a bad length or checksum, left by a crash) off
+the log. A checkpoint starts a new segment, writes a snapshot and deletes the files
+it makes redundant; it runs after `settings.wal_checkpoint_records` records.
+
+Durability (`settings.wal_sync`):
+- "always": every append is written and fsynced before it returns;
+- "group": a flusher thread writes and fsyncs every `wal_group_commit_ms`, and replies
+  wait in `sync()` until the mutations they depend on are on disk (group commit);
+- "periodic": written every `wal_group_commit_ms`, fsynced every `wal_fsync_interval`
+  seconds; replies do not wait, a power loss can drop the last interval;
+- "os": written every `wal_group_commit_ms`, never fsynced; survives a process crash
+  but not an OS crash.
+
+A failed write or fsync poisons the log: the frames it held may or may not be on
+disk, and retrying an fsync after an error can report success for lost pages, so
+nothing more is written and every later `sync()` (and "always" append) raises the
+same error until the server is restarted and recovers from what the files hold.
+
+Snapshots and segments are pickles: only point wal_dir at files this server wrote.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.core.config import settings
+from src.core.engine import handler_executor
+from src.core.storage import InMemoryDB, Mutation
+
+logger = logging.getLogger(__name__)
+
+SYNC_MODES = ("always", "group", "periodic", "os")
+
+_HEADER = struct.Struct("<II")  # payload length, crc32 of the payload
+
+# record kinds
+MUTATIONS = 0  # (MUTATIONS, [(op, args, kwargs), ...])
+IDEMPOTENCY = 1  # (IDEMPOTENCY, key, body, content_type, expires_at as wall-clock time)
+
+
+def _frame(record: tuple) -> bytes:
+    payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    return _HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def read_frames(data: bytes) -> Iterator[Tuple[int, Any]]:
+    # (end offset, record) for every intact frame; stops at the first torn or corrupt one
+    view = memoryview(data)
+    pos, size = 0, len(data)
+    while pos + _HEADER.size <= size:
+        length, crc = _HEADER.unpack_from(data, pos)
+        start = pos + _HEADER.size
+        end = start + length
+        if end > size or zlib.crc32(view[start:end]) != crc:
+            return
+        yield end, pickle.loads(view[start:end])
+        pos = end
+
+
+def _numbered(directory: str, prefix: str, suffix: str) -> List[int]:
+    numbers = []
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name.endswith(suffix):
+            try:
+                numbers.append(int(name[len(prefix):-len(suffix)]))
+            except ValueError:
+                pass
+    return sorted(numbers)
+
+
+def _fsync_dir(directory: str) -> None:
+    # makes renames and new files themselves durable
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _resolve(future: asyncio.Future, error: Optional[BaseException]) -> None:
+    if not future.done():
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+
+class WriteAheadLog:
+    def __init__(self) -> None:
+        self.directory: Optional[str] = None
+        self.mode = ""
+        self.db: Optional[InMemoryDB] = None
+        self.segment = 0
+        self._file = None
+        # Frames are queued under _lock (cheap, taken by appenders) and written under
+        # _io_lock (taken by the flusher, checkpoints and "always" appends); _io_lock first.
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._buffer: List[bytes] = []
+        self._waiters: List[Tuple[int, asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._wakeup = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._checkpointer: Optional[asyncio.Task] = None
+        self._closing = False
+        self._last_fsync = 0.0
+        self.error: Optional[OSError] = None  # set by the first failed write, see the module docstring
+        # log sequence numbers (record counts): appended >= written >= durable
+        self.appended = 0
+        self.written = 0
+        self.durable = 0
+        self.last_mutation = 0
+        self.since_checkpoint = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.checkpoints = 0
+        self.replayed = 0
+        self.replay_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    # --- recovery -------------------------------------------------------------------
+
+    def open(self, directory: str, db: InMemoryDB) -> None:
+        """Restores db from the directory, then logs its mutations from here on."""
+        self.mode = settings.wal_sync
+        if self.mode not in SYNC_MODES:
+            raise ValueError(f"Unknown wal_sync mode: {self.mode}")
+        os.makedirs(directory, exist_ok=True)
+        started = time.perf_counter()
+        last = self.recover(directory, db)
+        self.replay_seconds = time.perf_counter() - started
+        logger.info(f"WAL {directory}: restored {self.replayed} records in {self.replay_seconds:.2f}s")
+
+        self.directory = directory
+        self.db = db
+        self._closing = False
+        self._open_segment(last + 1)
+        db.listeners.append(self._log_mutations)
+        db.idempotency.listeners.append(self._log_idempotency)
+        if self.mode != "always":
+            self._flusher = threading.Thread(target=self._flush_loop, name="wal-flusher", daemon=True)
+            self._flusher.start()
+
+    def recover(self, directory: str, db: InMemoryDB) -> int:
+        # Loads the newest snapshot and replays the segments after it; returns the last segment number
+        snapshots = _numbered(directory, "snapshot-", ".pkl")
+        first = 0
+        if snapshots:
+            first = snapshots[-1]
+            with open(os.path.join(directory, f"snapshot-{first:010d}.pkl"), "rb") as f:
+                state = pickle.load(f)
+            db.load_state(state["db"])
+            self._restore_idempotency(db, state["idempotency"])
+        segments = [n for n in _numbered(directory, "wal-", ".log") if n >= first]
+        now = time.time()
+        for number in segments:
+            path = os.path.join(directory, f"wal-{number:010d}.log")
+            with open(path, "rb") as f:
+                data = f.read()
+            valid = 0
+            for valid, record in read_frames(data):
+                if record[0] == MUTATIONS:
+                    db.apply(record[1])
+                elif record[0] == IDEMPOTENCY and record[4] > now:
+                    db.idempotency.put(record[1], record[2], record[3], ttl=record[4] - now)
+                self.replayed += 1
+            if valid < len(data):
+                logger.warning(f"WAL {path}: dropping a torn tail of {len(data) - valid} bytes")
+                with open(path, "r+b") as f:
+                    f.truncate(valid)
+                    os.fsync(f.fileno())
+        return max(segments[-1] if segments else 0, first)
+
+    @staticmethod
+    def _restore_idempotency(db: InMemoryDB, entries: List[Tuple[str, bytes, str, float]]) -> None:
+        now = time.time()
+        for key, body, content_type, expires_at in entries:
+            if expires_at > now:
+                db.idempotency.put(key, body, content_type, ttl=expires_at - now)
+
+    # --- appending ------------------------------------------------------------------
+
+    def _log_mutations(self, mutations: List[Mutation]) -> None:
+        self.last_mutation = self._append((MUTATIONS, [(m.op, m.args, m.kwargs) for m in mutations]))
+
+    def _log_idempotency(self, key: str, body: bytes, content_type: str, ttl: float) -> None:
+        self._append((IDEMPOTENCY, key, body, content_type, time.time() + ttl))
+
+    def _append(self, record: tuple) -> int:
+        frame = _frame(record)
+        with self._lock:
+            self._buffer.append(frame)
+            self.appended += 1
+            self.since_checkpoint += 1
+            lsn = self.appended
+        if self.mode == "always":
+            self._write(fsync=True)
+        return lsn
+
+    def _write(self, fsync: bool) -> None:
+        with self._io_lock:
+            try:
+                self._write_locked(fsync)
+            except OSError as e:
+                if e is not self.error:
+                    logger.error(f"WAL write failed, no further writes until restart: {e}")
+                    self.error = e
+                self._wake_waiters(e)
+                if self.mode == "always":
+                    raise
+
+    def _write_locked(self, fsync: bool) -> None:
+        # Writes out the queued frames, optionally fsyncs, then wakes the group-commit waiters
+        if self.error is not None:
+            raise self.error
+        with self._lock:
+            frames, self._buffer = self._buffer, []
+            lsn = self.appended
+        if frames:
+            data = b"".join(frames)
+            self._file.write(data)
+            self.bytes_written += len(data)
+        self.written = lsn
+        if fsync and self.durable < lsn:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+            self._last_fsync = time.monotonic()
+            self.durable = lsn
+        self._wake_waiters(None)
+
+    def _wake_waiters(self, error: Optional[BaseException]) -> None:
+        with self._lock:
+            if error is None:
+                ready = [w for w in self._waiters if w[0] <= self.durable]
+                self._waiters = [w for w in self._waiters if w[0] > self.durable]
+            else:
+                ready, self._waiters = self._waiters, []
+        for _, loop, future in ready:
+            loop.call_soon_threadsafe(_resolve, future, error)
+
+    def _flush_loop(self) -> None:
+        interval = settings.wal_group_commit_ms / 1000
+        while not self._closing:
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            if self.mode == "group":
+                fsync = True
+            elif self.mode == "periodic":
+                fsync = time.monotonic() - self._last_fsync >= settings.wal_fsync_interval
+            else:
+                fsync = False
+            self._write(fsync)
+
+    async def sync(self) -> None:
+        """In group mode, waits until every mutation appended so far is fsynced.
+
+        Replies call this before publishing, so a client never sees a write that a
+        crash could still lose. Returns at once when no mutation is pending, which
+        keeps reads off the fsync path. Raises the write error once the log is poisoned.
+        """
+        if self.error is not None:
+            raise self.error
+        if self.mode != "group" or self.durable >= self.last_mutation:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            target = self.appended
+            if self.durable >= target:
+                return
+            self._waiters.append((target, loop, future))
+        await future
+
+    # --- checkpoints ----------------------------------------------------------------
+
+    def _open_segment(self, number: int) -> None:
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self.segment = number
+        self._file = open(os.path.join(self.directory, f"wal-{number:010d}.log"), "ab", buffering=0)
+        _fsync_dir(self.directory)
+
+    def capture(self) -> Tuple[int, Dict[str, Any]]:
+        """Starts a checkpoint: switches to a new segment and copies the state.
+
+        Must run while no handler mutates db (inside handler_executor). Idempotency
+        entries written meanwhile may end up both in the snapshot and in the new
+        segment, which is harmless: replaying a put is idempotent.
+        """
+        with self._io_lock:
+            self._write_locked(fsync=True)
+            self._open_segment(self.segment + 1)
+            self.since_checkpoint = 0
+        now = time.time()
+        state = {
+            "db": self.db.dump_state(),
+            "idempotency": [
+                (key, body, content_type, now + ttl)
+                for key, body, content_type, ttl in self.db.idempotency.entries()
+            ],
+        }
+        return self.segment, state
+
+    def write_snapshot(self, number: int, state: Dict[str, Any]) -> None:
+        """Finishes a checkpoint off the handler lock: writes the snapshot, drops older files."""
+        path = os.path.join(self.directory, f"snapshot-{number:010d}.pkl")
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + ".tmp", path)
+        _fsync_dir(self.directory)
+        for old in _numbered(self.directory, "snapshot-", ".pkl"):
+            if old < number:
+                os.remove(os.path.join(self.directory, f"snapshot-{old:010d}.pkl"))
+        for old in _numbered(self.directory, "wal-", ".log"):
+            if old < number:
+                os.remove(os.path.join(self.directory, f"wal-{old:010d}.log"))
+        self.checkpoints += 1
+
+    def checkpoint(self) -> None:
+        # Synchronous checkpoint for scripts; the server uses run_checkpoints()
+        self.write_snapshot(*self.capture())
+
+    async def run_checkpoints(self, check_interval: float = 1.0) -> None:
+        while True:
+            await asyncio.sleep(check_interval)
+            if 0 < settings.wal_checkpoint_records <= self.since_checkpoint:
+                started = time.perf_counter()
+                number, state = await handler_executor.run(self.capture)
+                await asyncio.to_thread(self.write_snapshot, number, state)
+                logger.info(f"WAL checkpoint {number} written in {time.perf_counter() - started:.2f}s")
+
+    # --- lifecycle ------------------------------------------------------------------
+
+    async def start(self, db: InMemoryDB) -> None:
+        # Recovery can take a while on a big log, so it runs off the event loop
+        if not settings.wal_dir or self.enabled:
+            return
+        await asyncio.to_thread(self.open, settings.wal_dir, db)
+        if settings.wal_checkpoint_records > 0:
+            self._checkpointer = asyncio.create_task(self.run_checkpoints())
+
+    async def stop(self) -> None:
+        if self._checkpointer is not None:
+            self._checkpointer.cancel()
+            self._checkpointer = None
+        if self.enabled:
+            await asyncio.to_thread(self.close)
+
+    def close(self) -> None:
+        if not self.enabled:
+            return
+        self.db.listeners.remove(self._log_mutations)
+        self.db.idempotency.listeners.remove(self._log_idempotency)
+        self._closing = True
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        with self._io_lock:
+            if self.error is None:
+                self._write_locked(fsync=True)
+            self._file.close()
+            self._file = None
+        self.directory = None
+        self.db = None
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "appended": self.appended,
+            "durable": self.durable,
+            "segment": self.segment,
+            "bytes_written": self.bytes_written,
+            "fsyncs": self.fsyncs,
+            "checkpoints": self.checkpoints,
+            "since_checkpoint": self.since_checkpoint,
+            "replayed": self.replayed,
+            "replay_seconds": self.replay_seconds,
+        }
+
+
+wal = WriteAheadLog()
@@ -0,0 +1,216 @@
+"""Inspect and replay the dead-letter queue.
+
+    python -m src.dlq_tool stats [--samples 2]
+    python -m src.dlq_tool replay [--reason TEXT] [--action v1/create_task] [--limit N]
+                                  [--rate 1000] [--batch-size 100] [--to api.requests] [--dry-run]
+
+Both commands page through the queue with `basic.get`, one message per round trip:
+deliveries are not acknowledged while scanning, so they stay in the queue and the
+ones not replayed are requeued when the channel closes. The scan stops once it has
+seen as many messages as the queue held at the start, when the queue has no ready
+message left, or when the broker does not answer a get within `--idle` seconds.
+
+Throughput trade-off: a scan is bound by the broker round trip, roughly 1/RTT
+messages per second (a few thousand per second next to the broker, about a thousand
+over a 1 ms link), and `replay --rate` cannot go faster than that. A consumer would
+pipeline deliveries but does not fit a non-destructive scan: an unlimited prefetch
+window makes the broker push the whole DLQ into client memory at once; a bounded one
+stalls when the window is full of held messages; and releasing them with
+`nack(requeue=True)` puts them back at their original position, so the consumer
+would be handed the same head of the queue again instead of the rest of it. The
+client holds one message at a time (plus one replay batch).
+
+`stats` groups the messages by reason (`x-dlq-reason`, first line) and by
+`version/action` from the body. `replay` republishes the matching messages to
+`--to` on a confirming channel, `--batch-size` publishes at a time and at most
+`--rate` per second; each batch is acknowledged in the DLQ only after the broker
+confirmed it, so an interrupted replay never loses a message (at worst a batch is
+published twice, and request ids make that harmless). Replayed messages lose their
+DLQ, retry and deadline headers and get `x-replayed` incremented.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from aio_pika import Message, connect
+from aio_pika.abc import AbstractChannel, AbstractConnection, AbstractIncomingMessage
+
+from src.core.codecs import get_codec
+from src.core.config import settings
+from src.core.logs import setup_logging
+from src.core.retry import DLQ_REASON_HEADER, RETRY_COUNT_HEADER, RETRY_ERROR_HEADER
+from src.schemas.protocol import DEADLINE_HEADER
+
+setup_logging()
+logger = logging.getLogger(__name__)
+
+REPLAYED_HEADER = "x-replayed"
+REASON_WIDTH = 120
+
+
+def describe(message: AbstractIncomingMessage) -> Tuple[str, str]:
+    # (reason, "version/action") of a dead-lettered message, for grouping and filters
+    headers = message.headers or {}
+    reason = str(headers.get(DLQ_REASON_HEADER, "<no reason>")).strip().splitlines()
+    reason = reason[0][:REASON_WIDTH] if reason else "<no reason>"
+    try:
+        request = get_codec(message.content_type).loads(message.body)
+    except ValueError:
+        return reason, "<undecodable>"
+    if not isinstance(request, dict):
+        return reason, "<not an object>"
+    action = "batch" if "items" in request else request.get("action")
+    return reason, f"{request.get('version')}/{action}"
+
+
+async def scan(channel: AbstractChannel, queue_name: str, idle: float) -> AsyncIterator[AbstractIncomingMessage]:
+    queue = await channel.declare_queue(queue_name, durable=True)
+    result = getattr(queue, "declaration_result", None)
+    expected: Optional[int] = getattr(result, "message_count", None)
+    seen = 0
+    while expected is None or seen < expected:
+        try:
+            # held (unacked) messages are not ready, so each get returns the next one
+            message = await queue.get(no_ack=False, fail=False, timeout=idle)
+        except asyncio.TimeoutError:
+            break
+        if message is None:
+            break
+        seen += 1
+        yield message
+
+
+def replay_copy(message: AbstractIncomingMessage) -> Message:
+    headers = dict(message.headers or {})
+    for name in (DLQ_REASON_HEADER, RETRY_COUNT_HEADER, RETRY_ERROR_HEADER, DEADLINE_HEADER):
+        headers.pop(name, None)
+    headers[REPLAYED_HEADER] = int(headers.get(REPLAYED_HEADER) or 0) + 1
+    return Message(
+        body=message.body,
+        content_type=message.content_type,
+        correlation_id=message.correlation_id,
+        reply_to=message.reply_to,
+        message_id=message.message_id,
+        priority=message.priority,
+        headers=headers,
+    )
+
+
+async def stats(connection: AbstractConnection, args: argparse.Namespace) -> Dict[Tuple[str, str], int]:
+    channel = await connection.channel()
+    groups: Counter = Counter()
+    samples: Dict[Tuple[str, str], List[bytes]] = {}
+    size = 0
+    async for message in scan(channel, args.queue, args.idle):
+        key = describe(message)
+        groups[key] += 1
+        size += len(message.body)
+        if len(samples.setdefault(key, [])) < args.samples:
+            samples[key].append(message.body[:200])
+    await channel.close()  # requeues everything
+
+    print(f"{sum(groups.values())} messages, {size} bytes in {args.queue}")
+    for (reason, action), count in groups.most_common():
+        print(f"{count:8}  {action:<28} {reason}")
+        for body in samples[(reason, action)]:
+            print(f"{'':10}{body.decode('utf-8', 'replace')}")
+    return dict(groups)
+
+
+class Pacer:
+    # Spaces sends out so that no more than `rate` go per second on average
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.started = time.monotonic()
+        self.sent = 0
+
+    async def wait(self, count: int) -> None:
+        if self.rate > 0:
+            delay = self.started + self.sent / self.rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self.sent += count
+
+
+async def replay(connection: AbstractConnection, args: argparse.Namespace) -> int:
+    channel = await connection.channel()
+    publish_channel = await connection.channel(publisher_confirms=True)
+    pacer = Pacer(args.rate)
+    batch: List[AbstractIncomingMessage] = []
+    replayed = matched = 0
+    started = time.monotonic()
+
+    async def flush() -> None:
+        nonlocal replayed
+        await pacer.wait(len(batch))
+        # publish() resolves on the broker confirm; a failure aborts before the batch is acked
+        await asyncio.gather(*[
+            publish_channel.default_exchange.publish(replay_copy(message), routing_key=args.to)
+            for message in batch
+        ])
+        for message in batch:
+            await message.ack()
+        replayed += len(batch)
+        batch.clear()
+
+    try:
+        async for message in scan(channel, args.queue, args.idle):
+            reason, action = describe(message)
+            if args.reason and args.reason not in reason or args.action and args.action != action:
+                continue
+            matched += 1
+            if not args.dry_run:
+                batch.append(message)
+                if len(batch) >= args.batch_size:
+                    await flush()
+            if args.limit and matched >= args.limit:
+                break
+        if batch:
+            await flush()
+    finally:
+        await channel.close()  # requeues what was not replayed
+        await publish_channel.close()
+
+    elapsed = time.monotonic() - started
+    if args.dry_run:
+        print(f"dry run: {matched} messages would be replayed to {args.to}")
+    else:
+        print(f"replayed {replayed} messages to {args.to} in {elapsed:.1f}s ({replayed / max(elapsed, 1e-9):.0f}/s)")
+    return matched if args.dry_run else replayed
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Inspect and replay the dead-letter queue")
+    parser.add_argument("--queue", default=settings.queue_dlq)
+    parser.add_argument("--idle", type=float, default=2.0, help="stop when the broker does not answer a get within this many seconds")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats_parser = commands.add_parser("stats", help="count messages by reason and action")
+    stats_parser.add_argument("--samples", type=int, default=0, help="bodies to print per group")
+
+    replay_parser = commands.add_parser("replay", help="republish matching messages")
+    replay_parser.add_argument("--reason", help="substring of x-dlq-reason")
+    replay_parser.add_argument("--action", help="version/action, e.g. v1/create_task")
+    replay_parser.add_argument("--limit", type=int, default=0, help="replay at most this many, 0 = all")
+    replay_parser.add_argument("--rate", type=float, default=1000, help="messages per second, 0 = unlimited")
+    replay_parser.add_argument("--batch-size", type=int, default=100)
+    replay_parser.add_argument("--to", default=settings.queue_requests, help="target queue")
+    replay_parser.add_argument("--dry-run", action="store_true")
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    connection = await connect(settings.rabbitmq_url)
+    async with connection:
+        if args.command == "stats":
+            await stats(connection, args)
+        else:
+            await replay(connection, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+import logging
+from typing import Dict, List
+
+from src.core.codecs import get_codec
+from src.core.storage import db
+from src.handlers.registry import get_action
+from src.schemas.protocol import BatchRequestMessage, BatchItemResult, ResponseMessage
+
+logger = logging.getLogger(__name__)
+
+
+def execute_batch(batch: BatchRequestMessage) -> ResponseMessage:
+    # Runs every item through the registry in order. Each item has its own idempotency
+    # key, so a retried batch replays the items that already ran instead of repeating them.
+    results: List[BatchItemResult] = []
+    executed: Dict[str, BatchItemResult] = {}  # results produced by this batch, cached on commit
+    if batch.atomic:
+        db.begin()
+
+    for index, item in enumerate(batch.items):
+        if item.id in executed:
+            results.append(executed[item.id].model_copy())
+            continue
+        cached = db.idempotency.get(item.id)
+        if cached is not None:
+            replay = ResponseMessage.model_validate(get_codec(cached.content_type).loads(cached.body))
+            results.append(BatchItemResult(id=item.id, status=replay.status, data=replay.data, error=replay.error))
+            continue
+
+        action = get_action(batch.version, item.action)
+        if not action:
+            result = BatchItemResult(id=item.id, status="error", error=f"Unknown action: {item.action} for version {batch.version}")
+        else:
+            try:
+                data = action.execute(action.parse_payload(item.data))
+                result = BatchItemResult(id=item.id, status="ok", data=data)
+                executed[item.id] = result
+            except Exception as e:
+                logger.error(f"Batch {batch.id}: item {item.id} failed: {e}")
+                result = BatchItemResult(id=item.id, status="error", error=str(e))
+                executed[item.id] = result
+
+        if result.status == "error" and batch.atomic:
+            db.rollback()
+            for done in results:
+                if done.id in executed:
+                    done.status = "rolled_back"
+                    done.data = None
+            results.append(result)
+            results.extend(BatchItemResult(id=rest.id, status="skipped") for rest in batch.items[index + 1:])
+            return ResponseMessage(
+                correlation_id=batch.id,
+                status="error",
+                data=[r.model_dump() for r in results],
+                error=f"Batch rolled back: item {item.id} failed: {result.error}"
+            )
+        results.append(result)
+
+    if batch.atomic:
+        db.commit()
+    codec = get_codec()
+    for result in executed.values():
+        # Cached in the same shape as a single-request reply for that id
+        db.idempotency.put(result.id, codec.dumps({
+            "correlation_id": result.id,
+            "status": result.status,
+            "data": result.data,
+            "error": result.error,
+        }), codec.content_type)
+
+    return ResponseMessage(
+        correlation_id=batch.id,
+        status="ok",
+        data=[r.model_dump() for r in results]
+    )
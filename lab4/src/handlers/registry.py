@@ -1,32 +1,180 @@
-from typing import Callable, Dict, Any
+from dataclasses import dataclass
+from itertools import islice
+from operator import attrgetter
+from typing import Callable, Dict, Any, Iterable, Iterator, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, create_model
 
 from src.handlers.v1 import projects as projects_v1
 from src.handlers.v1 import tasks as tasks_v1
 from src.handlers.v1 import users as users_v1
+from src.handlers.v2 import projects as projects_v2
+from src.handlers.v2 import tasks as tasks_v2
+from src.handlers.v2 import users as users_v2
+from src.schemas.page import PageQuery
+from src.schemas.project import ProjectCreate, ProjectOut, ProjectUpdateById
+from src.schemas.protocol import EntityRef, RequestMessage
+from src.schemas.task import (
+    TaskCreateV1, TaskCreateV2, TaskListQueryV1, TaskListQueryV2, TaskOutV1, TaskOutV2,
+    TaskUpdateV1ById, TaskUpdateV2ById,
+)
+from src.schemas.user import UserCreate, UserOut, UserUpdateById
+
+# Handler signature: (payload) -> storage row(s) or None
+HandlerFunc = Callable[[Any], Any]
+# Streaming variant of a list action: (payload) -> iterator of rows, used for requests with "stream": true
+StreamHandlerFunc = Callable[[Any], Iterator[Any]]
+
+
+@dataclass(frozen=True)
+class Action:
+    handler: HandlerFunc
+    payload: Optional[Type[BaseModel]] = None  # None: the handler gets the raw data dict
+    output: Optional[Type[BaseModel]] = None  # fields of a result row; None: no result
+    result: str = "one"  # "one" row, "many" rows or "page" (RowPage of rows)
+    stream: Optional[StreamHandlerFunc] = None
+    reads: Tuple[str, ...] = ()  # read-only action: the db collections its result depends on (result cache)
 
-# Handler signature: (data: dict) -> Any
-HandlerFunc = Callable[[Dict[str, Any]], Any]
-
-_handlers: Dict[str, Dict[str, HandlerFunc]] = {
-    "v1": {
-        "create_project": projects_v1.create_project,
-        "list_projects": projects_v1.list_projects,
-        "get_project": projects_v1.get_project,
-        "update_project": projects_v1.update_project,
-        "delete_project": projects_v1.delete_project,
-        "create_task": tasks_v1.create_task,
-        "list_tasks": tasks_v1.list_tasks,
-        "get_task": tasks_v1.get_task,
-        "update_task": tasks_v1.update_task,
-        "delete_task": tasks_v1.delete_task,
-        "create_user": users_v1.create_user,
-        "list_users": users_v1.list_users,
-        "get_user": users_v1.get_user,
-        "update_user": users_v1.update_user,
-        "delete_user": users_v1.delete_user,
-    }
+
+PROJECTS, TASKS, USERS = ("projects",), ("tasks",), ("users",)
+
+_v1: Dict[str, Action] = {
+    "create_project": Action(projects_v1.create_project, ProjectCreate, ProjectOut),
+    "list_projects": Action(projects_v1.list_projects, None, ProjectOut, "many", projects_v1.iter_projects, PROJECTS),
+    "get_project": Action(projects_v1.get_project, EntityRef, ProjectOut, reads=PROJECTS),
+    "update_project": Action(projects_v1.update_project, ProjectUpdateById, ProjectOut),
+    "delete_project": Action(projects_v1.delete_project, EntityRef),
+    "create_task": Action(tasks_v1.create_task, TaskCreateV1, TaskOutV1),
+    "list_tasks": Action(tasks_v1.list_tasks, TaskListQueryV1, TaskOutV1, "many", tasks_v1.iter_tasks, TASKS),
+    "get_task": Action(tasks_v1.get_task, EntityRef, TaskOutV1, reads=TASKS),
+    "update_task": Action(tasks_v1.update_task, TaskUpdateV1ById, TaskOutV1),
+    "delete_task": Action(tasks_v1.delete_task, EntityRef),
+    "create_user": Action(users_v1.create_user, UserCreate, UserOut),
+    "list_users": Action(users_v1.list_users, None, UserOut, "many", users_v1.iter_users, USERS),
+    "get_user": Action(users_v1.get_user, EntityRef, UserOut, reads=USERS),
+    "update_user": Action(users_v1.update_user, UserUpdateById, UserOut),
+    "delete_user": Action(users_v1.delete_user, EntityRef),
 }
 
-def get_handler(version: str, action: str) -> HandlerFunc | None:
-    return _handlers.get(version, {}).get(action)
+_actions: Dict[str, Dict[str, Action]] = {
+    "v1": _v1,
+    # v2: tasks carry priority / user_id, list actions take filters and return keyset pages
+    # {"items": [...], "next_after_id": ...}; other actions are unchanged from v1
+    "v2": {
+        **_v1,
+        "list_projects": Action(projects_v2.list_projects, PageQuery, ProjectOut, "page", projects_v2.iter_projects, PROJECTS),
+        "create_task": Action(tasks_v2.create_task, TaskCreateV2, TaskOutV2),
+        "list_tasks": Action(tasks_v2.list_tasks, TaskListQueryV2, TaskOutV2, "page", tasks_v2.iter_tasks, TASKS),
+        "get_task": Action(tasks_v1.get_task, EntityRef, TaskOutV2, reads=TASKS),
+        "update_task": Action(tasks_v2.update_task, TaskUpdateV2ById, TaskOutV2),
+        "list_users": Action(users_v2.list_users, PageQuery, UserOut, "page", users_v2.iter_users, USERS),
+    },
+}
+
+
+def _row_dumper(output: Optional[Type[BaseModel]]) -> Callable[[Any], Any]:
+    # Storage rows already hold validated values, so the output is read straight off the
+    # dataclass fields named by the output schema instead of building a model and dumping it
+    if output is None:
+        return lambda row: None
+    names = tuple(output.model_fields)
+    values = attrgetter(*names)
+    if len(names) == 1:
+        return lambda row: {names[0]: values(row)}
+    return lambda row: dict(zip(names, values(row)))
+
+
+class CompiledAction:
+    """An Action prepared at import time.
+
+    `request` validates the envelope and the typed payload in one pass, `payload`
+    validates a bare data dict (batch items), `dump` turns the handler result into
+    plain data for the codec.
+    """
+
+    def __init__(self, version: str, name: str, action: Action):
+        self.version = version
+        self.name = name
+        self.spec = action
+        self.handler = action.handler
+        self.stream = action.stream
+        self.reads = action.reads
+        if action.payload is None:
+            self.payload: Optional[TypeAdapter] = None
+            self.request = TypeAdapter(RequestMessage)
+        else:
+            self.payload = TypeAdapter(action.payload)
+            self.request = TypeAdapter(create_model(
+                f"{version}_{name}_request",
+                __base__=RequestMessage,
+                data=(action.payload, Field(default_factory=dict, validate_default=True)),
+            ))
+        self.dump_row = _row_dumper(action.output)
+        dump_row = self.dump_row
+        if action.result == "many":
+            self.dump = lambda rows: [dump_row(row) for row in rows]
+        elif action.result == "page":
+            self.dump = lambda page: {"items": [dump_row(row) for row in page.rows], "next_after_id": page.next_after_id}
+        else:
+            self.dump = lambda row: None if row is None else dump_row(row)
+
+    def parse_payload(self, data: Dict[str, Any]) -> Any:
+        return data if self.payload is None else self.payload.validate_python(data)
+
+    def execute(self, payload: Any) -> Any:
+        # Runs the handler and converts its rows while still in the executor (under the db lock)
+        return self.dump(self.handler(payload))
+
+    def cache_key(self, payload: Any, content_type: str) -> Tuple[str, str, str, bytes]:
+        # The validated payload as JSON, so requests that differ only in key order or in
+        # coerced values share an entry; actions without a payload schema ignore their data
+        data = b"" if self.payload is None else self.payload.dump_json(payload)
+        return self.version, self.name, content_type, data
+
+    def take(self, rows: Iterable[Any], size: int) -> List[Any]:
+        # Next `size` rows of a stream handler, converted; an empty list means the stream is over
+        return [self.dump_row(row) for row in islice(rows, size)]
+
+
+_compiled: Dict[Tuple[str, str], CompiledAction] = {
+    (version, name): CompiledAction(version, name, action)
+    for version, actions in _actions.items()
+    for name, action in actions.items()
+}
+
+
+def get_action(version: str, action: str) -> CompiledAction | None:
+    return _compiled.get((version, action))
+
+def known_versions() -> list[str]:
+    return list(_actions)
+
+
+def parse_request(request_data: Any) -> Tuple[RequestMessage, Optional[CompiledAction], Optional[ValidationError]]:
+    """Validates a decoded request: envelope and typed payload in one pass.
 
+    Envelope errors raise ValidationError (the message goes to the DLQ). A payload
+    error is returned instead, with the envelope, so the caller can still check auth
+    and idempotency and answer with an error reply. Unknown actions are validated as
+    a plain RequestMessage and come back with action None.
+    """
+    action = None
+    if isinstance(request_data, dict):
+        version, name = request_data.get("version"), request_data.get("action")
+        if isinstance(version, str) and isinstance(name, str):
+            action = _compiled.get((version, name))
+    if action is None:
+        return RequestMessage.model_validate(request_data), None, None
+    try:
+        return action.request.validate_python(request_data), action, None
+    except ValidationError as e:
+        if any(error["loc"][:1] != ("data",) for error in e.errors()):
+            raise
+        payload_error = e
+    envelope = RequestMessage.model_validate(request_data)
+    try:
+        # Only the payload is invalid: the same error again, reported against the payload schema
+        action.payload.validate_python(envelope.data)
+    except ValidationError as e:
+        payload_error = e
+    return envelope, action, payload_error
@@ -1,69 +1,51 @@
 import logging
-from src.core.storage import db
-from src.schemas.user import UserCreate, UserUpdate, UserOut
+from typing import Iterator
+
+from src.core.storage import User, db
+from src.schemas.protocol import EntityRef
+from src.schemas.user import UserCreate, UserUpdateById
 
 logger = logging.getLogger(__name__)
 
-def create_user(data: dict) -> UserOut:
-    payload = UserCreate(**data)
+def create_user(payload: UserCreate) -> User:
     # Semantic idempotency: check if user with this email already exists
     email = str(payload.email)
-    for user in db.users.values():
-        if user.email == email:
-            # Return existing user instead of creating duplicate
-            logger.info(f"User with email {email} already exists, returning existing user")
-            return UserOut.model_validate(user)
-    
+    user = db.find_user_by_email(email)
+    if user:
+        # Return existing user instead of creating duplicate
+        logger.info(f"User with email {email} already exists, returning existing user")
+        return user
+
     # Create new user if email doesn't exist
-    user = db.create_user(name=payload.name, email=email)
-    return UserOut.model_validate(user)
+    return db.create_user(name=payload.name, email=email)
 
-def list_users(data: dict) -> list[UserOut]:
-    return [UserOut.model_validate(u) for u in db.users.values()]
+def iter_users(data: dict) -> Iterator[User]:
+    # Lazy keyset scan, like iter_tasks
+    return db.iter_users()
 
-def get_user(data: dict) -> UserOut:
-    user_id = data.get("id")
-    if user_id is None:
-        raise ValueError("id is required")
-    
-    user = db.users.get(int(user_id))
+def list_users(data: dict) -> list[User]:
+    return list(db.users.values())
+
+def get_user(payload: EntityRef) -> User:
+    user = db.users.get(payload.id)
     if not user:
         raise ValueError("User not found")
-    return UserOut.model_validate(user)
+    return user
 
-def update_user(data: dict) -> UserOut:
-    user_id = data.get("id")
-    if user_id is None:
-        raise ValueError("id is required")
-        
-    payload = UserUpdate(**data)
-    
-    user = db.users.get(int(user_id))
-    if not user:
+def update_user(payload: UserUpdateById) -> User:
+    if payload.id not in db.users:
         raise ValueError("User not found")
-        
-    if payload.name is not None:
-        user.name = payload.name
-    if payload.email is not None:
-        user.email = str(payload.email)
-        
-    db.users[int(user_id)] = user
-    return UserOut.model_validate(user)
 
-def delete_user(data: dict) -> None:
-    user_id = data.get("id")
-    if user_id is None:
-        raise ValueError("id is required")
-    
-    uid = int(user_id)
-    if uid not in db.users:
+    return db.update_user(
+        payload.id,
+        name=payload.name,
+        email=str(payload.email) if payload.email is not None else None,
+    )
+
+def delete_user(payload: EntityRef) -> None:
+    if payload.id not in db.users:
         raise ValueError("User not found")
-    
-    # Detach user from tasks
-    for t in db.tasks.values():
-        if t.user_id == uid:
-            t.user_id = None
-            
-    del db.users[uid]
-    return None
 
+    # Removes the email index entry and detaches the user from tasks
+    db.delete_user(payload.id)
+    return None
@@ -0,0 +1,17 @@
+from itertools import islice
+from typing import Any, Iterable, List, NamedTuple, Optional
+
+from src.schemas.page import PageQuery
+
+
+class RowPage(NamedTuple):
+    rows: List[Any]
+    next_after_id: Optional[int]  # pass as after_id to get the next page; None on the last page
+
+
+def paginate(rows: Iterable[Any], query: PageQuery) -> RowPage:
+    # `rows` is a lazy keyset iterator; one row past the limit tells whether a next page exists
+    taken = list(islice(rows, query.limit + 1))
+    if len(taken) > query.limit:
+        return RowPage(taken[:query.limit], taken[query.limit - 1].id)
+    return RowPage(taken, None)
@@ -0,0 +1,11 @@
+from typing import Iterator
+
+from src.core.storage import Project, db
+from src.handlers.v2.pagination import RowPage, paginate
+from src.schemas.page import PageQuery
+
+def iter_projects(payload: PageQuery) -> Iterator[Project]:
+    return db.iter_projects(payload.after_id)
+
+def list_projects(payload: PageQuery) -> RowPage:
+    return paginate(db.iter_projects(payload.after_id), payload)
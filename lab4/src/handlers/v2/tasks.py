@@ -0,0 +1,63 @@
+from typing import Iterator
+
+from src.core.storage import Task, db
+from src.handlers.v2.pagination import RowPage, paginate
+from src.schemas.task import TaskCreateV2, TaskListQueryV2, TaskUpdateV2ById
+
+def _filtered(query: TaskListQueryV2) -> Iterator[Task]:
+    # storage walks the most selective index; the rows it yields are checked against the rest
+    rows = db.iter_tasks(
+        query.after_id,
+        project_id=query.project_id,
+        user_id=query.user_id,
+        completed=query.completed,
+        priority_min=query.priority_min,
+        priority_max=query.priority_max,
+    )
+    for task in rows:
+        if query.project_id is not None and task.project_id != query.project_id:
+            continue
+        if query.user_id is not None and task.user_id != query.user_id:
+            continue
+        if query.completed is not None and task.completed != query.completed:
+            continue
+        if query.priority_min is not None and (task.priority is None or task.priority < query.priority_min):
+            continue
+        if query.priority_max is not None and (task.priority is None or task.priority > query.priority_max):
+            continue
+        yield task
+
+def create_task(payload: TaskCreateV2) -> Task:
+    if payload.project_id not in db.projects:
+        raise ValueError("Project not found")
+    if payload.user_id is not None and payload.user_id not in db.users:
+        raise ValueError("User not found")
+
+    return db.create_task_v2(
+        project_id=payload.project_id,
+        title=payload.title,
+        completed=payload.completed,
+        priority=payload.priority,
+        user_id=payload.user_id,
+    )
+
+def iter_tasks(payload: TaskListQueryV2) -> Iterator[Task]:
+    # Streamed variant: every match after after_id, `limit` is not applied
+    return _filtered(payload)
+
+def list_tasks(payload: TaskListQueryV2) -> RowPage:
+    return paginate(_filtered(payload), payload)
+
+def update_task(payload: TaskUpdateV2ById) -> Task:
+    if payload.id not in db.tasks:
+        raise ValueError("Task not found")
+    if payload.user_id is not None and payload.user_id not in db.users:
+        raise ValueError("User not found")
+
+    return db.update_task(
+        payload.id,
+        title=payload.title,
+        completed=payload.completed,
+        priority=payload.priority,
+        user_id=payload.user_id,
+    )
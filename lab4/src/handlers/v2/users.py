@@ -0,0 +1,11 @@
+from typing import Iterator
+
+from src.core.storage import User, db
+from src.handlers.v2.pagination import RowPage, paginate
+from src.schemas.page import PageQuery
+
+def iter_users(payload: PageQuery) -> Iterator[User]:
+    return db.iter_users(payload.after_id)
+
+def list_users(payload: PageQuery) -> RowPage:
+    return paginate(db.iter_users(payload.after_id), payload)
@@ -13,6 +13,10 @@ class ProjectUpdate(BaseModel):
     description: str | None = None
 
 
+class ProjectUpdateById(ProjectUpdate):
+    id: int
+
+
 class ProjectOut(BaseModel):
     id: int
     name: str
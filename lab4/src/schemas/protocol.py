@@ -1,12 +1,25 @@
-from typing import Any, Optional, Dict
+from typing import Any, Optional, Dict, List
 from pydantic import BaseModel, Field
 
+# Headers of a streamed reply: every chunk is a ResponseMessage whose `data` is a slice of the
+# result list; chunks share the correlation_id, are numbered from 0 and the last one has end=true
+STREAM_SEQ_HEADER = "x-stream-seq"
+STREAM_END_HEADER = "x-stream-end"
+# Unix time in milliseconds after which the sender no longer waits for the reply: the server
+# drops a request that gets to it later instead of executing it (client and server clocks must agree)
+DEADLINE_HEADER = "x-deadline"
+
 class RequestMessage(BaseModel):
     id: str
     version: str
     action: str
     data: Dict[str, Any] = Field(default_factory=dict)
     auth: Optional[str] = None
+    stream: bool = False  # list actions reply in chunks instead of one message
+
+class EntityRef(BaseModel):
+    # payload of get_* / delete_* actions
+    id: int
 
 class ResponseMessage(BaseModel):
     correlation_id: str
@@ -14,3 +27,21 @@ class ResponseMessage(BaseModel):
     data: Optional[Any] = None
     error: Optional[str] = None
 
+
+class BatchItem(BaseModel):
+    id: str  # per-item idempotency key
+    action: str
+    data: Dict[str, Any] = Field(default_factory=dict)
+
+class BatchRequestMessage(BaseModel):
+    id: str
+    version: str
+    items: List[BatchItem] = Field(..., min_length=1)
+    atomic: bool = False  # all-or-nothing: roll back every item if one fails
+    auth: Optional[str] = None
+
+class BatchItemResult(BaseModel):
+    id: str
+    status: str  # "ok", "error", "rolled_back" or "skipped"
+    data: Optional[Any] = None
+    error: Optional[str] = None
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from typing import Optional
 from pydantic import BaseModel, Field
+from .page import PageQuery
 from .user import UserOut
 
 
@@ -26,6 +27,18 @@ class TaskUpdateV2(TaskUpdateV1):
     user_id: Optional[int] = None
 
 
+class TaskUpdateV1ById(TaskUpdateV1):
+    id: int
+
+
+class TaskUpdateV2ById(TaskUpdateV2):
+    id: int
+
+
+class TaskListQueryV1(BaseModel):
+    project_id: Optional[int] = None
+
+
 class TaskOutV1(BaseModel):
     id: int
     project_id: int
@@ -50,3 +63,11 @@ class TaskOutV3(TaskOutV2):
 class TaskOutV3WithUser(TaskOutV3):
     user: UserOut | None = None
 
+
+
+class TaskListQueryV2(PageQuery):
+    project_id: Optional[int] = None
+    completed: Optional[bool] = None
+    priority_min: Optional[int] = Field(default=None, ge=0)
+    priority_max: Optional[int] = Field(default=None, ge=0)
+    user_id: Optional[int] = None
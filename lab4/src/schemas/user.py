@@ -13,6 +13,10 @@ class UserUpdate(BaseModel):
     email: EmailStr | None = None
 
 
+class UserUpdateById(UserUpdate):
+    id: int
+
+
 class UserOut(BaseModel):
     id: int
     name: str
@@ -1,177 +1,410 @@
 import asyncio
-import json
 import logging
+import time
 import traceback
-from aio_pika import connect, IncomingMessage, Message, ExchangeType
+from aio_pika import connect_robust, IncomingMessage, Message
 from pydantic import ValidationError
 
 from src.core.config import settings
+from src.core.codecs import Codec, get_codec, response_envelope
 from src.core.storage import db
-from src.schemas.protocol import RequestMessage, ResponseMessage
-from src.handlers.registry import get_handler
+from src.core.publisher import publisher
+from src.core.engine import ConsumerEngine, handler_executor
+from src.core.events import events
+from src.core.logs import log_payload, log_stats, setup_logging
+from src.core.metrics import exporter, metrics
+from src.core.result_cache import result_cache
+from src.core.retry import retries
+from src.core.wal import wal
+from src.schemas.protocol import (
+    RequestMessage, ResponseMessage, BatchRequestMessage, DEADLINE_HEADER, STREAM_SEQ_HEADER, STREAM_END_HEADER
+)
+from src.handlers.registry import CompiledAction, known_versions, parse_request
+from src.handlers.batch import execute_batch
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# request id -> event set once the first delivery of that id has been answered
+_in_progress: dict[str, asyncio.Event] = {}
+
+# label for messages that could not be decoded, and for versions/actions outside the registry
+# (labels must not take arbitrary values from the wire)
+UNKNOWN = ("unknown", "unknown")
+
+def metric_labels(request, action: CompiledAction | None) -> tuple[str, str]:
+    if request.version not in known_versions():
+        return UNKNOWN
+    if isinstance(request, BatchRequestMessage):
+        return request.version, "batch"
+    if action is None:
+        return request.version, "unknown"
+    return request.version, action.name
+
+def expired(message: IncomingMessage) -> bool:
+    # True once the sender's deadline has passed: nobody waits for the reply any more
+    deadline = (message.headers or {}).get(DEADLINE_HEADER)
+    if deadline is None:
+        return False
+    try:
+        return time.time() * 1000 > int(deadline)
+    except (TypeError, ValueError):
+        return False
+
 async def process_message(message: IncomingMessage):
     async with message.process(ignore_processed=True):
+        labels = UNKNOWN
         try:
-            body = message.body.decode()
-            logger.info(f"Received message: {body}")
-            
+            started = time.perf_counter()
             try:
-                request_data = json.loads(body)
-                request = RequestMessage(**request_data)
-            except (json.JSONDecodeError, ValidationError) as e:
+                # The codec is picked from content_type; the reply is encoded the same way
+                codec = get_codec(message.content_type)
+                request_data = codec.loads(message.body)
+                decoded = time.perf_counter()
+                log_payload(logger, "Received message", message.body)
+                # Single requests are validated against the compiled action: envelope and
+                # typed payload in one pass; a payload error is answered after auth and idempotency
+                action = payload_error = None
+                if isinstance(request_data, dict) and "items" in request_data:
+                    request = BatchRequestMessage.model_validate(request_data)
+                else:
+                    request, action, payload_error = parse_request(request_data)
+                validated = time.perf_counter()
+            except (ValueError, ValidationError) as e:
                 logger.error(f"Invalid message format: {e}")
                 # Can't reply if we can't parse the ID/correlation info properly, 
                 # but if we can parse enough to get correlation_id or we use message properties...
                 # The prompt says request has "id". Response has "correlation_id".
                 # If JSON fails, we might send to DLQ or just log.
                 # We'll treat this as unrecoverable for now.
+                metrics.count(labels, "dlq")
                 await send_to_dlq(message, f"Invalid format: {str(e)}")
                 return
 
-            # 1. Auth
-            if request.auth != settings.default_api_key:
-                response = ResponseMessage(
-                    correlation_id=request.id,
-                    status="error",
-                    error="Unauthorized"
-                )
-                await send_response(message, response)
+            labels = metric_labels(request, action)
+            metrics.observe(labels, "decode", decoded - started)
+            metrics.observe(labels, "validate", validated - decoded)
+            if expired(message):
+                # Shed load: the client has given up, executing the request would only delay others
+                logger.info("Dropping expired request %s", request.id)
+                metrics.count(labels, "shed")
                 return
+            with metrics.track(labels):
+                outcome = await handle_request(message, request, action, payload_error, codec, labels)
+            metrics.count(labels, outcome)
 
-            # 2. Idempotency - check if request was already processed
-            if request.id in db.idempotency:
-                logger.info(f"Duplicate request {request.id}, returning cached response")
-                cached_response_data = db.idempotency[request.id]
-                response = ResponseMessage(**cached_response_data)
-                await send_response(message, response)
-                return
+        except Exception as e:
+            logger.error(f"Critical error processing message: {e}")
+            # Unexpected failures may be transient: redeliver with backoff, then dead-letter
+            try:
+                outcome = await retries.handle_failure(message, str(e))
+            except Exception as retry_error:
+                logger.error(f"Could not schedule a retry: {retry_error}")
+                await message.reject(requeue=True)
+                outcome = "retry"
+            metrics.count(labels, outcome)
 
-            # 3. Dispatch
-            handler = get_handler(request.version, request.action)
-            if not handler:
-                response = ResponseMessage(
-                    correlation_id=request.id,
-                    status="error",
-                    error=f"Unknown action: {request.action} for version {request.version}"
-                )
-                await send_response(message, response)
-                return
+async def handle_request(
+    message: IncomingMessage,
+    request,
+    action: CompiledAction | None,
+    payload_error: ValidationError | None,
+    codec: Codec,
+    labels: tuple[str, str],
+) -> str:
+    # Answers a decoded request; returns the outcome for metrics: ok, error or duplicate
 
-            # 4. Execute
-            try:
-                result = handler(request.data)
-                
-                # Serialize result
-                # If result is pydantic model, dump it. If list of models, dump them.
-                data_out = None
-                if result is not None:
-                    if isinstance(result, list):
-                        data_out = [item.model_dump() if hasattr(item, "model_dump") else item for item in result]
-                    elif hasattr(result, "model_dump"):
-                        data_out = result.model_dump()
-                    else:
-                        data_out = result
-
-                response = ResponseMessage(
-                    correlation_id=request.id,
-                    status="ok",
-                    data=data_out
-                )
-                
-                # Cache response for idempotency
-                db.idempotency[request.id] = response.model_dump()
-                
-                await send_response(message, response)
+    # 1. Auth
+    if request.auth != settings.default_api_key:
+        response = ResponseMessage(
+            correlation_id=request.id,
+            status="error",
+            error="Unauthorized"
+        )
+        with metrics.timed(labels, "publish"):
+            await send_response(message, response, codec)
+        return "error"
 
-            except Exception as e:
-                logger.error(f"Error executing handler: {e}")
-                logger.error(traceback.format_exc())
-                response = ResponseMessage(
-                    correlation_id=request.id,
-                    status="error",
-                    error=str(e)
-                )
-                # Cache error response for idempotency too
-                db.idempotency[request.id] = response.model_dump()
-                await send_response(message, response)
+    # 2. Idempotency - check if request was already processed
+    pending = _in_progress.get(request.id)
+    if pending is not None:
+        await pending.wait()
+    cached = db.idempotency.get(request.id)
+    if cached is not None:
+        logger.info("Duplicate request %s, returning cached response", request.id)
+        body = cached.body
+        if cached.content_type != codec.content_type:
+            body = codec.dumps(get_codec(cached.content_type).loads(body))
+        with metrics.timed(labels, "publish"):
+            await send_reply(message, body, codec, request.id, "duplicate")
+        return "duplicate"
+
+    # Register the request so a duplicate delivered concurrently waits for this copy
+    done = asyncio.Event()
+    _in_progress[request.id] = done
+    try:
+        # 3. Batch: items are dispatched and cached one by one inside the executor
+        if isinstance(request, BatchRequestMessage):
+            with metrics.timed(labels, "handler"):
+                response = await handler_executor.run(execute_batch, request)
+            with metrics.timed(labels, "publish"):
+                await send_response(message, response, codec, cache=True)
+            return response.status
+
+        # 4. Streamed list: chunks are published as they are produced and not cached,
+        # so the whole stream counts as the handler phase
+        if request.stream and action is not None and action.stream is not None and payload_error is None:
+            with metrics.timed(labels, "handler"):
+                return await stream_response(message, request, action, codec)
 
+        # 5. Dispatch
+        if action is None:
+            response = ResponseMessage(
+                correlation_id=request.id,
+                status="error",
+                error=f"Unknown action: {request.action} for version {request.version}"
+            )
+            with metrics.timed(labels, "publish"):
+                await send_response(message, response, codec)
+            return "error"
+
+        # 6. Execute
+        try:
+            if payload_error is not None:
+                raise payload_error
+            if action.reads and result_cache.enabled:
+                with metrics.timed(labels, "handler"):
+                    body = await cached_read(request, action, codec)
+                with metrics.timed(labels, "publish"):
+                    await send_body(message, body, codec, request.id, "ok", cache=True)
+                return "ok"
+            with metrics.timed(labels, "handler"):
+                data = await handler_executor.run(action.execute, request.data, read_only=bool(action.reads))
+
+            response = ResponseMessage(
+                correlation_id=request.id,
+                status="ok",
+                data=data
+            )
         except Exception as e:
-            logger.error(f"Critical error processing message: {e}")
-            await send_to_dlq(message, str(e))
+            logger.error(f"Error executing handler: {e}")
+            logger.error(traceback.format_exc())
+            response = ResponseMessage(
+                correlation_id=request.id,
+                status="error",
+                error=str(e)
+            )
+
+        # Cache the response (errors too) for idempotency
+        with metrics.timed(labels, "publish"):
+            await send_response(message, response, codec, cache=True)
+        return response.status
+
+    finally:
+        _in_progress.pop(request.id, None)
+        done.set()
+
+def _versioned_execute(action: CompiledAction, payload) -> tuple:
+    # Runs in the executor: the versions are read under the same lock as the handler
+    return db.versions_of(action.reads), action.execute(payload)
 
-async def send_response(message: IncomingMessage, response: ResponseMessage):
+# (cache key, versions at lookup) -> encoded data being computed, so concurrent misses
+# for the same read after a write run the action once
+_loading: dict[tuple, asyncio.Future] = {}
+
+async def cached_read(request: RequestMessage, action: CompiledAction, codec: Codec) -> bytes:
+    # Read-through: splices cached encoded data into the reply while the collections the action
+    # reads are unchanged; otherwise run it and cache the result with the versions it saw
+    key = action.cache_key(request.data, codec.content_type)
+    versions = db.versions_of(action.reads)
+    data = result_cache.get(key, versions)
+    if data is None:
+        flight = (key, versions)
+        pending = _loading.get(flight)
+        if pending is not None:
+            data = await pending
+        else:
+            future = _loading[flight] = asyncio.get_running_loop().create_future()
+            try:
+                seen, result = await handler_executor.run(_versioned_execute, action, request.data, read_only=True)
+                data = codec.dumps(result)
+                result_cache.put(key, seen, data)
+                future.set_result(data)
+            except Exception as e:
+                future.set_exception(e)
+                future.exception()  # retrieved: waiters, if any, get it re-raised
+                raise
+            finally:
+                _loading.pop(flight, None)
+    return codec.ok_reply(request.id, data)
+
+async def send_response(message: IncomingMessage, response: ResponseMessage, codec: Codec, cache: bool = False):
+    body = codec.dumps(response_envelope(response))
+    await send_body(message, body, codec, response.correlation_id, response.status, cache)
+
+async def send_body(message: IncomingMessage, body: bytes, codec: Codec, correlation_id: str, status: str, cache: bool = False):
+    # group commit: the reply goes out once the writes it reports are on disk; if that
+    # fails nothing is cached, so the redelivery fails again instead of replaying a success
+    await wal.sync()
+    if cache:
+        # The serialized body itself is cached, so duplicates are replayed byte for byte
+        db.idempotency.put(correlation_id, body, codec.content_type)
+    await send_reply(message, body, codec, correlation_id, status)
+
+async def send_reply(message: IncomingMessage, body: bytes, codec: Codec, correlation_id: str, status: str, headers: dict | None = None):
     # Determine reply queue: message.reply_to or settings.queue_responses
     reply_to = message.reply_to or settings.queue_responses
-    correlation_id = message.correlation_id or response.correlation_id
-    
-    connection = await connect(settings.rabbitmq_url)
-    async with connection:
-        channel = await connection.channel()
-        
-        await channel.default_exchange.publish(
-            Message(
-                body=response.model_dump_json().encode(),
-                correlation_id=correlation_id
-            ),
-            routing_key=reply_to
-        )
-    logger.info(f"Sent response to {reply_to}: {response.status}")
+
+    await publisher.publish(
+        Message(
+            body=body,
+            content_type=codec.content_type,
+            correlation_id=message.correlation_id or correlation_id,
+            headers=headers
+        ),
+        routing_key=reply_to
+    )
+    logger.info("Sent response to %s: %s", reply_to, status)
+
+async def stream_response(message: IncomingMessage, request: RequestMessage, action: CompiledAction, codec: Codec) -> str:
+    # The stream handler returns an iterator of rows; every chunk is taken and converted in
+    # the executor, so memory is bounded by one chunk instead of the whole table
+    size = settings.stream_chunk_size
+
+    async def chunks():
+        rows = await handler_executor.run(action.stream, request.data, read_only=True)
+        while True:
+            chunk = await handler_executor.run(action.take, rows, size, read_only=True)
+            if not chunk:
+                return
+            yield chunk
+
+    return await send_stream(message, request.id, chunks(), codec)
+
+async def send_stream(message: IncomingMessage, correlation_id: str, chunks, codec: Codec) -> str:
+    # Publishes an async iterator of lists as numbered chunks. One chunk is held back so the
+    # last one can carry the end marker; an empty result is a single empty chunk.
+    # Returns the status of the final chunk.
+    seq = 0
+    try:
+        current = []
+        first = True
+        async for chunk in chunks:
+            if not first:
+                await send_chunk(message, correlation_id, codec, seq, ResponseMessage(
+                    correlation_id=correlation_id, status="ok", data=current
+                ))
+                seq += 1
+            current, first = chunk, False
+        response = ResponseMessage(correlation_id=correlation_id, status="ok", data=current)
+    except Exception as e:
+        logger.error(f"Error streaming {correlation_id}: {e}")
+        logger.error(traceback.format_exc())
+        response = ResponseMessage(correlation_id=correlation_id, status="error", error=str(e))
+    await send_chunk(message, correlation_id, codec, seq, response, end=True)
+    return response.status
+
+async def send_chunk(message: IncomingMessage, correlation_id: str, codec: Codec, seq: int, response: ResponseMessage, end: bool = False):
+    headers = {STREAM_SEQ_HEADER: seq, STREAM_END_HEADER: end}
+    await send_reply(message, codec.dumps(response_envelope(response)), codec, correlation_id, f"chunk {seq}", headers)
 
 async def send_to_dlq(message: IncomingMessage, reason: str):
-    connection = await connect(settings.rabbitmq_url)
-    async with connection:
-        channel = await connection.channel()
-        await channel.declare_queue(settings.queue_dlq, durable=True)
-        
-        # Add header with reason
-        headers = message.headers or {}
-        headers['x-dlq-reason'] = reason
-        
-        await channel.default_exchange.publish(
-            Message(
-                body=message.body,
-                headers=headers
-            ),
-            routing_key=settings.queue_dlq
-        )
-    logger.info(f"Sent message to DLQ: {reason}")
+    await retries.dead_letter(message, reason)
 
-async def main():
-    logger.info("Starting Server...")
-    
+def lane_queues(queue_name: str) -> dict[str, int]:
+    # queue -> weight: the request queue and one "<queue>.<lane>" per configured priority lane
+    lanes = {queue_name: 1}
+    for lane, weight in settings.request_lanes.items():
+        lanes[f"{queue_name}.{lane}"] = weight
+    return lanes
+
+async def start_server(connection, queue_name: str | None = None) -> ConsumerEngine:
+    # Declares the queues and starts consuming on an open connection (RabbitMQ or a stand-in).
+    # Shard workers pass their own queue instead of settings.queue_requests.
+    queue_name = queue_name or settings.queue_requests
+    lanes = lane_queues(queue_name)
+    channel = await connection.channel()
+
+    # Declare queues
+    await channel.declare_queue(settings.queue_responses, durable=True)
+    await channel.declare_queue(settings.queue_dlq, durable=True)
+    for name in lanes:
+        await channel.declare_queue(name, durable=True)
+        await retries.declare(channel, name)
+
+    # Replies and DLQ messages go through a pool of channels on this connection
+    await publisher.start(connection)
+
+    # Restore the data from the write-ahead log before taking requests
+    await wal.start(db)
+    # Replayed mutations are not reported, so events start with the first new change
+    await events.start(connection, db, queue_name)
+
+    logger.info(f"Listening on {', '.join(lanes)}")
+
+    # One channel per lane: each gets its own prefetch window
+    engine = ConsumerEngine(queue_name, process_message, weights=lanes)
+    for name in lanes:
+        lane_channel = channel if name == queue_name else await connection.channel()
+        await engine.start(lane_channel, await lane_channel.declare_queue(name, durable=True))
+
+    metrics.register("rpc_engine", {"queue": queue_name}, engine.stats)
+    metrics.register("rpc_idempotency", {}, idempotency_stats)
+    metrics.register("rpc_log", {}, log_stats)
+    metrics.register("rpc_retry", {"queue": queue_name}, retries.stats)
+    metrics.register("rpc_result_cache", {}, result_cache.stats)
+    if wal.enabled:
+        metrics.register("rpc_wal", {}, wal.stats)
+    if events.enabled:
+        metrics.register("rpc_events", {}, events.stats)
+    await exporter.start()
+    return engine
+
+def idempotency_stats() -> dict:
+    return db.idempotency.stats()
+
+async def stop_server(engine: ConsumerEngine):
+    await engine.stop()
+    metrics.unregister(engine.stats)
+    metrics.unregister(idempotency_stats)
+    metrics.unregister(log_stats)
+    metrics.unregister(retries.stats)
+    metrics.unregister(result_cache.stats)
+    metrics.unregister(wal.stats)
+    metrics.unregister(events.stats)
+    await exporter.stop()
+    await events.stop()
+    await publisher.close()
+    handler_executor.shutdown()
+    await wal.stop()
+
+async def connect_with_retry():
     # Retry connection logic
-    retries = 5
-    while retries > 0:
+    for attempt in range(5):
         try:
-            connection = await connect(settings.rabbitmq_url)
-            break
+            return await connect_robust(settings.rabbitmq_url)
         except Exception as e:
-            logger.warning(f"Failed to connect to RabbitMQ: {e}. Retrying in 5 seconds...")
-            retries -= 1
+            logger.warning(f"Failed to connect to RabbitMQ (attempt {attempt + 1}): {e}. Retrying in 5 seconds...")
             await asyncio.sleep(5)
-    else:
-        logger.error("Could not connect to RabbitMQ after multiple attempts.")
+    logger.error("Could not connect to RabbitMQ after multiple attempts.")
+    return None
+
+async def main(queue_name: str | None = None):
+    logger.info("Starting Server...")
+
+    connection = await connect_with_retry()
+    if connection is None:
         return
-    
+
     async with connection:
-        channel = await connection.channel()
-        
-        # Declare queues
-        queue = await channel.declare_queue(settings.queue_requests, durable=True)
-        await channel.declare_queue(settings.queue_responses, durable=True)
-        await channel.declare_queue(settings.queue_dlq, durable=True)
-        
-        logger.info(f"Listening on {settings.queue_requests}")
-        
-        await queue.consume(process_message)
-        
+        engine = await start_server(connection, queue_name)
+
         # Keep running
-        await asyncio.Future()
+        try:
+            await asyncio.Future()
+        finally:
+            await stop_server(engine)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.core.storage import db  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def empty_db():
+    # db is a module-level singleton: every test starts from an empty store
+    db.load_state({"id_counters": {}, "projects": [], "tasks": [], "users": []})
+    db.idempotency.clear()
+    yield db
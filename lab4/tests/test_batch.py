@@ -0,0 +1,70 @@
+from src.core.storage import Mutation
+from src.handlers.batch import execute_batch
+from src.schemas.protocol import BatchRequestMessage
+
+from tests.test_storage import assert_indexes_consistent
+
+
+def batch(*items, atomic=True):
+    return BatchRequestMessage(
+        id="batch-1",
+        version="v2",
+        atomic=atomic,
+        items=[{"id": f"item-{i}", "action": action, "data": data} for i, (action, data) in enumerate(items)],
+    )
+
+
+def test_failed_item_rolls_back_the_whole_batch(empty_db):
+    project = empty_db.create_project("P")
+    task = empty_db.create_task_v2(project.id, "kept", priority=1)
+    state = empty_db.dump_state()
+    notified = []
+    empty_db.listeners.append(notified.append)
+
+    response = execute_batch(batch(
+        ("create_task", {"project_id": project.id, "title": "new", "priority": 5}),
+        ("update_task", {"id": task.id, "completed": True, "priority": 9}),
+        ("delete_project", {"id": project.id}),
+        ("get_task", {"id": 999}),
+        ("create_project", {"name": "never"}),
+    ))
+
+    assert response.status == "error"
+    assert [item["status"] for item in response.data] == ["rolled_back"] * 3 + ["error", "skipped"]
+    assert empty_db.dump_state() == state
+    assert_indexes_consistent(empty_db)
+    assert notified == []
+    # rolled back items are not cached, so a retry runs them again
+    assert empty_db.idempotency.get("item-0") is None
+
+
+def test_committed_batch_notifies_once_and_caches_items(empty_db):
+    project = empty_db.create_project("P")
+    notified = []
+    empty_db.listeners.append(notified.append)
+
+    response = execute_batch(batch(
+        ("create_task", {"project_id": project.id, "title": "a"}),
+        ("create_task", {"project_id": project.id, "title": "b"}),
+    ))
+
+    assert response.status == "ok"
+    assert len(notified) == 1 and all(isinstance(m, Mutation) for m in notified[0])
+    assert len(notified[0]) == 2
+    assert empty_db.idempotency.get("item-1") is not None
+    assert_indexes_consistent(empty_db)
+
+
+def test_non_atomic_batch_keeps_the_items_before_a_failure(empty_db):
+    project = empty_db.create_project("P")
+
+    response = execute_batch(batch(
+        ("create_task", {"project_id": project.id, "title": "a"}),
+        ("get_task", {"id": 999}),
+        ("create_task", {"project_id": project.id, "title": "b"}),
+        atomic=False,
+    ))
+
+    assert response.status == "ok"
+    assert [item["status"] for item in response.data] == ["ok", "error", "ok"]
+    assert len(empty_db.tasks) == 2
@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+
+from aio_pika import Message
+
+from benchmarks import rpc
+from benchmarks.inmemory_amqp import InMemoryBroker
+
+
+async def consume_into(channel, name, received, **kwargs):
+    queue = await channel.declare_queue(name)
+
+    async def on_message(message):
+        received.append(message)
+
+    await queue.consume(on_message, **kwargs)
+
+
+def test_prefetch_holds_back_deliveries_until_acked():
+    async def scenario():
+        broker = InMemoryBroker()
+        channel = await (await broker.connect()).channel()
+        await channel.set_qos(prefetch_count=2)
+        received = []
+        await consume_into(channel, "work", received)
+        for n in range(5):
+            await channel.default_exchange.publish(Message(str(n).encode()), routing_key="work")
+        await asyncio.sleep(0)
+        held = (len(received), broker.queues["work"].depth)
+        await received[0].ack()
+        await asyncio.sleep(0)
+        return held, len(received)
+
+    assert asyncio.run(scenario()) == ((2, 3), 3)
+
+
+def test_requeued_message_is_redelivered():
+    async def scenario():
+        channel = await (await InMemoryBroker().connect()).channel()
+        received = []
+        await consume_into(channel, "work", received)
+        await channel.default_exchange.publish(Message(b"x"), routing_key="work")
+        await asyncio.sleep(0)
+        await received[0].nack(requeue=True)
+        await asyncio.sleep(0)
+        return [message.redelivered for message in received]
+
+    assert asyncio.run(scenario()) == [False, True]
+
+
+def test_rpc_benchmark_runs_against_the_real_server():
+    args = argparse.Namespace(
+        requests=200, concurrency=8, projects=2, seed_tasks=20,
+        content_type="application/json", mix=None,
+    )
+    result = asyncio.run(rpc.run(args))
+    assert result["errors"] == 0
+    assert result["messages_per_s"] > 0
+    assert result["latency"]["p50_ms"] <= result["latency"]["p99_ms"]
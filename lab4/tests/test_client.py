@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+from aio_pika import Message
+
+from benchmarks.inmemory_amqp import InMemoryBroker
+from src.client import RpcClient, StreamError
+from src.core.config import settings
+from src.schemas.protocol import STREAM_END_HEADER, STREAM_SEQ_HEADER
+
+
+async def fake_server(connection, chunks):
+    # Answers every request with `chunks`: (seq, end, items) tuples published in that order
+    channel = await connection.channel()
+    queue = await channel.declare_queue(settings.queue_requests, durable=True)
+
+    async def on_request(message):
+        async with message.process():
+            for seq, end, items in chunks:
+                body = {"correlation_id": message.correlation_id, "status": "ok", "data": items, "error": None}
+                headers = {STREAM_SEQ_HEADER: seq, STREAM_END_HEADER: end}
+                await channel.default_exchange.publish(
+                    Message(json.dumps(body).encode(), content_type="application/json",
+                            correlation_id=message.correlation_id, headers=headers),
+                    routing_key=message.reply_to,
+                )
+
+    await queue.consume(on_request)
+
+
+async def collect(client, **kwargs):
+    return [item async for item in client.stream("list_tasks", **kwargs)]
+
+
+def test_stream_reorders_and_drops_duplicate_chunks():
+    async def scenario():
+        connection = await InMemoryBroker().connect()
+        # seq 1 overtakes seq 0, then the whole stream is sent again (a retried request)
+        chunks = [(1, False, [3, 4]), (0, False, [1, 2]), (0, False, [1, 2]), (2, True, [5])]
+        await fake_server(connection, chunks + chunks)
+        async with RpcClient(connection) as client:
+            return await collect(client, timeout=1)
+
+    assert asyncio.run(scenario()) == [1, 2, 3, 4, 5]
+
+
+def test_stream_times_out_per_chunk():
+    async def scenario():
+        connection = await InMemoryBroker().connect()
+        await fake_server(connection, [(0, False, [1])])  # the end never comes
+        async with RpcClient(connection) as client:
+            await collect(client, timeout=0.1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(scenario())
+
+
+def test_close_fails_open_streams():
+    async def scenario():
+        connection = await InMemoryBroker().connect()
+        await fake_server(connection, [(0, False, [1])])
+        client = await RpcClient(connection).start()
+        consumer = asyncio.create_task(collect(client, timeout=30))
+        await asyncio.sleep(0.05)
+        await client.close()
+        await asyncio.wait_for(consumer, 1)
+
+    with pytest.raises(StreamError):
+        asyncio.run(scenario())
+
+
+async def echo_server(connection, batch_size):
+    # Holds requests until `batch_size` arrived, then answers them in reverse order
+    channel = await connection.channel()
+    queue = await channel.declare_queue(settings.queue_requests, durable=True)
+    held = []
+
+    async def on_request(message):
+        async with message.process():
+            held.append(message)
+            if len(held) < batch_size:
+                return
+            while held:
+                request = held.pop()
+                body = {"correlation_id": request.correlation_id, "status": "ok",
+                        "data": json.loads(request.body)["data"], "error": None}
+                await channel.default_exchange.publish(
+                    Message(json.dumps(body).encode(), content_type="application/json",
+                            correlation_id=request.correlation_id),
+                    routing_key=request.reply_to,
+                )
+
+    await queue.consume(on_request)
+
+
+def test_concurrent_calls_are_matched_by_correlation_id():
+    async def scenario():
+        connection = await InMemoryBroker().connect()
+        await echo_server(connection, batch_size=20)
+        async with RpcClient(connection, timeout=2) as client:
+            replies = await asyncio.gather(*(client.call("echo", {"n": n}) for n in range(20)))
+            return [reply.data["n"] for reply in replies], client.in_flight
+
+    assert asyncio.run(scenario()) == (list(range(20)), 0)
+
+
+def test_timed_out_call_is_forgotten_and_its_late_reply_dropped():
+    async def scenario():
+        connection = await InMemoryBroker().connect()
+        await echo_server(connection, batch_size=2)
+        async with RpcClient(connection, timeout=2) as client:
+            with pytest.raises(asyncio.TimeoutError):
+                await client.call("echo", {"n": 1}, timeout=0.05, request_id="late")
+            assert client.in_flight == 0
+            # the second request releases both replies; the one for "late" has no caller
+            reply = await client.call("echo", {"n": 2})
+            return reply.data, client.in_flight
+
+    assert asyncio.run(scenario()) == ({"n": 2}, 0)
+
+
+def test_max_in_flight_caps_outstanding_calls():
+    async def scenario():
+        connection = await InMemoryBroker().connect()
+        await echo_server(connection, batch_size=3)
+        async with RpcClient(connection, timeout=2, max_in_flight=2) as client:
+            calls = [asyncio.create_task(client.call("echo", {"n": n})) for n in range(3)]
+            await asyncio.sleep(0.05)
+            # the third call waits for a slot, so the server never gets three requests
+            assert client.in_flight == 2 and not any(call.done() for call in calls)
+            for call in calls:
+                call.cancel()
+            await asyncio.gather(*calls, return_exceptions=True)
+            return client.in_flight
+
+    assert asyncio.run(scenario()) == 0
@@ -0,0 +1,61 @@
+import asyncio
+
+from aio_pika import Message
+
+from benchmarks.inmemory_amqp import InMemoryBroker
+from src.client import RpcClient
+from src.cluster import Router, owner_of, route, shard_queue
+from src.core.codecs import get_codec
+
+
+def test_route_by_id_and_project():
+    assert route("get_task", {"id": 5}, "r", 3) == (owner_of(5, 3), None)
+    assert route("update_task", {"id": 5}, "r", 3) == (owner_of(5, 3), "task:5")
+    assert route("create_task", {"project_id": 2}, "r", 3) == (owner_of(2, 3), "project:2")
+    assert route("list_tasks", {}, "r", 3) is None
+
+
+def test_merge_pages_validates_limit():
+    replies = [
+        {"data": {"items": [{"id": 1}, {"id": 4}], "next_after_id": None}},
+        {"data": {"items": [{"id": 2}, {"id": 5}], "next_after_id": None}},
+    ]
+    page = Router._merge_pages({"action": "list_tasks", "data": {"limit": "3"}}, replies)
+    assert [row["id"] for row in page["items"]] == [1, 2, 4]
+    assert page["next_after_id"] == 4
+
+
+async def _start_shards(connection, shard_count, reply):
+    codec = get_codec()
+    for index in range(shard_count):
+        channel = await connection.channel()
+        queue = await channel.declare_queue(shard_queue(index))
+
+        async def on_message(message, channel=channel):
+            async with message.process():
+                request = codec.loads(message.body)
+                body = {"correlation_id": request["id"], "status": "ok", "data": reply(request), "error": None}
+                await channel.default_exchange.publish(
+                    Message(codec.dumps(body), correlation_id=message.correlation_id, content_type=codec.content_type),
+                    routing_key=message.reply_to,
+                )
+
+        await queue.consume(on_message)
+
+
+def test_failed_fan_out_is_answered():
+    async def scenario():
+        connection = await InMemoryBroker().connect()
+        router = Router(connection, 2)
+        await router.start()
+        # a v2 page whose shape the merge cannot handle: the fan-out raises
+        await _start_shards(connection, 2, lambda request: {"items": None, "next_after_id": None})
+        client = await RpcClient(connection).start()
+        try:
+            return await client.call("list_tasks", {}, version="v2", timeout=2)
+        finally:
+            await client.close()
+            await router.stop()
+
+    response = asyncio.run(scenario())
+    assert response.status == "error"
@@ -0,0 +1,35 @@
+import pytest
+
+from src.core.codecs import Codec, UnsupportedContentType, available_codecs, get_codec, response_envelope
+from src.schemas.protocol import ResponseMessage
+
+CODECS = list(available_codecs().values())
+
+
+def test_incomplete_codec_fails_on_instantiation():
+    class DumpsOnly(Codec):
+        def dumps(self, obj):
+            return b""
+
+    with pytest.raises(TypeError):
+        DumpsOnly()
+
+
+@pytest.mark.parametrize("codec", CODECS, ids=lambda codec: codec.name)
+def test_round_trip(codec):
+    value = {"id": "x", "data": [{"id": 1, "title": "Ünïcode", "completed": False, "priority": None}]}
+    assert codec.loads(codec.dumps(value)) == value
+
+
+@pytest.mark.parametrize("codec", CODECS, ids=lambda codec: codec.name)
+def test_ok_reply_matches_the_encoded_envelope(codec):
+    data = [{"id": 1, "name": "P"}]
+    envelope = response_envelope(ResponseMessage(correlation_id="c1", status="ok", data=data))
+    assert codec.loads(codec.ok_reply("c1", codec.dumps(data))) == codec.loads(codec.dumps(envelope))
+
+
+def test_content_type_negotiation():
+    assert get_codec(None).content_type == "application/json"
+    assert get_codec("Application/JSON; charset=utf-8").content_type == "application/json"
+    with pytest.raises(UnsupportedContentType):
+        get_codec("text/xml")
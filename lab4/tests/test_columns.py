@@ -0,0 +1,65 @@
+import pytest
+
+from src.core.config import settings
+from src.core.storage import InMemoryDB, Task, TaskColumns, TaskView
+
+from tests.test_storage import assert_indexes_consistent
+
+
+def test_rows_are_slotted():
+    assert not hasattr(Task(1, 1, "T"), "__dict__")
+
+
+def test_columns_behave_like_a_dict():
+    table = TaskColumns()
+    table[1] = Task(1, 10, "a", priority=3)
+    table[2] = Task(2, 10, "b", user_id=7)
+    table[5] = Task(5, 11, "c", completed=True)
+
+    row = table[2]
+    assert isinstance(row, TaskView)
+    assert (row.title, row.priority, row.user_id, row.completed) == ("b", None, 7, False)
+    row.priority, row.completed = 4, True
+    assert (table[2].priority, table[2].completed) == (4, True)
+
+    assert table.pop(1) == Task(1, 10, "a", priority=3)
+    assert 1 not in table and "x" not in table and len(table) == 2
+    assert list(table) == [2, 5]
+    with pytest.raises(KeyError):
+        table[3]
+    with pytest.raises(ValueError):
+        table[4] = Task(4, 10, "out of order")
+    table[1] = Task(1, 12, "revived")
+    assert [task.title for task in table.values()] == ["revived", "b", "c"]
+
+
+def test_columnar_db_matches_the_dict_layout(monkeypatch):
+    def run():
+        db = InMemoryDB()
+        project = db.create_project("P")
+        other = db.create_project("Q")
+        user = db.create_user("U", "u@example.com")
+        for i in range(20):
+            db.create_task_v2(project.id if i % 2 else other.id, f"T{i}", priority=i % 4 or None, user_id=user.id if i % 3 else None)
+        db.update_task(4, completed=True, priority=9)
+        db.delete_task(5)
+        db.begin()
+        db.delete_project(project.id)
+        db.create_task(other.id, "rolled back")
+        db.rollback()
+        db.delete_user(user.id)
+        assert_indexes_consistent(db)
+        return db
+
+    monkeypatch.setattr(settings, "storage_layout", "columnar")
+    columnar = run()
+    assert isinstance(columnar.tasks, TaskColumns)
+    monkeypatch.setattr(settings, "storage_layout", "objects")
+    rows = run()
+    # restored rows go back to the end of a dict, so only the columnar dump is in id order
+    assert columnar.dump_state()["tasks"] == sorted(rows.dump_state()["tasks"])
+
+    monkeypatch.setattr(settings, "storage_layout", "columnar")
+    restored = InMemoryDB()
+    restored.load_state(rows.dump_state())
+    assert restored.dump_state() == columnar.dump_state()
@@ -0,0 +1,54 @@
+import asyncio
+import json
+
+from aio_pika import Message
+
+from benchmarks.inmemory_amqp import InMemoryBroker
+from src import dlq_tool
+from src.core.config import settings
+
+
+async def fill(connection, count):
+    channel = await connection.channel()
+    await channel.declare_queue(settings.queue_dlq, durable=True)
+    await channel.declare_queue(settings.queue_requests, durable=True)
+    for i in range(count):
+        action = "create_project" if i % 2 else "get_project"
+        body = {"id": str(i), "version": "v1", "action": action, "data": {"name": f"p{i}"}, "auth": "key"}
+        reason = "broker hiccup" if i % 3 else "Invalid format: boom\nsecond line"
+        await channel.default_exchange.publish(
+            Message(json.dumps(body).encode(), content_type="application/json", headers={"x-dlq-reason": reason}),
+            routing_key=settings.queue_dlq,
+        )
+
+
+def test_stats_leaves_the_queue_intact():
+    async def scenario():
+        broker = InMemoryBroker()
+        connection = await broker.connect()
+        await fill(connection, 30)
+        groups = await dlq_tool.stats(connection, dlq_tool.parse_args(["stats"]))
+        return groups, broker.queues[settings.queue_dlq].depth
+
+    groups, depth = asyncio.run(scenario())
+    assert sum(groups.values()) == 30
+    assert groups[("Invalid format: boom", "v1/get_project")] == 5
+    assert depth == 30
+
+
+def test_replay_moves_only_the_matching_messages():
+    async def scenario():
+        broker = InMemoryBroker()
+        connection = await broker.connect()
+        await fill(connection, 30)
+        args = dlq_tool.parse_args(["replay", "--reason", "hiccup", "--action", "v1/create_project", "--rate", "0", "--batch-size", "4"])
+        replayed = await dlq_tool.replay(connection, args)
+        depths = broker.queues[settings.queue_dlq].depth, broker.queues[settings.queue_requests].depth
+        target = await (await connection.channel()).declare_queue(settings.queue_requests, durable=True)
+        return replayed, depths, await target.get(no_ack=True)
+
+    replayed, depths, first = asyncio.run(scenario())
+    assert replayed == 10
+    assert depths == (20, 10)
+    assert first.headers[dlq_tool.REPLAYED_HEADER] == 1
+    assert "x-dlq-reason" not in first.headers
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+
+from src.core.engine import WeightedSlots
+from src.core.storage import ReadWriteLock
+
+
+def test_readers_share_the_lock_and_writers_exclude_them():
+    lock = ReadWriteLock()
+    both_reading = threading.Barrier(2, timeout=2)
+    events = []
+
+    def reader(name):
+        with lock.reading():
+            both_reading.wait()  # only passes if the two readers hold the lock together
+            events.append(f"read {name}")
+            time.sleep(0.05)
+
+    def writer():
+        with lock.writing():
+            events.append("write")
+
+    readers = [threading.Thread(target=reader, args=(n,)) for n in "ab"]
+    for thread in readers:
+        thread.start()
+    time.sleep(0.01)
+    thread = threading.Thread(target=writer)
+    thread.start()
+    for t in [*readers, thread]:
+        t.join(2)
+    assert events[-1] == "write"
+    assert sorted(events[:2]) == ["read a", "read b"]
+
+
+def test_waiting_writer_keeps_new_readers_out():
+    lock = ReadWriteLock()
+    order = []
+
+    def take(mode, name):
+        with getattr(lock, mode)():
+            order.append(name)
+
+    writer = threading.Thread(target=take, args=("writing", "write"))
+    late_reader = threading.Thread(target=take, args=("reading", "read"))
+    with lock.reading():
+        writer.start()
+        time.sleep(0.02)
+        late_reader.start()
+        time.sleep(0.02)
+        assert order == []  # the writer waits for the first reader, the late reader for the writer
+    writer.join(2)
+    late_reader.join(2)
+    assert order == ["write", "read"]
+
+
+def test_weighted_slots_take_turns_by_weight():
+    async def scenario():
+        slots = WeightedSlots(1, {"interactive": 3})
+        await slots.acquire("bulk")  # the only slot is taken, everything below waits
+        served = []
+
+        async def request(lane):
+            await slots.acquire(lane)
+            served.append(lane)
+            slots.release()
+
+        waiters = [asyncio.create_task(request(lane)) for lane in ["bulk"] * 4 + ["interactive"] * 6]
+        await asyncio.sleep(0)
+        slots.release()
+        await asyncio.gather(*waiters)
+        return served
+
+    served = asyncio.run(scenario())
+    assert served[:4].count("interactive") == 3
+    assert sorted(served) == sorted(["bulk"] * 4 + ["interactive"] * 6)
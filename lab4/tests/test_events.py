@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from benchmarks.inmemory_amqp import InMemoryBroker
+from src.core.config import settings
+from src.core.events import ChangeEvents
+from src.core.storage import InMemoryDB
+
+
+def capture(changes):
+    # Runs changes(db) with events on, returns {entity: [event, ...]} as a consumer bound to "#" sees them
+    async def run():
+        connection = await InMemoryBroker().connect()
+        events = ChangeEvents()
+        events.exchange_name = "api.events"
+        db = InMemoryDB()
+        await events.start(connection, db, "api.requests")
+        channel = await connection.channel()
+        queue = await channel.declare_queue("consumer")
+        await queue.bind("api.events", routing_key="#")
+        changes(db)
+        await events.stop()
+        received = {}
+        while (message := await queue.get(fail=False)) is not None:
+            body = json.loads(message.body)
+            assert body["source"] == "api.requests" and body["epoch"] == events.epoch
+            received.setdefault(body["entity"], []).append(body["events"])
+        return received, events.stats()
+
+    return asyncio.run(run())
+
+
+def flat(received, entity):
+    return [event for batch in received.get(entity, []) for event in batch]
+
+
+def test_every_committed_row_change_is_an_event():
+    def changes(db):
+        project = db.create_project("P")
+        task = db.create_task(project.id, "T")
+        db.update_task(task.id, completed=True)
+        db.begin()
+        db.create_task(project.id, "rolled back")
+        db.rollback()
+
+    received, stats = capture(changes)
+    assert [(e["op"], e["id"], e["row_version"]) for e in flat(received, "task")] == [("create", 1, 1), ("update", 1, 2)]
+    assert flat(received, "task")[1]["fields"] == {"completed": True}
+    assert [e["version"] for e in flat(received, "task")] == [1, 2]
+    assert stats["produced"] == stats["published"] == 3
+
+
+def test_cascades_give_one_event_per_task():
+    def changes(db):
+        project = db.create_project("P")
+        user = db.create_user("U", "u@example.com")
+        for i in range(3):
+            db.create_task_v2(project.id, f"T{i}", user_id=user.id if i else None)
+        db.delete_user(user.id)
+        db.delete_project(project.id)
+
+    received, _ = capture(changes)
+    tasks = flat(received, "task")[3:]
+    assert [(e["op"], e["id"], e["fields"]) for e in tasks] == [
+        ("update", 2, {"user_id": None}), ("update", 3, {"user_id": None}),
+        ("delete", 1, {}), ("delete", 2, {}), ("delete", 3, {}),
+    ]
+    assert [e["row_version"] for e in tasks] == [2, 2, 2, 3, 3]
+    assert [e["op"] for e in flat(received, "user")] == ["create", "delete"]
+
+
+def test_events_are_split_into_batches(monkeypatch):
+    monkeypatch.setattr(settings, "events_batch_size", 2)
+
+    def changes(db):
+        project = db.create_project("P")
+        for i in range(5):
+            db.create_task(project.id, f"T{i}")
+
+    received, stats = capture(changes)
+    assert [len(batch) for batch in received["task"]] == [2, 2, 1]
+    assert stats["messages"] == 4
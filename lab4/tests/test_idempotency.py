@@ -0,0 +1,51 @@
+import pytest
+
+from src.core import idempotency
+from src.core.idempotency import IdempotencyStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(idempotency.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    store = IdempotencyStore(ttl_seconds=10, max_entries=10)
+    store.put("a", b"1", "application/json")
+    clock[0] += 9.9
+    assert store.get("a").body == b"1"
+    clock[0] += 0.1
+    assert store.get("a") is None
+    assert store.stats()["expirations"] == 1 and len(store) == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    store = IdempotencyStore(ttl_seconds=10, max_entries=2)
+    store.put("a", b"1", "application/json")
+    store.put("b", b"2", "application/json")
+    store.get("a")
+    store.put("c", b"3", "application/json")
+    assert "a" in store and "c" in store and "b" not in store
+    assert store.stats()["evictions"] == 1
+
+
+def test_size_cap_evicts_until_under_max_bytes(clock):
+    store = IdempotencyStore(ttl_seconds=10, max_entries=100, max_bytes=10)
+    for key in "abc":
+        store.put(key, b"xxxx", "application/json")
+    assert [entry[0] for entry in store.entries()] == ["b", "c"]
+    assert store.size_bytes == 8
+    store.put("b", b"x", "application/json")  # replacing an entry releases its old size
+    assert store.size_bytes == 5
+
+
+def test_expired_entries_are_swept_before_live_ones_are_evicted(clock):
+    store = IdempotencyStore(ttl_seconds=10, max_entries=2)
+    store.put("old", b"1", "application/json", ttl=1)
+    store.put("live", b"2", "application/json")
+    clock[0] += 2
+    store.put("new", b"3", "application/json")
+    assert sorted(key for key, *_ in store.entries()) == ["live", "new"]
+    assert store.stats()["evictions"] == 0
@@ -0,0 +1,47 @@
+import logging
+import queue
+import sys
+
+import pytest
+
+from src.core import logs
+from src.core.config import settings
+from src.core.logs import DroppingQueueHandler, Payload, log_payload
+
+
+def test_payload_is_truncated_only_when_formatted():
+    payload = Payload(b"x" * 20, limit=5)
+    assert payload.body == b"x" * 20
+    assert str(payload) == "xxxxx... (20 bytes)"
+    assert str(Payload("é".encode(), limit=5)) == "é"
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    for n in range(3):
+        handler.handle(logging.LogRecord("t", logging.INFO, "", 0, "n=%s", (n,), None))
+    assert handler.dropped == 2
+    record = handler.queue.get_nowait()
+    assert record.args == (0,)  # left to the listener to format
+
+
+def test_exception_text_is_rendered_before_queueing():
+    handler = DroppingQueueHandler(queue.Queue())
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        record = logging.LogRecord("t", logging.ERROR, "", 0, "failed", (), sys.exc_info())
+    handler.handle(record)
+    queued = handler.queue.get_nowait()
+    assert queued.exc_info is None and "RuntimeError: boom" in queued.exc_text
+
+
+@pytest.mark.parametrize("rate, draws, logged", [(0, [0.0], 0), (1, [0.99], 1), (0.5, [0.2, 0.7], 1)])
+def test_log_payload_samples_bodies(monkeypatch, caplog, rate, draws, logged):
+    monkeypatch.setattr(settings, "log_payload_sample_rate", rate)
+    monkeypatch.setattr(logs.random, "random", iter(draws).__next__)
+    logger = logging.getLogger("test.payload")
+    with caplog.at_level(logging.INFO, logger="test.payload"):
+        for _ in draws:
+            log_payload(logger, "Body", b"{}")
+    assert len(caplog.records) == logged
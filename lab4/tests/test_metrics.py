@@ -0,0 +1,77 @@
+import asyncio
+
+from src.core import metrics as metrics_module
+from src.core.metrics import Histogram, Metrics, metrics
+
+from tests.test_server import serve
+
+
+def test_histogram_quantile_is_the_bucket_upper_bound():
+    histogram = Histogram(buckets=(0.001, 0.01, 0.1))
+    for value in (0.0005, 0.0005, 0.005, 0.05, 5):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.quantile(0.4) == 0.001
+    assert histogram.quantile(0.6) == 0.01
+    assert histogram.quantile(1.0) == float("inf")
+
+
+def test_render_emits_cumulative_buckets_and_gauges():
+    registry = Metrics()
+    labels = ("v1", "get_task")
+    registry.count(labels, "ok")
+    registry.count(labels, "ok")
+    registry.observe(labels, "handler", 0.0002)
+    registry.observe(labels, "handler", 3)
+    stats = lambda: {"depth": 4, "name": "ignored", "enabled": True}
+    registry.register("engine", {"queue": 'rpc"q'}, stats)
+
+    text = registry.render()
+    assert 'rpc_requests_total{version="v1",action="get_task",outcome="ok"} 2' in text
+    assert 'rpc_phase_seconds_bucket{version="v1",action="get_task",phase="handler",le="0.00025"} 1' in text
+    assert 'rpc_phase_seconds_bucket{version="v1",action="get_task",phase="handler",le="+Inf"} 2' in text
+    assert 'rpc_phase_seconds_count{version="v1",action="get_task",phase="handler"} 2' in text
+    assert 'engine_depth{queue="rpc\\"q"} 4' in text
+    assert "engine_name" not in text and "engine_enabled" not in text
+
+    registry.unregister(stats)
+    assert "engine_depth" not in registry.render()
+
+
+def test_server_counts_outcomes_and_times_phases(empty_db):
+    metrics.reset()
+    project = empty_db.create_project("P")
+
+    async def scenario(client):
+        await client.call("get_project", {"id": project.id})
+        await client.call("get_project", {"id": 999})
+        return metrics.in_flight.get(("v1", "get_project"), 0)
+
+    assert serve(scenario) == 0
+    assert metrics.requests[("v1", "get_project", "ok")] == 1
+    assert metrics.requests[("v1", "get_project", "error")] == 1
+    assert metrics.phases[("v1", "get_project", "handler")].count == 2
+
+
+def test_metrics_endpoint_serves_the_text_format():
+    metrics.reset()
+    metrics.count(("v1", "ping"), "ok")
+
+    async def scenario():
+        server = await asyncio.start_server(metrics_module._handle_http, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            replies = []
+            for path in ("/metrics", "/other"):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(f"GET {path} HTTP/1.0\r\nHost: x\r\n\r\n".encode())
+                replies.append(await reader.read())
+                writer.close()
+            return replies
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    found, missing = asyncio.run(scenario())
+    assert found.startswith(b"HTTP/1.0 200 OK") and b'outcome="ok"} 1' in found
+    assert missing.startswith(b"HTTP/1.0 404")
@@ -0,0 +1,80 @@
+import asyncio
+
+import pytest
+from aio_pika import Message
+from aio_pika.exceptions import AMQPError
+
+from src.core.publisher import Publisher
+
+
+class FakeExchange:
+    def __init__(self, channel):
+        self.channel = channel
+
+    async def publish(self, message, routing_key):
+        if self.channel.failures:
+            self.channel.failures -= 1
+            raise AMQPError("nacked")
+        self.channel.sent.append(routing_key)
+
+
+class FakeChannel:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+        self.is_closed = False
+        self.default_exchange = FakeExchange(self)
+
+    async def close(self):
+        self.is_closed = True
+
+
+class FakeConnection:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.channels = []
+
+    async def channel(self, publisher_confirms=True):
+        channel = FakeChannel(self.failures)
+        self.channels.append(channel)
+        return channel
+
+
+def publish(publisher, routing_key, **kwargs):
+    return publisher.publish(Message(b"x"), routing_key, **kwargs)
+
+
+def test_pinned_routing_key_always_uses_one_channel():
+    async def scenario():
+        connection = FakeConnection()
+        publisher = Publisher()
+        await publisher.start(connection, pool_size=4)
+        for _ in range(10):
+            await publish(publisher, "shard.1", pin=True)
+        return [len(channel.sent) for channel in connection.channels]
+
+    assert sorted(asyncio.run(scenario())) == [0, 0, 0, 10]
+
+
+def test_a_failed_publish_is_retried_once_then_raised():
+    async def scenario(failures):
+        publisher = Publisher()
+        await publisher.start(FakeConnection(failures), pool_size=1)
+        await publish(publisher, "replies")
+
+    asyncio.run(scenario(failures=1))
+    with pytest.raises(AMQPError):
+        asyncio.run(scenario(failures=2))
+
+
+def test_closed_channel_is_reopened():
+    async def scenario():
+        connection = FakeConnection()
+        publisher = Publisher()
+        await publisher.start(connection, pool_size=1)
+        await connection.channels[0].close()
+        await publish(publisher, "replies")
+        return connection.channels
+
+    channels = asyncio.run(scenario())
+    assert len(channels) == 2 and channels[1].sent == ["replies"]
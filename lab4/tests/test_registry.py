@@ -0,0 +1,55 @@
+import pytest
+from pydantic import ValidationError
+
+from src.handlers.registry import get_action, parse_request
+
+
+def request(**overrides):
+    return {"id": "r1", "version": "v2", "action": "get_task", "data": {"id": "7"}, **overrides}
+
+
+def test_envelope_and_payload_are_validated_in_one_pass():
+    envelope, action, error = parse_request(request())
+    assert action is get_action("v2", "get_task")
+    assert error is None
+    assert envelope.data.id == 7  # typed and coerced
+
+
+def test_payload_error_keeps_the_envelope():
+    envelope, action, error = parse_request(request(data={"id": "x"}, auth="key"))
+    assert envelope.id == "r1" and envelope.auth == "key"
+    assert envelope.data == {"id": "x"}
+    assert action.name == "get_task"
+    # reported against the payload schema, not the generated request model
+    assert [e["loc"] for e in error.errors()] == [("id",)]
+
+
+def test_envelope_error_raises():
+    with pytest.raises(ValidationError):
+        parse_request(request(id=None))
+    with pytest.raises(ValidationError):
+        parse_request(["not", "a", "dict"])
+
+
+def test_unknown_action_comes_back_without_an_action():
+    envelope, action, error = parse_request(request(action="nope"))
+    assert action is None and error is None
+    assert envelope.action == "nope"
+
+
+def test_rows_are_dumped_through_the_output_schema(empty_db):
+    project = empty_db.create_project("P")
+    task = empty_db.create_task_v2(project.id, "T", priority=3)
+    get_task, list_tasks = get_action("v1", "get_task"), get_action("v2", "list_tasks")
+    assert get_task.execute(get_task.parse_payload({"id": task.id})) == {
+        "id": task.id, "title": "T", "completed": False, "project_id": project.id,
+    }
+    page = list_tasks.execute(list_tasks.parse_payload({"limit": 1}))
+    assert page["next_after_id"] is None and page["items"][0]["priority"] == 3
+
+
+def test_cache_key_ignores_key_order_and_coercion():
+    action = get_action("v2", "list_tasks")
+    first = action.cache_key(action.parse_payload({"project_id": 1, "limit": "5"}), "application/json")
+    second = action.cache_key(action.parse_payload({"limit": 5, "project_id": "1"}), "application/json")
+    assert first == second
@@ -0,0 +1,55 @@
+from src.core.result_cache import ResultCache, result_cache
+
+from tests.test_server import serve
+
+
+def test_entry_is_stale_once_the_versions_change():
+    cache = ResultCache(max_entries=10)
+    cache.put("k", (1, 2), b"data")
+    assert cache.get("k", (1, 2)) == b"data"
+    assert cache.get("k", (1, 3)) is None
+    assert len(cache) == 0
+    assert cache.stats()["stale"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_bounded_by_entries_and_bytes():
+    cache = ResultCache(max_entries=2, max_bytes=10)
+    cache.put("a", (), b"1234")
+    cache.put("b", (), b"1234")
+    cache.get("a", ())
+    cache.put("c", (), b"1234")
+    assert cache.get("b", ()) is None and cache.get("a", ()) == b"1234"
+    cache.put("d", (), b"123456789")
+    assert len(cache) == 1 and cache.size_bytes == 9
+    assert ResultCache(max_entries=0).enabled is False
+
+
+def test_reads_are_served_from_cache_until_a_write(empty_db):
+    result_cache.clear()
+    hits = result_cache.hits
+    project = empty_db.create_project("P")
+
+    async def scenario(client):
+        first = await client.call("list_projects")
+        second = await client.call("list_projects")
+        await client.call("create_task", {"project_id": project.id, "title": "T"})
+        # a task write leaves the projects result current
+        third = await client.call("list_projects")
+        await client.call("create_project", {"name": "Q"})
+        fourth = await client.call("list_projects")
+        return first, second, third, fourth
+
+    first, second, third, fourth = serve(scenario)
+    assert first.data == second.data == third.data
+    assert result_cache.hits - hits == 2
+    assert [p["name"] for p in fourth.data] == ["P", "Q"]
+
+
+def test_rollback_invalidates_cached_results(empty_db):
+    result_cache.clear()
+    empty_db.create_project("P")
+    versions = empty_db.versions_of(("projects", "tasks"))
+    empty_db.begin()
+    empty_db.create_project("rolled back")
+    empty_db.rollback()
+    assert empty_db.versions_of(("projects", "tasks")) != versions
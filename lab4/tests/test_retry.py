@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+from aio_pika import Message
+
+from benchmarks.inmemory_amqp import InMemoryBroker
+from src import server
+from src.client import RpcClient
+from src.core.config import settings
+from src.core.retry import DLQ_REASON_HEADER, RETRY_COUNT_HEADER, retries, retry_queue
+from src.server import start_server, stop_server
+
+
+def run_server(scenario):
+    async def run():
+        broker = InMemoryBroker()
+        connection = await broker.connect()
+        engine = await start_server(connection)
+        try:
+            return await scenario(broker, connection)
+        finally:
+            await stop_server(engine)
+
+    return asyncio.run(run())
+
+
+async def send(connection, request):
+    channel = await connection.channel()
+    await channel.default_exchange.publish(
+        Message(json.dumps(request).encode(), content_type="application/json", correlation_id=request["id"]),
+        routing_key=settings.queue_requests,
+    )
+
+
+def test_failures_back_off_through_delay_queues_then_dead_letter(monkeypatch):
+    monkeypatch.setattr(settings, "retry_delays_ms", [10, 30])
+    monkeypatch.setattr(settings, "retry_max_attempts", 3)
+    attempts = []
+
+    async def broken(message, *args):
+        attempts.append(message.headers.get(RETRY_COUNT_HEADER, 0))
+        raise RuntimeError("publish failed")
+
+    monkeypatch.setattr(server, "handle_request", broken)
+    before = retries.stats()
+
+    async def scenario(broker, connection):
+        assert {retry_queue(settings.queue_requests, 10), retry_queue(settings.queue_requests, 30)} <= set(broker.queues)
+        await send(connection, {"id": "r1", "version": "v1", "action": "list_projects"})
+        dlq = await (await connection.channel()).declare_queue(settings.queue_dlq, durable=True)
+        for _ in range(100):
+            message = await dlq.get(fail=False)
+            if message is not None:
+                return message
+            await asyncio.sleep(0.01)
+
+    dead = run_server(scenario)
+    assert attempts == [0, 1, 2, 3]  # the last tier repeats
+    assert dead.correlation_id == "r1"
+    assert dead.headers[DLQ_REASON_HEADER] == "publish failed (after 3 retries)"
+    after = retries.stats()
+    assert after["scheduled"] - before["scheduled"] == 3
+    assert after["exhausted"] - before["exhausted"] == 1
+
+
+def test_handler_errors_are_answered_not_retried():
+    before = retries.stats()
+
+    async def scenario(broker, connection):
+        async with RpcClient(connection, timeout=5) as client:
+            return await client.call("get_project", {"id": 999})
+
+    assert run_server(scenario).status == "error"
+    assert retries.stats() == before
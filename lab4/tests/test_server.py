@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from benchmarks.inmemory_amqp import InMemoryBroker
+from src.client import RpcClient
+from src.core.config import settings
+from src.core.metrics import metrics
+from src.schemas.protocol import DEADLINE_HEADER
+from src.server import lane_queues, start_server, stop_server
+
+
+def serve(scenario):
+    # Runs scenario(client) against the real server on the in-process broker
+    async def run():
+        connection = await InMemoryBroker().connect()
+        engine = await start_server(connection)
+        try:
+            async with RpcClient(connection, timeout=5) as client:
+                return await scenario(client)
+        finally:
+            await stop_server(engine)
+
+    return asyncio.run(run())
+
+
+def test_stream_delivers_every_row_in_chunks(empty_db, monkeypatch):
+    monkeypatch.setattr(settings, "stream_chunk_size", 7)
+    project = empty_db.create_project("P")
+    for i in range(50):
+        empty_db.create_task(project.id, f"T{i}")
+
+    async def scenario(client):
+        return [row["id"] async for row in client.stream("list_tasks", {"project_id": project.id})]
+
+    assert serve(scenario) == sorted(empty_db.tasks)
+
+
+def test_request_past_its_deadline_is_shed(empty_db):
+    metrics.reset()
+
+    async def scenario(client):
+        request = {"id": "late", "version": "v1", "action": "create_project", "data": {"name": "P"}, "auth": client.api_key}
+        message = client._message(request, timeout=5)
+        message.headers[DEADLINE_HEADER] = int(time.time() * 1000) - 1
+        await client.channel.default_exchange.publish(message, routing_key=settings.queue_requests)
+        # by the time a later request is answered, the late one has been taken off the queue
+        return await client.call("list_projects")
+
+    assert serve(scenario).data == []
+    assert metrics.requests[("v1", "create_project", "shed")] == 1
+
+
+def test_priority_lane_is_consumed_next_to_the_request_queue(empty_db, monkeypatch):
+    monkeypatch.setattr(settings, "request_lanes", {"interactive": 8})
+
+    async def scenario(client):
+        created = await client.call("create_project", {"name": "P"}, lane="interactive")
+        return created, await client.call("get_project", {"id": created.data["id"]})
+
+    created, fetched = serve(scenario)
+    assert created.status == fetched.status == "ok"
+    assert lane_queues(settings.queue_requests) == {settings.queue_requests: 1, f"{settings.queue_requests}.interactive": 8}
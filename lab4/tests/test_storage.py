@@ -0,0 +1,104 @@
+import pytest
+
+from src.core.storage import InMemoryDB
+from src.handlers.v2 import tasks as tasks_v2
+from src.schemas.task import TaskListQueryV2
+
+INDEXES = ("tasks_by_project", "tasks_by_user", "tasks_by_completed", "tasks_by_priority")
+
+
+def assert_indexes_consistent(db):
+    # the indexes kept up by the mutations equal the ones load_state() rebuilds from the rows
+    rebuilt = InMemoryDB()
+    rebuilt.load_state(db.dump_state())
+    for name in INDEXES:
+        assert getattr(db, name) == getattr(rebuilt, name), name
+
+
+def seed(db, count=100):
+    project = db.create_project("P")
+    user = db.create_user("U", "u@example.com")
+    for i in range(count):
+        db.create_task_v2(project.id, f"T{i}", completed=i % 2 == 0, priority=i % 10, user_id=user.id if i % 3 == 0 else None)
+    return project, user
+
+
+def list_all(**filters):
+    ids, after_id = [], 0
+    while True:
+        page = tasks_v2.list_tasks(TaskListQueryV2(after_id=after_id, limit=7, **filters))
+        ids += [task.id for task in page.rows]
+        if page.next_after_id is None:
+            return ids
+        after_id = page.next_after_id
+
+
+def test_keyset_pages_match_a_full_filter(empty_db):
+    seed(empty_db)
+    filters = {"completed": True, "priority_min": 4, "priority_max": 6}
+    expected = [
+        task.id for task in empty_db.tasks.values()
+        if task.completed and 4 <= task.priority <= 6
+    ]
+    assert list_all(**filters) == expected
+    assert list_all() == sorted(empty_db.tasks)
+
+
+def test_selective_filter_walks_only_its_index(empty_db):
+    seed(empty_db, 1000)
+    empty_db.update_task(500, priority=42)
+    # the priority bucket holds one task, so the page reads one row, not the table
+    assert [task.id for task in empty_db.iter_tasks(priority_min=40)] == [500]
+    assert [task.id for task in tasks_v2.list_tasks(TaskListQueryV2(priority_min=40)).rows] == [500]
+
+
+def test_indexes_follow_updates_and_deletes(empty_db):
+    project, user = seed(empty_db, 30)
+    empty_db.update_task(1, completed=True, priority=9)
+    empty_db.update_task(2, completed=False, priority=0)
+    empty_db.delete_task(3)
+    empty_db.delete_user(user.id)
+    assert_indexes_consistent(empty_db)
+    empty_db.delete_project(project.id)
+    assert_indexes_consistent(empty_db)
+    assert list_all(completed=True) == []
+
+
+def test_email_lookup_is_case_and_space_insensitive(empty_db):
+    user = empty_db.create_user("U", "Alice@Example.com")
+    assert empty_db.find_user_by_email("  alice@example.COM ") is user
+    with pytest.raises(ValueError):
+        empty_db.create_user("V", "alice@example.com")
+
+
+def test_email_index_follows_updates_deletes_and_rollback(empty_db):
+    user = empty_db.create_user("U", "a@example.com")
+    other = empty_db.create_user("V", "b@example.com")
+    with pytest.raises(ValueError):
+        empty_db.update_user(other.id, email="A@example.com")
+    empty_db.update_user(user.id, email="c@example.com")
+    assert empty_db.find_user_by_email("a@example.com") is None
+    assert empty_db.find_user_by_email("c@example.com") is user
+
+    empty_db.begin()
+    empty_db.delete_user(user.id)
+    empty_db.create_user("W", "c@example.com")
+    empty_db.rollback()
+    assert empty_db.find_user_by_email("c@example.com") is empty_db.users[user.id]
+
+    empty_db.delete_user(user.id)
+    assert empty_db.find_user_by_email("c@example.com") is None
+    empty_db.create_user("W", "c@example.com")
+
+
+def test_deletes_cascade_through_the_foreign_key_indexes(empty_db):
+    keep = empty_db.create_project("Keep")
+    project, user = seed(empty_db, 9)
+    kept = empty_db.create_task_v2(keep.id, "kept", user_id=user.id)
+
+    assert empty_db.delete_user(user.id) == [1, 4, 7, kept.id]
+    assert all(task.user_id is None for task in empty_db.tasks.values())
+    assert empty_db.delete_project(project.id) == list(range(1, 10))
+    assert list(empty_db.tasks) == [kept.id]
+    assert empty_db.tasks_by_project == {keep.id: [kept.id]}
+    assert_indexes_consistent(empty_db)
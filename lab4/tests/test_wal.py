@@ -0,0 +1,116 @@
+import asyncio
+import os
+
+import pytest
+
+from src.core import wal as wal_module
+from src.core.config import settings
+from src.core.storage import InMemoryDB
+from src.core.wal import WriteAheadLog
+
+
+def open_log(directory, mode="always"):
+    settings.wal_sync = mode
+    db = InMemoryDB()
+    log = WriteAheadLog()
+    log.open(str(directory), db)
+    return log, db
+
+
+@pytest.fixture(autouse=True)
+def restore_sync_mode():
+    mode = settings.wal_sync
+    yield
+    settings.wal_sync = mode
+
+
+def fail_fsync(monkeypatch):
+    def fsync(fd):
+        raise OSError(5, "Input/output error")
+    monkeypatch.setattr(wal_module.os, "fsync", fsync)
+
+
+def test_replay_restores_mutations_batches_and_idempotency(tmp_path):
+    log, db = open_log(tmp_path)
+    project = db.create_project("P")
+    db.begin()
+    db.create_task(project.id, "a")
+    db.create_task(project.id, "b")
+    db.commit()
+    db.begin()
+    db.create_task(project.id, "rolled back")
+    db.rollback()
+    db.idempotency.put("r1", b"{}", "application/json")
+    log.close()
+
+    recovered, restored = open_log(tmp_path)
+    assert restored.dump_state() == db.dump_state()
+    assert restored.idempotency.get("r1").body == b"{}"
+    assert recovered.replayed == 3
+    recovered.close()
+
+
+def test_torn_tail_is_cut_off(tmp_path):
+    log, db = open_log(tmp_path)
+    db.create_project("P")
+    segment = os.path.join(str(tmp_path), f"wal-{log.segment:010d}.log")
+    log.close()
+    size = os.path.getsize(segment)
+    with open(segment, "ab") as f:
+        f.write(b"\x10\x00\x00\x00garbage")
+
+    recovered, restored = open_log(tmp_path)
+    assert [p.name for p in restored.projects.values()] == ["P"]
+    assert os.path.getsize(segment) == size
+    recovered.close()
+
+
+def test_checkpoint_replaces_older_files(tmp_path):
+    log, db = open_log(tmp_path)
+    db.create_project("before")
+    log.checkpoint()
+    db.create_project("after")
+    log.close()
+    assert sorted(os.listdir(tmp_path)) == ["snapshot-0000000002.pkl", "wal-0000000002.log"]
+
+    recovered, restored = open_log(tmp_path)
+    assert [p.name for p in restored.projects.values()] == ["before", "after"]
+    assert recovered.replayed == 1
+    recovered.close()
+
+
+def test_failed_fsync_poisons_the_log(tmp_path, monkeypatch):
+    log, db = open_log(tmp_path)
+    db.create_project("durable")
+    fail_fsync(monkeypatch)
+    with pytest.raises(OSError):
+        db.create_project("maybe lost")
+    monkeypatch.undo()
+    # fsync works again, but nothing more is written until a restart
+    with pytest.raises(OSError):
+        db.create_project("never logged")
+    with pytest.raises(OSError):
+        asyncio.run(log.sync())
+    log.close()
+
+    recovered, restored = open_log(tmp_path)
+    assert "never logged" not in [p.name for p in restored.projects.values()]
+    recovered.close()
+
+
+def test_group_commit_waiters_get_the_write_error(tmp_path, monkeypatch):
+    log, db = open_log(tmp_path, mode="group")
+
+    async def scenario():
+        db.create_project("P")
+        await log.sync()
+        assert log.durable == log.appended
+        fail_fsync(monkeypatch)
+        db.create_project("Q")
+        with pytest.raises(OSError):
+            await log.sync()
+        with pytest.raises(OSError):
+            await log.sync()
+
+    asyncio.run(scenario())
+    log.close()